@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import CustomUser, Product, Order, GroupBuy, Review, ProductImage, Category
+from django.utils import timezone
+from .models import CustomUser, Product, Order, GroupBuy, Review, ProductImage, Category, Job
 
 
 class ProductImageInline(admin.TabularInline):
@@ -44,3 +45,13 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'created_at')
     list_filter = ('rating', 'created_at')
     search_fields = ('product__name', 'user__username')
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'name')
+    actions = ['retry']
+
+    @admin.action(description='Run the selected jobs again')
+    def retry(self, request, queryset):
+        queryset.exclude(status='running').update(status='queued', attempts=0, locked_until=None, run_at=timezone.now())
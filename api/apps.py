@@ -1,7 +1,24 @@
 # api/apps.py
 
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using, **kwargs):
+    # SQLite rebuilds a table for most ALTERs, which silently drops the
+    # triggers that keep the product search index in sync; put them back.
+    from django.db import connections
+    from .search import get_search_backend
+
+    with connections[using].schema_editor() as schema_editor:
+        get_search_backend(using).install(schema_editor)
+
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'api'
\ No newline at end of file
+    name = 'api'
+
+    def ready(self):
+        from . import signals, tasks  # noqa: F401
+
+        post_migrate.connect(ensure_search_index, sender=self)
@@ -0,0 +1,107 @@
+# api/cache.py
+
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from .facets import invalidate_facets
+from .models import Product
+
+RESPONSE_CACHE_TIMEOUT = 60 * 5
+
+
+def _tag_key(tag):
+    return f'response_cache:tag:{tag}'
+
+
+def tag_versions(tags):
+    """
+    Returns the current version token of every tag, creating missing ones.
+
+    Tags are plain cache keys holding a random token, so this works on any
+    Django cache backend (local memory, file based, memcached, Redis) without
+    needing sets or key scans.
+    """
+    keys = {_tag_key(tag): tag for tag in tags}
+    versions = cache.get_many(keys)
+    missing = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, None)
+        versions.update(cache.get_many(missing))
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_tags(*tags):
+    """Evicts every cached response carrying any of `tags` by giving the tags new versions."""
+    cache.set_many({_tag_key(tag): uuid.uuid4().hex for tag in tags if tag}, None)
+
+
+def product_cache_tags(product_id, seller_id=None, *categories):
+    tags = ['products', f'product:{product_id}']
+    if seller_id is not None:
+        tags.append(f'seller:{seller_id}')
+    tags.extend(f'category:{category}' for category in categories if category)
+    return tags
+
+
+def invalidate_products(product_ids):
+    """
+    Evicts cached responses and facets for products changed through
+    queryset.update(), which does not send model signals.
+    """
+    tags, categories = [], set()
+    for product_id, seller_id, category in Product.objects.filter(pk__in=product_ids).values_list(
+            'id', 'seller_id', 'category'):
+        tags.extend(product_cache_tags(product_id, seller_id, category))
+        categories.add(category)
+    invalidate_tags(*tags)
+    invalidate_facets(*categories)
+
+
+class TaggedResponseCacheMixin:
+    """
+    Caches anonymous GET responses of a viewset's list and retrieve actions.
+
+    Entries are keyed on the path and the sorted query parameters, and carry
+    the versions of the tags returned by `get_cache_tags()` at the time they
+    were built. A hit is only served while all of those tags are unchanged;
+    `invalidate_tags()` (called from model signals once the write commits)
+    makes them stale.
+    """
+    response_cache_timeout = RESPONSE_CACHE_TIMEOUT
+
+    def get_cache_tags(self):
+        raise NotImplementedError
+
+    def get_response_cache_key(self, request):
+        params = sorted(request.query_params.lists())
+        raw = f'{request.get_host()}|{request.path}|{params}'
+        return f'response_cache:{self.basename}:{hashlib.md5(raw.encode()).hexdigest()}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+
+        key = self.get_response_cache_key(request)
+        # Snapshot versions before building the response, so a write that lands
+        # while it is being built leaves the stored entry already stale.
+        versions = tag_versions(self.get_cache_tags())
+
+        entry = cache.get(key)
+        if entry is not None and entry['tags'] == versions:
+            return Response(entry['data'], status=entry['status'])
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, {'data': response.data, 'status': response.status_code, 'tags': versions},
+                      self.response_cache_timeout)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
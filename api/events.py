@@ -0,0 +1,266 @@
+# api/events.py
+
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Q
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Event
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = 100
+# Events a DatabaseBroker poller reads per query.
+EVENT_POLL_BATCH = 500
+
+
+class Broker:
+    """
+    Pub/sub interface used to push events to connected clients.
+
+    `publish()` may be called from any thread (request handlers, signals,
+    management commands). `subscribe()` is called from the event loop serving
+    a stream and returns a Subscription whose `get()` awaits the next event.
+
+    InProcessBroker only reaches clients connected to the same process.
+    DatabaseBroker (the default) also carries events published by other
+    processes, such as runworker and sweep_group_buys. A subclass backed by a
+    faster shared transport (e.g. Redis or PostgreSQL LISTEN/NOTIFY) can feed
+    each process's local subscriptions the same way, and should set
+    `cross_process`.
+    """
+    # Whether events published in one process reach streams served by another.
+    cross_process = False
+
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def publish_many(self, messages):
+        """Publishes (channel, event) pairs."""
+        for channel, event in messages:
+            self.publish(channel, event)
+
+    def subscribe(self, channels):
+        raise NotImplementedError
+
+    def unsubscribe(self, subscription):
+        raise NotImplementedError
+
+
+class Subscription:
+    def __init__(self, channels, loop, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.channels = tuple(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def deliver(self, event):
+        # Runs on the subscriber's loop; a client too slow to drain its queue
+        # loses events instead of growing memory without bound.
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            pass
+
+    async def get(self, timeout=None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class InProcessBroker(Broker):
+    """
+    Delivers events to subscriptions held in this process.
+
+    Each connection costs one small asyncio.Queue and no thread, so a single
+    process can hold thousands of idle streams.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has already shut down.
+                self.unsubscribe(subscription)
+
+    def subscribe(self, channels):
+        subscription = Subscription(channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._subscriptions.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[channel]
+
+
+class DatabaseBroker(InProcessBroker):
+    """
+    Carries events between processes through the api_event table.
+
+    publish() inserts the events (one bulk insert per batch), whichever
+    process it runs in. A process serving streams runs a single poller
+    thread, started with its first subscription, that reads the rows added
+    since its last poll every EVENT_POLL_INTERVAL seconds and hands them to
+    its local subscriptions; idle streams cost no queries. Rows committed out
+    of id order are still picked up if they commit within EVENT_POLL_GRACE
+    seconds of being written, and each row is delivered once. Rows older than
+    EVENT_RETENTION seconds are deleted as new ones are written.
+    """
+    cross_process = True
+
+    def __init__(self):
+        super().__init__()
+        self._poller = None
+        self._pruned_at = 0.0
+
+    def publish(self, channel, event):
+        self.publish_many([(channel, event)])
+
+    def publish_many(self, messages):
+        Event.objects.bulk_create(
+            [Event(channel=channel, payload=event) for channel, event in messages], batch_size=EVENT_POLL_BATCH
+        )
+        self._prune()
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='event-broker-poller', daemon=True)
+                self._poller.start()
+        return subscription
+
+    def _prune(self):
+        retention = getattr(settings, 'EVENT_RETENTION', 300)
+        if time.monotonic() - self._pruned_at < retention / 10:
+            return
+        self._pruned_at = time.monotonic()
+        Event.objects.filter(created_at__lt=timezone.now() - timedelta(seconds=retention)).delete()
+
+    def _poll(self):
+        interval = getattr(settings, 'EVENT_POLL_INTERVAL', 1.0)
+        grace = timedelta(seconds=getattr(settings, 'EVENT_POLL_GRACE', 5))
+        last_id = since = None
+        # Ids delivered that are still inside the grace window.
+        delivered = set()
+        while True:
+            close_old_connections()
+            events = []
+            try:
+                if last_id is None:
+                    # Only events published from now on are delivered.
+                    since = timezone.now()
+                    last_id = Event.objects.order_by('-id').values_list('id', flat=True).first() or 0
+                else:
+                    # Ids are allocated before commit, so a row can become visible after rows with
+                    # higher ids: re-check the last EVENT_POLL_GRACE seconds, not just `id > last_id`.
+                    recent = Q(created_at__gte=max(since, timezone.now() - grace))
+                    ids = set(Event.objects.filter(Q(id__gt=last_id) | recent).values_list('id', flat=True))
+                    delivered &= ids
+                    pending = sorted(ids - delivered)[:EVENT_POLL_BATCH]
+                    if pending:
+                        events = list(
+                            Event.objects.filter(id__in=pending).order_by('id')
+                            .values_list('id', 'channel', 'payload')
+                        )
+            except DatabaseError:
+                logger.exception('Could not read published events')
+            for event_id, channel, event in events:
+                InProcessBroker.publish(self, channel, event)
+                delivered.add(event_id)
+                last_id = max(last_id, event_id)
+            if len(events) < EVENT_POLL_BATCH:
+                time.sleep(interval)
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENT_BROKER', 'api.events.DatabaseBroker'))()
+    return _broker
+
+
+@receiver(setting_changed)
+def reset_broker(setting, **kwargs):
+    global _broker
+    if setting == 'EVENT_BROKER':
+        _broker = None
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def group_buy_channel(group_buy_id):
+    return f'group_buy:{group_buy_id}'
+
+
+def publish_on_commit(*messages):
+    """
+    Publishes (channel, event) pairs once the surrounding transaction commits,
+    so clients never see rows that were rolled back. A broker failure is
+    logged rather than raised, as the transaction has already committed.
+    """
+    if messages:
+        transaction.on_commit(lambda: get_broker().publish_many(messages), robust=True)
+
+
+def notification_event(notification):
+    return {
+        'event': 'notification',
+        'data': {
+            'id': notification.pk,
+            'type': notification.type,
+            'message': notification.message,
+            'related_object_id': notification.related_object_id,
+            'is_read': notification.is_read,
+            'created_at': notification.created_at.isoformat() if notification.created_at else None,
+        },
+    }
+
+
+def group_buy_event(group_buy_id, current_participants, status):
+    return {
+        'event': 'group_buy',
+        'data': {'id': group_buy_id, 'current_participants': current_participants, 'status': status},
+    }
+
+
+def publish_notifications(notifications):
+    publish_on_commit(*(
+        (user_channel(notification.user_id), notification_event(notification)) for notification in notifications
+    ))
+
+
+def publish_group_buy_progress(*group_buys):
+    """Publishes (group_buy_id, current_participants, status) updates."""
+    publish_on_commit(*(
+        (group_buy_channel(group_buy_id), group_buy_event(group_buy_id, current_participants, status))
+        for group_buy_id, current_participants, status in group_buys
+    ))
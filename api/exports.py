@@ -0,0 +1,183 @@
+# api/exports.py
+
+import csv
+import io
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+
+from .imports import LIST_SEPARATOR
+from .models import OrderItem, ProductInventory
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+
+
+def iter_chunks(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields lists of up to `chunk_size` objects in primary key order.
+
+    Each list is one keyset query (`pk > last seen`) plus its prefetches, so
+    memory is bounded by the chunk size and no cursor or transaction stays
+    open between chunks, whatever the size of the table.
+    """
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        page = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        page = list(page[:chunk_size])
+        if not page:
+            return
+        yield page
+        last_pk = page[-1].pk
+
+
+def _csv_value(value):
+    # Lists and mappings use the same "a|b" and "S=3|M=5" cells the importer reads.
+    if isinstance(value, dict):
+        return LIST_SEPARATOR.join(f'{key}={item}' for key, item in value.items())
+    if isinstance(value, list):
+        return LIST_SEPARATOR.join(str(item) for item in value)
+    return '' if value is None else value
+
+
+class BaseExporter:
+    """Turns model instances into export records: nested dicts for NDJSON, flat rows for CSV."""
+    csv_header = []
+
+    def prepare(self, queryset):
+        return queryset
+
+    def record(self, obj):
+        raise NotImplementedError
+
+    def csv_rows(self, record):
+        yield [_csv_value(record[column]) for column in self.csv_header]
+
+
+class ProductExporter(BaseExporter):
+    csv_header = ['id', 'barcode', 'name', 'description', 'price', 'category', 'subcategory', 'brand', 'quantity',
+                  'in_stock', 'rating', 'review_count', 'sizes', 'colors', 'seller', 'created_at', 'updated_at',
+                  'inventory', 'images']
+
+    def prepare(self, queryset):
+        return queryset.select_related(None).prefetch_related(
+            Prefetch('productinventory_set', queryset=ProductInventory.objects.select_related('size')),
+            'images',
+        )
+
+    def record(self, product):
+        return {
+            'id': product.pk,
+            'barcode': product.barcode,
+            'name': product.name,
+            'description': product.description,
+            'price': product.price,
+            'category': product.category,
+            'subcategory': product.subcategory,
+            'brand': product.brand,
+            'quantity': product.quantity,
+            'in_stock': product.in_stock,
+            'rating': product.rating,
+            'review_count': product.review_count,
+            'sizes': product.sizes,
+            'colors': product.colors,
+            'seller': product.seller_id,
+            'created_at': product.created_at.isoformat(),
+            'updated_at': product.updated_at.isoformat(),
+            'inventory': {item.size.name: item.quantity for item in product.productinventory_set.all()},
+            'images': [image.image.url for image in product.images.all()],
+        }
+
+
+class OrderExporter(BaseExporter):
+    """Orders with their lines; with `seller`, only that seller's lines are included."""
+    order_columns = ['id', 'user', 'status', 'total_price', 'tracking_number', 'created_at', 'updated_at']
+    item_columns = ['id', 'product', 'size', 'seller', 'quantity', 'price']
+    # CSV has one row per order line, repeating the order columns.
+    csv_header = order_columns + [f'item_{column}' for column in item_columns]
+
+    def __init__(self, seller=None):
+        self.seller = seller
+
+    def prepare(self, queryset):
+        items = OrderItem.objects.order_by('pk')
+        if self.seller is not None:
+            items = items.filter(seller=self.seller)
+        return queryset.select_related(None).prefetch_related(Prefetch('items', queryset=items))
+
+    def record(self, order):
+        return {
+            'id': order.pk,
+            'user': order.user_id,
+            'status': order.status,
+            'total_price': order.total_price,
+            'tracking_number': order.tracking_number,
+            'created_at': order.created_at.isoformat(),
+            'updated_at': order.updated_at.isoformat(),
+            'items': [
+                {'id': item.pk, 'product': item.product_id, 'size': item.size_id, 'seller': item.seller_id,
+                 'quantity': item.quantity, 'price': item.price}
+                for item in order.items.all()
+            ],
+        }
+
+    def csv_rows(self, record):
+        order = [_csv_value(record[column]) for column in self.order_columns]
+        for item in record['items'] or [dict.fromkeys(self.item_columns)]:
+            yield order + [_csv_value(item[column]) for column in self.item_columns]
+
+
+def check_format(file_format):
+    if file_format not in EXPORT_FORMATS:
+        raise ValueError("Invalid format. Use 'csv' or 'ndjson'.")
+
+
+def stream_export(exporter, queryset, file_format='csv', compress=False, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields the export as bytes, one encoded block per chunk of rows, gzipped
+    on the fly when `compress` is set.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31 writes a gzip container
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    if file_format == 'csv':
+        writer.writerow(exporter.csv_header)
+    for chunk in iter_chunks(exporter.prepare(queryset), chunk_size):
+        for obj in chunk:
+            record = exporter.record(obj)
+            if file_format == 'csv':
+                writer.writerows(exporter.csv_rows(record))
+            else:
+                buffer.write(json.dumps(record, cls=DjangoJSONEncoder))
+                buffer.write('\n')
+        data = flush()
+        if data:
+            yield data
+    data = flush()
+    if compressor:
+        data += compressor.flush()
+    if data:
+        yield data
+
+
+def export_response(exporter, queryset, basename, file_format='csv', compress=False):
+    """A StreamingHttpResponse download of stream_export()."""
+    check_format(file_format)
+    chunks = stream_export(exporter, queryset, file_format=file_format, compress=compress)
+    filename = f'{basename}.{file_format}' + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        chunks, content_type='application/gzip' if compress else EXPORT_FORMATS[file_format]
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
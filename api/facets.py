@@ -0,0 +1,106 @@
+# api/facets.py
+
+import hashlib
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+FACET_FIELDS = ['category', 'subcategory', 'brand', 'in_stock']
+FACET_CACHE_TIMEOUT = 60 * 60
+ALL_SEGMENTS = '*'
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('0-25', 0, 25),
+    ('25-50', 25, 50),
+    ('50-100', 50, 100),
+    ('100-250', 100, 250),
+    ('250+', 250, None),
+]
+
+
+def price_band_expression():
+    whens = []
+    for label, low, high in PRICE_BANDS:
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        whens.append(When(condition, then=Value(label)))
+    return Case(*whens, output_field=CharField())
+
+
+def compute_facets(queryset):
+    """
+    Counts products per category, subcategory, brand, in_stock and price band.
+
+    Runs a single GROUP BY over every facet column at once and folds the
+    combinations into per-facet counts, instead of one query per facet.
+    """
+    rows = (
+        queryset.order_by()
+        .annotate(price_band=price_band_expression())
+        .values(*FACET_FIELDS, 'price_band')
+        .annotate(count=Count('id'))
+    )
+
+    counts = {field: defaultdict(int) for field in FACET_FIELDS + ['price_band']}
+    for row in rows:
+        for field in counts:
+            counts[field][row[field]] += row['count']
+
+    facets = {
+        field: sorted(
+            ({'value': value, 'count': count} for value, count in values.items()),
+            key=lambda item: -item['count'],
+        )
+        for field, values in counts.items() if field != 'price_band'
+    }
+    facets['price_band'] = [
+        {'value': label, 'count': counts['price_band'][label]}
+        for label, _, _ in PRICE_BANDS if counts['price_band'][label]
+    ]
+    return facets
+
+
+def _version_key(segment):
+    return f'product_facets:version:{segment}'
+
+
+def _segment_version(segment):
+    version = cache.get(_version_key(segment))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.add(_version_key(segment), version, None)
+        version = cache.get(_version_key(segment), version)
+    return version
+
+
+def get_facets(queryset, category=None):
+    """
+    Cached compute_facets().
+
+    Entries are keyed on the filtered query and on a version token for their
+    catalog segment: the requested category, or the whole catalog when no
+    category filter is applied. Changing a product only bumps the tokens of
+    the segments it belongs to, so facets for other categories stay cached.
+    """
+    segment = category or ALL_SEGMENTS
+    try:
+        query_hash = hashlib.md5(str(queryset.order_by().query).encode()).hexdigest()
+    except EmptyResultSet:
+        return compute_facets(queryset.none())
+    key = f'product_facets:{segment}:{_segment_version(segment)}:{query_hash}'
+
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(queryset)
+        cache.set(key, facets, FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def invalidate_facets(*categories):
+    for segment in {ALL_SEGMENTS, *filter(None, categories)}:
+        cache.set(_version_key(segment), uuid.uuid4().hex, None)
@@ -0,0 +1,20 @@
+# api/filters.py
+
+from rest_framework import filters
+
+from .search import get_search_backend
+
+
+class FullTextSearchFilter(filters.SearchFilter):
+    """
+    Drop-in replacement for DRF's SearchFilter on products.
+
+    Matches `?search=` through the product full-text index instead of
+    `LIKE '%term%'` over every searched column.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        query = ' '.join(self.get_search_terms(request))
+        if not query:
+            return queryset
+        return get_search_backend(queryset.db).filter(queryset, query)
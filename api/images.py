@@ -0,0 +1,222 @@
+# api/images.py
+
+import io
+import os
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, connection, transaction
+from PIL import Image, ImageOps
+
+from .cache import invalidate_products
+from .jobs import enqueue
+from .models import ProductImage
+from .storage import CONTENT_ADDRESSED_NAME, SPOOL_DIRECTORY
+
+# Longest edge of each derivative; images are never upscaled.
+VARIANT_SIZES = {'medium': 800, 'thumbnail': 200}
+# (Pillow format, save options, file extension)
+VARIANT_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}, 'webp'),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}, 'jpg'),
+}
+PREFERRED_FORMAT = 'webp'
+VARIANT_DIRECTORY = 'product_images/variants'
+# Unreferenced files younger than this are kept: an upload of the same bytes
+# may have stored (or re-used) the file and not yet committed its ProductImage.
+GARBAGE_GRACE_SECONDS = 60 * 60
+
+
+def render_variants(source):
+    """
+    Returns {variant: {format: encoded bytes}} for an open image file.
+
+    JPEGs are decoded at a reduced scale (draft mode) when the largest variant
+    allows it, and each smaller variant is resized from the previous one, so
+    most of the work happens on small bitmaps. Pillow releases the GIL while
+    decoding, resizing and encoding, so renders on different threads run in
+    parallel.
+    """
+    largest = max(VARIANT_SIZES.values())
+    with Image.open(source) as original:
+        original.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+            # Flatten transparency onto white, as product photos are shown on white.
+            image = image.convert('RGBA')
+            flattened = Image.new('RGB', image.size, 'white')
+            flattened.paste(image, mask=image.getchannel('A'))
+            image = flattened
+        else:
+            image = image.convert('RGB')
+
+    variants = {}
+    for name, size in sorted(VARIANT_SIZES.items(), key=lambda item: -item[1]):
+        image.thumbnail((size, size), Image.Resampling.LANCZOS)
+        variants[name] = {}
+        for format_name, (pillow_format, options, _) in VARIANT_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pillow_format, **options)
+            variants[name][format_name] = buffer.getvalue()
+    return variants
+
+
+def variant_name(original_name, variant, format_name):
+    # Keyed on the original's (content-addressed) name, so every ProductImage
+    # sharing the same bytes also shares its derivatives.
+    stem = os.path.splitext(os.path.basename(original_name))[0]
+    return f'{VARIANT_DIRECTORY}/{stem}_{variant}.{VARIANT_FORMATS[format_name][2]}'
+
+
+def generate_variants(image_id, force=False):
+    """
+    Renders and stores the derivatives of one ProductImage and records their
+    storage names in `variants`. Derivatives already stored for the same
+    original are reused unless `force` is set. Returns False if the image is
+    gone or its original cannot be decoded.
+    """
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return False
+    names = {
+        variant: {format_name: variant_name(image.image.name, variant, format_name) for format_name in VARIANT_FORMATS}
+        for variant in VARIANT_SIZES
+    }
+
+    stored = names
+    if force or not all(default_storage.exists(name) for formats in names.values() for name in formats.values()):
+        try:
+            with image.image.open('rb') as source:
+                rendered = render_variants(source)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            return False
+        stored = {}
+        for variant, formats in rendered.items():
+            stored[variant] = {}
+            for format_name, data in formats.items():
+                name = names[variant][format_name]
+                default_storage.delete(name)
+                stored[variant][format_name] = default_storage.save(name, ContentFile(data))
+
+    # update() skips the model signals; the nested image URLs in product
+    # responses change, so evict those explicitly.
+    ProductImage.objects.filter(pk=image_id).update(variants=stored)
+    transaction.on_commit(lambda: invalidate_products([image.product_id]))
+    current = {name for formats in stored.values() for name in formats.values()}
+    delete_variants({variant: {key: name for key, name in formats.items() if name not in current}
+                     for variant, formats in image.variants.items()})
+    return True
+
+
+def delete_variants(variants):
+    for formats in (variants or {}).values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def _recently_saved(storage, name, grace_seconds):
+    try:
+        return time.time() - os.path.getmtime(storage.path(name)) < grace_seconds
+    except OSError:
+        return False
+
+
+def release_image(name, variants):
+    """
+    Drops a deleted ProductImage's reference to its file.
+
+    The file (and its derivatives) is deleted once no ProductImage refers to
+    it any more, which the indexed `image` column answers exactly. A file
+    saved again within the grace period may be about to gain a new reference
+    from an upload still in flight, so it is left to collect_image_garbage().
+    """
+    if not name or ProductImage.objects.filter(image=name).exists():
+        return False
+    storage = ProductImage._meta.get_field('image').storage
+    if _recently_saved(storage, name, GARBAGE_GRACE_SECONDS):
+        return False
+    storage.delete(name)
+    delete_variants(variants)
+    return True
+
+
+def collect_image_garbage(grace_seconds=GARBAGE_GRACE_SECONDS, dry_run=False, batch_size=500):
+    """
+    Deletes content-addressed originals no ProductImage refers to, the
+    derivatives of originals that are gone, and abandoned upload spools,
+    skipping anything modified within `grace_seconds`. Returns the storage
+    names deleted (or that would be, with `dry_run`).
+    """
+    storage = ProductImage._meta.get_field('image').storage
+    upload_to = ProductImage._meta.get_field('image').upload_to.strip('/')
+    root = storage.path(upload_to)
+    deleted = []
+
+    def remove(name):
+        deleted.append(name)
+        if not dry_run:
+            storage.delete(name)
+
+    def unreferenced(batch):
+        referenced = set(ProductImage.objects.filter(image__in=batch).values_list('image', flat=True))
+        for name in batch:
+            if name not in referenced:
+                remove(name)
+
+    batch = []
+    for directory, _, files in os.walk(root):
+        relative = os.path.relpath(directory, storage.location).replace(os.sep, '/')
+        if relative == VARIANT_DIRECTORY or relative.startswith(VARIANT_DIRECTORY + '/'):
+            continue
+        for filename in files:
+            name = f'{relative}/{filename}'
+            if _recently_saved(storage, name, grace_seconds):
+                continue
+            if os.path.basename(directory) == SPOOL_DIRECTORY:
+                remove(name)
+            elif CONTENT_ADDRESSED_NAME.match(filename):
+                batch.append(name)
+                if len(batch) >= batch_size:
+                    unreferenced(batch)
+                    batch = []
+    if batch:
+        unreferenced(batch)
+
+    # Derivatives of content-addressed originals are orphaned once no original
+    # with their digest is left on disk.
+    removed_digests = {os.path.splitext(os.path.basename(name))[0] for name in deleted}
+    variant_root = default_storage.path(VARIANT_DIRECTORY)
+    for directory, _, files in os.walk(variant_root):
+        for filename in files:
+            digest = filename.split('_', 1)[0]
+            if not CONTENT_ADDRESSED_NAME.match(digest):
+                continue
+            name = os.path.relpath(os.path.join(directory, filename), default_storage.location).replace(os.sep, '/')
+            if _recently_saved(default_storage, name, grace_seconds):
+                continue
+            original_directory = os.path.join(root, digest[:2], digest[2:4])
+            gone = digest in removed_digests or not any(
+                entry.startswith(digest) for entry in
+                (os.listdir(original_directory) if os.path.isdir(original_directory) else ())
+            )
+            if gone:
+                deleted.append(name)
+                if not dry_run:
+                    default_storage.delete(name)
+    return deleted
+
+
+def generate_variants_in_thread(image_id, force=False):
+    # Worker threads get their own database connection; close it after each
+    # image so idle workers do not hold connections open.
+    close_old_connections()
+    try:
+        return generate_variants(image_id, force=force)
+    finally:
+        connection.close()
+
+
+def schedule_variants(image_id):
+    """Queues derivative rendering as a background job (see api.tasks), committed with the image."""
+    enqueue('render_image_variants', image_id=image_id)
@@ -0,0 +1,394 @@
+# api/imports.py
+
+import codecs
+import csv
+import json
+import os
+import sqlite3
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.utils import timezone
+
+from .cache import invalidate_tags
+from .facets import invalidate_facets
+from .models import Product, ProductInventory, ProductSize
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl'}
+
+# Columns an import row may carry besides `inventory`. Rows are matched to
+# existing products on barcode; columns a row leaves out (or blank CSV cells)
+# keep their current value on update.
+PRODUCT_FIELDS = ['barcode', 'name', 'description', 'price', 'category', 'subcategory', 'brand', 'quantity',
+                  'sizes', 'colors']
+REQUIRED_FIELDS = ['name', 'description', 'price', 'category', 'brand']
+LIST_FIELDS = ['sizes', 'colors']
+# CSV cells hold lists as "S|M|L" and inventory as "S=3|M=5".
+LIST_SEPARATOR = '|'
+FIELDS = {name: Product._meta.get_field(name) for name in PRODUCT_FIELDS}
+# Every column the product upsert writes.
+WRITTEN_FIELDS = [field.name for field in Product._meta.concrete_fields if not field.primary_key]
+# Columns the upsert overwrites on an existing barcode; leaving the conflict
+# key itself out spares SQLite rewriting its unique index entry.
+UPDATED_FIELDS = [name for name in PRODUCT_FIELDS if name != 'barcode'] + ['in_stock', 'updated_at']
+# Columns read from a product a row updates.
+LOADED_FIELDS = ['id', 'seller_id', 'in_stock', *PRODUCT_FIELDS]
+# Larger counts are still accepted, through Field.clean.
+MAX_FAST_COUNT = 2 ** 31 - 1
+OTHER_SELLER = "This barcode belongs to another seller's product."
+
+
+def detect_format(filename):
+    return IMPORT_FORMATS.get(os.path.splitext(filename or '')[1].lower())
+
+
+def read_csv(stream):
+    """Yields (line number, row dict) from a binary CSV stream with a header row."""
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig'))
+    try:
+        for row in reader:
+            yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+    except (csv.Error, UnicodeDecodeError) as exc:
+        yield reader.line_num + 1, ValueError(f'Unreadable CSV, import stopped here: {exc}')
+
+
+def read_jsonl(stream):
+    """Yields (line number, row dict) from a binary stream holding one JSON object per line."""
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield line_number, ValueError(f'Invalid JSON: {exc}')
+            continue
+        yield line_number, row if isinstance(row, dict) else ValueError('Expected a JSON object')
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def _split(value):
+    if isinstance(value, str):
+        return [item for item in map(str.strip, value.split(LIST_SEPARATOR)) if item]
+    return value
+
+
+def _clean_inventory(value):
+    if isinstance(value, str):
+        pairs = (item.partition('=') for item in _split(value))
+        value = {size.strip(): quantity.strip() for size, _, quantity in pairs}
+    if not isinstance(value, dict):
+        raise ValidationError('Expected a mapping of size name to quantity.')
+    inventory = {}
+    for size, quantity in value.items():
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            raise ValidationError(f'Invalid quantity for size {size}.')
+        if quantity < 0:
+            raise ValidationError(f'Quantity for size {size} cannot be negative.')
+        inventory[str(size)] = quantity
+    return inventory
+
+
+def _coerce_text(field, raw):
+    if isinstance(raw, str) and (field.max_length is None or len(raw) <= field.max_length):
+        return raw
+    return None
+
+
+def _coerce_decimal(field, raw):
+    if not isinstance(raw, str):
+        return None
+    try:
+        value = Decimal(raw)
+    except ArithmeticError:
+        return None
+    if (value.is_finite() and value.as_tuple().exponent >= -field.decimal_places
+            and 0 <= value < 10 ** (field.max_digits - field.decimal_places)):
+        return value
+    return None
+
+
+def _coerce_count(field, raw):
+    if not isinstance(raw, (int, str)):
+        return None
+    try:
+        value = int(raw)
+    except ValueError:
+        return None
+    return value if 0 <= value <= MAX_FAST_COUNT else None
+
+
+def _coerce_list(field, raw):
+    return raw if isinstance(raw, list) else None
+
+
+COERCERS = {'CharField': _coerce_text, 'TextField': _coerce_text, 'DecimalField': _coerce_decimal,
+            'PositiveIntegerField': _coerce_count, 'JSONField': _coerce_list}
+CLEANERS = [(name, FIELDS[name], COERCERS[FIELDS[name].get_internal_type()], name in LIST_FIELDS)
+            for name in PRODUCT_FIELDS]
+
+
+def clean_row(row):
+    """
+    Returns (field values, inventory or None, errors) for one import row.
+
+    Well-formed cells take a cheap type check; anything else goes through the
+    model field's clean(), which accepts a superset and words the errors.
+    """
+    values, inventory, errors = {}, None, {}
+    for name, field, coerce, is_list in CLEANERS:
+        raw = row.get(name)
+        if raw is None or raw == '':
+            continue
+        if is_list:
+            raw = _split(raw)
+        elif isinstance(raw, float):
+            # JSON numbers: 9.99 rather than the binary float's 9.9900000000000002131...
+            raw = str(raw)
+        value = coerce(field, raw)
+        if value is None:
+            try:
+                value = field.clean(raw, None)
+            except ValidationError as exc:
+                errors[name] = exc.messages
+                continue
+        values[name] = value
+    if row.get('inventory') not in (None, ''):
+        try:
+            inventory = _clean_inventory(row['inventory'])
+        except ValidationError as exc:
+            errors['inventory'] = exc.messages
+    return values, inventory, errors
+
+
+def max_query_params():
+    """Bind parameters one statement may carry on the default database."""
+    if connection.vendor == 'sqlite':
+        # Django assumes the 999 of SQLite builds before 3.32; ask the library.
+        connection.ensure_connection()
+        if hasattr(connection.connection, 'getlimit'):
+            return connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+    # PostgreSQL's wire protocol numbers parameters with 16 bits.
+    return connection.features.max_query_params or 65535
+
+
+class Upsert:
+    """
+    INSERT ... VALUES (...), (...) ON CONFLICT (unique_fields) DO UPDATE SET
+    update_fields over many rows, in as few statements as the parameter limit
+    allows. The statement is built once per row count and reused, so a chunk
+    costs no ORM query compilation at all.
+
+    Multi-row statements rather than executemany(): the SQLite full-text
+    triggers flush the FTS5 index at the end of every statement, so one
+    statement per row costs several times more than the insert itself.
+    """
+
+    def __init__(self, model, fields, unique_fields, update_fields, where=''):
+        quote = connection.ops.quote_name
+        column = lambda name: quote(model._meta.get_field(name).column)
+        self.width = len(fields)
+        self.batch_size = max(1, max_query_params() // self.width)
+        self.template = (
+            f'INSERT INTO {quote(model._meta.db_table)} ({", ".join(column(name) for name in fields)}) VALUES '
+            '{values} '
+            f'ON CONFLICT ({", ".join(column(name) for name in unique_fields)}) DO UPDATE SET '
+            + ', '.join(f'{column(name)} = EXCLUDED.{column(name)}' for name in update_fields)
+            + (f' WHERE {where}' if where else '')
+        )
+        self._statements = {}
+
+    def sql(self, count):
+        if count not in self._statements:
+            row = f'({", ".join(["%s"] * self.width)})'
+            self._statements[count] = self.template.format(values=', '.join([row] * count))
+        return self._statements[count]
+
+    def execute(self, rows):
+        """Writes `rows`, sequences of values in field order."""
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                batch = rows[start:start + self.batch_size]
+                cursor.execute(self.sql(len(batch)), [value for row in batch for value in row])
+
+
+class CatalogImporter:
+    """
+    Upserts a seller's products from a stream of rows, keyed on barcode.
+
+    Rows are validated and written one chunk at a time, in one transaction
+    per chunk: one query loads the chunk's existing products, then one
+    prebuilt INSERT ... ON CONFLICT (barcode) DO UPDATE (see Upsert) writes
+    every row, and the inventory is written the same way. The update only
+    applies to the importing seller's own products, so a barcode another
+    seller takes meanwhile is reported instead of overwritten.
+    Memory stays bounded by the chunk size, and invalid rows are reported
+    with their line number without stopping the rest of the import. Raw
+    writes bypass model signals, so caches are invalidated per chunk; the
+    full-text index is kept in sync by its database triggers.
+    """
+
+    def __init__(self, seller, chunk_size=IMPORT_CHUNK_SIZE):
+        self.seller = seller
+        self.chunk_size = chunk_size
+        self.rows = self.created = self.updated = self.failed = 0
+        self.errors = []
+        self._size_ids = {}
+        for size_id, name in ProductSize.objects.order_by('-id').values_list('id', 'name'):
+            self._size_ids[name] = size_id
+        # New products start from the model defaults; columns an update row
+        # leaves out are filled from the product's current values.
+        self._defaults = {name: Product._meta.get_field(name).get_default() for name in WRITTEN_FIELDS}
+        for name in LIST_FIELDS:
+            self._defaults[name] = connection.ops.adapt_json_value(self._defaults[name], FIELDS[name].encoder)
+        quote = connection.ops.quote_name
+        self._products = Upsert(
+            Product, WRITTEN_FIELDS, ['barcode'], UPDATED_FIELDS,
+            where=f"{quote(Product._meta.db_table)}.{quote('seller_id')} = EXCLUDED.{quote('seller_id')}",
+        )
+        self._inventory = Upsert(ProductInventory, ['product', 'size', 'quantity'], ['product', 'size'], ['quantity'])
+
+    def run(self, rows):
+        """Imports (line number, row dict or exception) pairs and returns the summary."""
+        chunk = []
+        for line_number, row in rows:
+            chunk.append((line_number, row))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._import_chunk(chunk)
+        return self.summary()
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda error: error['line']),
+        }
+
+    def _fail(self, line_number, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'errors': errors})
+
+    def _import_chunk(self, chunk):
+        self.rows += len(chunk)
+        pending = {}
+        for line_number, row in chunk:
+            if isinstance(row, Exception):
+                self._fail(line_number, {'row': [str(row)]})
+                continue
+            values, inventory, errors = clean_row(row)
+            if not errors and not values.get('barcode'):
+                errors['barcode'] = ['This field is required.']
+            if errors:
+                self._fail(line_number, errors)
+                continue
+            previous = pending.get(values['barcode'])
+            if previous is not None:
+                self._fail(previous[0], {'barcode': ['Superseded by a later row with the same barcode.']})
+            pending[values['barcode']] = (line_number, values, inventory)
+        if not pending:
+            return
+
+        failures, written, refused = [], [], set()
+        size_ids = dict(self._size_ids)
+        try:
+            with transaction.atomic():
+                # Current values are read as stored and written back unchanged,
+                # skipping the JSON and decimal round trip of the ORM converters.
+                lookup = Product.objects.filter(barcode__in=list(pending)).values(*LOADED_FIELDS)
+                with connection.cursor() as cursor:
+                    cursor.execute(*lookup.query.sql_with_params())
+                    existing = {product['barcode']: product for product in
+                                (dict(zip(LOADED_FIELDS, values)) for values in cursor.fetchall())}
+                categories = {product['category'] for product in existing.values()}
+                ops = connection.ops
+                now = ops.adapt_datetimefield_value(timezone.now())
+                base = {**self._defaults, 'seller': self.seller.pk, 'created_at': now, 'updated_at': now}
+                rows = []
+                for barcode, (line_number, values, inventory) in pending.items():
+                    current = existing.get(barcode)
+                    if current is None:
+                        missing = [name for name in REQUIRED_FIELDS if name not in values]
+                        if missing:
+                            failures.append((line_number, {name: ['This field is required.'] for name in missing}))
+                            continue
+                        current = {'in_stock': None}
+                    elif current['seller_id'] != self.seller.pk:
+                        failures.append((line_number, {'barcode': [OTHER_SELLER]}))
+                        continue
+                    row = {**base, **current, **values}
+                    if row['in_stock'] is None or 'quantity' in values:
+                        row['in_stock'] = row['quantity'] > 0
+                    for name in LIST_FIELDS:
+                        if name in values:
+                            row[name] = ops.adapt_json_value(values[name], FIELDS[name].encoder)
+                    rows.append([row[name] for name in WRITTEN_FIELDS])
+                    written.append((line_number, barcode, inventory, 'id' not in current))
+                    categories.add(row['category'])
+
+                if written:
+                    self._products.execute(rows)
+                    # The upsert cannot return ids, and its WHERE skips new barcodes another seller got first.
+                    owners = {barcode: (product['id'], product['seller_id']) for barcode, product in existing.items()}
+                    owners.update(
+                        (barcode, (product_id, seller_id)) for barcode, product_id, seller_id in
+                        Product.objects.filter(barcode__in=[barcode for _, barcode, _, new in written if new])
+                        .values_list('barcode', 'id', 'seller_id')
+                    )
+                    refused = {line_number for line_number, barcode, _, _ in written
+                               if owners[barcode][1] != self.seller.pk}
+                    self._write_inventory([
+                        (owners[barcode][0], inventory) for line_number, barcode, inventory, _ in written
+                        if inventory and line_number not in refused
+                    ])
+
+                    # Tag the seller and categories once instead of every product;
+                    # only updated products can have their own cached responses.
+                    tags = ['products', f'seller:{self.seller.pk}',
+                            *(f'category:{category}' for category in categories),
+                            *(f"product:{product['id']}" for product in existing.values())]
+                    transaction.on_commit(lambda: (invalidate_tags(*tags), invalidate_facets(*categories)))
+        except DatabaseError as exc:
+            self._size_ids = size_ids
+            failed = {line_number for line_number, _ in failures}
+            failures += [(line_number, {'row': [f'Not saved: {exc}']})
+                         for line_number, _, _ in pending.values() if line_number not in failed]
+            written, refused = [], set()
+
+        for line_number, errors in failures:
+            self._fail(line_number, errors)
+        for line_number, _, _, new in written:
+            if line_number in refused:
+                self._fail(line_number, {'barcode': [OTHER_SELLER]})
+            elif new:
+                self.created += 1
+            else:
+                self.updated += 1
+
+    def _write_inventory(self, stocked):
+        """Upserts (product id, {size name: quantity}) pairs."""
+        if not stocked:
+            return
+        missing = {size for _, inventory in stocked for size in inventory if size not in self._size_ids}
+        if missing:
+            for size in ProductSize.objects.bulk_create([ProductSize(name=name) for name in sorted(missing)]):
+                self._size_ids[size.name] = size.pk
+        self._inventory.execute([
+            (product_id, self._size_ids[size], quantity)
+            for product_id, inventory in stocked for size, quantity in inventory.items()
+        ])
+
+
+def import_catalog(seller, rows, chunk_size=IMPORT_CHUNK_SIZE):
+    return CatalogImporter(seller, chunk_size=chunk_size).run(rows)
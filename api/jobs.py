@@ -0,0 +1,212 @@
+# api/jobs.py
+
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Due jobs looked at per claim attempt; several workers racing for the same
+# rows move on to the next candidate instead of polling again.
+CLAIM_CANDIDATES = 10
+
+# name -> (handler, atomic), filled by the @job decorator (see api.tasks).
+JOB_HANDLERS = {}
+
+
+class LeaseLost(Exception):
+    """The job was given up on and claimed by another worker while it ran."""
+
+
+def job(name=None, atomic=True):
+    """
+    Registers a function as the handler of jobs called `name` (default: the
+    function's name). With `atomic` it runs in a transaction that also
+    deletes the job, so a failed attempt leaves nothing behind and its
+    database changes commit exactly once. Handlers doing long non-database
+    work should opt out rather than hold the database's write lock meanwhile;
+    they may then run more than once.
+    """
+    def register(func):
+        JOB_HANDLERS[name or func.__name__] = (func, atomic)
+        return func
+    return register
+
+
+def enqueue(name, delay=0, max_attempts=None, **payload):
+    """
+    Queues the job `name`, to be run by `runworker` with `payload` as keyword
+    arguments (which must be JSON serializable). Events the job publishes
+    reach the web process's streams through a cross-process EVENT_BROKER
+    (api.events.DatabaseBroker).
+
+    The row is written on the caller's connection, so inside a transaction the
+    job only exists, and only becomes visible to workers, if that transaction
+    commits. Jobs run at least once: a handler may be retried after a failure
+    or a lost worker. Only the attempt that completes an atomic handler
+    commits, but non-atomic handlers must be safe to run again.
+    """
+    if name not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job: {name}")
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def retry_delay(attempts):
+    """Exponential backoff with jitter: about JOB_RETRY_BACKOFF * 2^(attempts - 1) seconds, capped."""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600))
+    return delay * random.uniform(0.5, 1)
+
+
+def claim(worker_id, visibility_timeout):
+    """
+    Takes the next due job for `worker_id`, or returns None.
+
+    Due jobs are queued ones whose run_at has passed and running ones whose
+    worker let locked_until pass. Each candidate is taken with a conditional
+    UPDATE, so of several workers racing for a job exactly one gets it,
+    without relying on row locks SQLite does not have.
+    """
+    now = timezone.now()
+    claimable = Q(status='queued', run_at__lte=now) | Q(status='running', locked_until__lte=now)
+    candidates = Job.objects.filter(claimable).order_by('run_at', 'id').values_list('id', flat=True)
+    for job_id in candidates[:CLAIM_CANDIDATES]:
+        claimed = Job.objects.filter(claimable, pk=job_id).update(
+            status='running',
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            attempts=F('attempts') + 1,
+        )
+        if not claimed:
+            continue
+        job = Job.objects.get(pk=job_id)
+        if job.attempts > job.max_attempts:
+            # Its last attempt never reported back.
+            Job.objects.filter(pk=job_id, locked_by=worker_id, attempts=job.attempts).update(
+                status='failed', locked_until=None,
+                last_error=job.last_error or 'Worker did not finish the job before its visibility timeout.',
+            )
+            continue
+        return job
+    return None
+
+
+def execute(job):
+    """
+    Runs a claimed job. A job that succeeds is deleted, in the handler's
+    transaction for atomic handlers; one that raises is queued again after
+    retry_delay(), or marked failed (and kept for inspection) once it has used
+    max_attempts. Returns whether it succeeded.
+
+    If another worker took the job over meanwhile, an atomic handler's work is
+    rolled back and left to that worker.
+    """
+    # Matches only while this worker still holds the job, i.e. it was not
+    # given up on and claimed by another worker in the meantime.
+    held = Job.objects.filter(pk=job.pk, status='running', locked_by=job.locked_by, attempts=job.attempts)
+    try:
+        if job.name not in JOB_HANDLERS:
+            raise LookupError(f"No handler registered for job {job.name!r}")
+        handler, atomic = JOB_HANDLERS[job.name]
+        if atomic:
+            with transaction.atomic():
+                handler(**job.payload)
+                deleted, _ = held.delete()
+                if not deleted:
+                    raise LeaseLost
+        else:
+            handler(**job.payload)
+            held.delete()
+    except LeaseLost:
+        logger.warning('Job %s (%s) was taken over by another worker; its attempt was rolled back', job.pk, job.name)
+        return False
+    except Exception:
+        logger.exception('Job %s (%s) failed on attempt %s of %s', job.pk, job.name, job.attempts, job.max_attempts)
+        error = traceback.format_exc()
+        if job.attempts >= job.max_attempts:
+            held.update(status='failed', locked_until=None, last_error=error)
+        else:
+            held.update(status='queued', locked_until=None, last_error=error,
+                        run_at=timezone.now() + timedelta(seconds=retry_delay(job.attempts)))
+        return False
+    return True
+
+
+class Worker:
+    """
+    Runs jobs on `concurrency` threads until stop() is called, or, with
+    `burst`, until no job is due.
+
+    Each thread polls for due jobs every `poll_interval` seconds while idle.
+    A claimed job is invisible to other workers for `visibility_timeout`
+    seconds; if it has not finished by then (its worker died, say) it is
+    claimed again, so the timeout must exceed the longest job.
+    """
+
+    def __init__(self, concurrency=2, visibility_timeout=300, poll_interval=1.0):
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.succeeded = self.failed = 0
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self._stopping.set()
+
+    def run(self, burst=False):
+        threads = [
+            threading.Thread(target=self._work, args=(burst,), name=f'job-worker-{number}', daemon=True)
+            for number in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Let the running jobs finish; unfinished ones are retried after their visibility timeout.
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+    def _work(self, burst):
+        worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.current_thread().name}'
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                try:
+                    job = claim(worker_id, self.visibility_timeout)
+                except DatabaseError:
+                    logger.exception('Could not claim a job')
+                    job = None
+                if job is None:
+                    if burst:
+                        return
+                    self._stopping.wait(self.poll_interval)
+                    continue
+                succeeded = execute(job)
+                with self._lock:
+                    if succeeded:
+                        self.succeeded += 1
+                    else:
+                        self.failed += 1
+        finally:
+            connection.close()
@@ -0,0 +1,74 @@
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from api.models import CustomUser, Order, OrderItem, Product
+from api.services import OrderService
+
+
+class Rollback(Exception):
+    pass
+
+
+def create_order_per_row(user, items_data):
+    """
+    The order creation path OrderService.create_order replaced: one lookup and
+    one insert per line, and no stock reservation or sales rollups at all.
+    """
+    order = Order.objects.create(user=user, total_price=0)
+    total_price = 0
+    for item_data in items_data:
+        product = Product.objects.get(id=item_data['product'])
+        total_price += item_data['quantity'] * product.price
+        OrderItem.objects.create(order=order, product=product, seller_id=product.seller_id,
+                                 quantity=item_data['quantity'], price=product.price)
+    order.total_price = total_price
+    order.save()
+    return order
+
+
+class Command(BaseCommand):
+    help = ('Times OrderService.create_order against the old per-row path at several line counts. '
+            'Everything it writes is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 30])
+        parser.add_argument('--repeat', type=int, default=50, help='Orders created per path and line count.')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1 or min(options['lines']) < 1:
+            raise CommandError('--lines and --repeat must be positive')
+        try:
+            with transaction.atomic():
+                self.run(options['lines'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, line_counts, repeat):
+        seller = CustomUser.objects.create_user(username='benchmark-seller', email='benchmark-seller@example.com')
+        buyer = CustomUser.objects.create_user(username='benchmark-buyer', email='benchmark-buyer@example.com')
+        products = Product.objects.bulk_create([
+            Product(seller=seller, name=f'Benchmark {number}', description='Benchmark', price=Decimal('9.99'),
+                    category='benchmark', brand='Benchmark', quantity=10 ** 6)
+            for number in range(max(line_counts))
+        ])
+        paths = {'per-row': create_order_per_row, 'create_order': OrderService.create_order}
+
+        self.stdout.write(f"{'lines':>5} {'path':>12} {'queries':>8} {'median ms':>10} {'p95 ms':>8}")
+        for line_count in line_counts:
+            items = [{'product': product.pk, 'quantity': 1} for product in products[:line_count]]
+            for name, create in paths.items():
+                timings = []
+                for _ in range(repeat):
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        create(buyer, items)
+                        timings.append((time.perf_counter() - started) * 1000)
+                p95 = sorted(timings)[int(len(timings) * 0.95) - 1 if len(timings) > 1 else 0]
+                self.stdout.write(f'{line_count:>5} {name:>12} {len(queries):>8} '
+                                  f'{statistics.median(timings):>10.2f} {p95:>8.2f}')
@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from api.imports import IMPORT_CHUNK_SIZE, READERS, import_catalog
+from api.models import CustomUser
+
+COLUMNS = ['barcode', 'name', 'description', 'price', 'category', 'subcategory', 'brand', 'quantity', 'sizes',
+           'colors', 'inventory']
+
+
+class Rollback(Exception):
+    pass
+
+
+def generate_rows(count, rng, price_offset=0):
+    for number in range(count):
+        yield {
+            'barcode': f'BENCH-{number:08}',
+            'name': f'Benchmark product {number}',
+            'description': f'Benchmark product {number}, imported from a generated catalog.',
+            'price': f'{rng.randint(100, 100000) / 100 + price_offset:.2f}',
+            'category': f'category-{number % 20}',
+            'subcategory': f'subcategory-{number % 100}',
+            'brand': f'Brand {number % 50}',
+            'quantity': rng.randint(0, 500),
+            'sizes': 'S|M|L',
+            'colors': 'red|blue',
+            'inventory': f'S={rng.randint(0, 50)}|M={rng.randint(0, 50)}',
+        }
+
+
+def encode(rows, file_format):
+    if file_format == 'jsonl':
+        return ''.join(json.dumps(row) + '\n' for row in rows).encode()
+    output = io.StringIO()
+    writer = csv.DictWriter(output, COLUMNS)
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue().encode()
+
+
+class Command(BaseCommand):
+    help = ('Times import_catalog creating N products from a generated CSV or JSONL file, then updating all of '
+            'them from a second file. Everything it writes is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--format', dest='file_format', choices=sorted(READERS), default='csv')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data.')
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--rows and --chunk-size must be positive')
+        try:
+            # As in production: the DEBUG query log would time formatting every statement.
+            with transaction.atomic(), override_settings(DEBUG=False):
+                self.run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        seller = CustomUser.objects.create_user(username='benchmark-importer', email='benchmark-importer@example.com')
+        read = READERS[options['file_format']]
+        passes = {
+            'create': encode(generate_rows(options['rows'], rng), options['file_format']),
+            'update': encode(generate_rows(options['rows'], rng, price_offset=1), options['file_format']),
+        }
+
+        self.stdout.write(f"{'pass':>8} {'rows':>8} {'created':>8} {'updated':>8} {'failed':>7} {'s':>7} "
+                          f"{'rows/s':>8}")
+        for name, data in passes.items():
+            started = time.perf_counter()
+            summary = import_catalog(seller, read(io.BytesIO(data)), chunk_size=options['chunk_size'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f"{name:>8} {summary['rows']:>8} {summary['created']:>8} {summary['updated']:>8} "
+                              f"{summary['failed']:>7} {elapsed:>7.2f} {summary['rows'] / elapsed:>8.0f}")
@@ -0,0 +1,69 @@
+import hashlib
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.views import static
+
+from api.media import serve_media
+
+
+def fetch(view, request, path):
+    """Calls the view and reads the whole body, as the server would. Returns (status, body bytes)."""
+    response = view(request, path)
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    response.close()
+    return response.status_code, len(body)
+
+
+class Command(BaseCommand):
+    help = ('Serves one generated image N times through serve_media and through django.views.static.serve, '
+            'in-process, for whole files, 64 KB ranges and revalidations.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per case and view.')
+        parser.add_argument('--size', type=int, default=300, help='File size in KB.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['size'] < 1:
+            raise CommandError('--requests and --size must be positive')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root, MEDIA_ACCEL=None):
+            data = os.urandom(options['size'] * 1024)
+            digest = hashlib.sha256(data).hexdigest()
+            path = f'product_images/{digest[:2]}/{digest[2:4]}/{digest}.jpg'
+            os.makedirs(os.path.dirname(os.path.join(media_root, path)))
+            with open(os.path.join(media_root, path), 'wb') as file:
+                file.write(data)
+            self.run(path, media_root, options['requests'])
+
+    def run(self, path, media_root, requests):
+        factory = RequestFactory()
+        url = f'/media/{path}'
+        views = {
+            'static.serve': lambda request, path: static.serve(request, path, document_root=media_root),
+            'serve_media': serve_media,
+        }
+
+        self.stdout.write(f"{'case':<12} {'view':<14} {'status':>6} {'KB sent':>8} {'req/s':>8}")
+        for view_name, view in views.items():
+            # Revalidate with whatever validators the view handed out.
+            full = view(factory.get(url), path)
+            validators = {'HTTP_IF_MODIFIED_SINCE': full['Last-Modified']}
+            if full.has_header('ETag'):
+                validators['HTTP_IF_NONE_MATCH'] = full['ETag']
+            full.close()
+            cases = {
+                'full': {},
+                'range 64 KB': {'HTTP_RANGE': 'bytes=0-65535'},
+                'revalidate': validators,
+            }
+            for case, headers in cases.items():
+                started = time.perf_counter()
+                for _ in range(requests):
+                    status, sent = fetch(view, factory.get(url, **headers), path)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'{case:<12} {view_name:<14} {status:>6} {sent / 1024:>8.1f} '
+                                  f'{requests / elapsed:>8.0f}')
@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.models import CustomUser
+from api.utils import create_notification, notify_users
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    """Counts queries through connection.execute_wrapper(), which, unlike the query log, has no size limit."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def notify_per_row(user_ids, notification_type, message):
+    for user_id in user_ids:
+        create_notification(user_id, notification_type, message)
+
+
+class Command(BaseCommand):
+    help = ('Times notify_users against one create_notification call per recipient for several audience '
+            'sizes. Everything it writes is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, nargs='+', default=[100, 1000, 10000])
+
+    def handle(self, *args, **options):
+        if min(options['recipients']) < 1:
+            raise CommandError('--recipients must be positive')
+        try:
+            with transaction.atomic():
+                self.run(options['recipients'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, audience_sizes):
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'benchmark-{number}', email=f'benchmark-{number}@example.com')
+            for number in range(max(audience_sizes))
+        ])
+        user_ids = [user.pk for user in users]
+        paths = {
+            'per-row': lambda ids: notify_per_row(ids, 'PRICE_DROP', 'Benchmark'),
+            'notify_users': lambda ids: notify_users(ids, 'PRICE_DROP', 'Benchmark'),
+        }
+
+        self.stdout.write(f"{'recipients':>10} {'path':>12} {'queries':>8} {'ms':>10}")
+        for audience_size in audience_sizes:
+            for name, notify in paths.items():
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    notify(user_ids[:audience_size])
+                    elapsed = (time.perf_counter() - started) * 1000
+                self.stdout.write(f'{audience_size:>10} {name:>12} {queries.count:>8} {elapsed:>10.1f}')
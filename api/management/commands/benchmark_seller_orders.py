@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, DecimalField, F, Q, Sum
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from api.models import CustomUser, Order, OrderItem, Product
+from api.services import OrderService
+
+PAGE_SIZE = 50
+SEED_BATCH_SIZE = 10000
+
+
+class Rollback(Exception):
+    pass
+
+
+def statistics_via_product(seller):
+    """The per-status aggregation of OrderService.get_order_statistics, joined through the product."""
+    money = DecimalField(max_digits=14, decimal_places=2)
+    aggregates = {}
+    for value, _ in Order.ORDER_STATUS:
+        in_status = Q(order__status=value)
+        aggregates[f'{value}_count'] = Count('order_id', distinct=True, filter=in_status)
+        aggregates[f'{value}_revenue'] = Sum(F('price') * F('quantity'), filter=in_status, output_field=money)
+    return OrderItem.objects.filter(product__seller=seller).aggregate(**aggregates)
+
+
+class Command(BaseCommand):
+    help = ('Seeds N order lines and times the seller order list, search and statistics on them, against the '
+            'same reads joined through the product. Everything it writes is rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=1000000, help='Order lines to seed.')
+        parser.add_argument('--lines-per-order', type=int, default=4)
+        parser.add_argument('--sellers', type=int, default=100)
+        parser.add_argument('--buyers', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per timed read; the median is reported.')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data.')
+
+    def handle(self, *args, **options):
+        for name in ('lines', 'lines_per_order', 'sellers', 'buyers', 'repeat'):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        try:
+            # Statistics would otherwise be served from the cache after the first run.
+            with transaction.atomic(), override_settings(ORDER_STATISTICS_CACHE_TIMEOUT=0):
+                seller = self.seed(options)
+                self.benchmark(seller, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        started = time.perf_counter()
+        sellers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench-seller-{number:05}', email=f'bench-seller-{number:05}@example.com')
+            for number in range(options['sellers'])
+        ], batch_size=SEED_BATCH_SIZE)
+        buyers = CustomUser.objects.bulk_create([
+            CustomUser(username=f'bench-buyer-{number:06}', email=f'bench-buyer-{number:06}@example.com')
+            for number in range(options['buyers'])
+        ], batch_size=SEED_BATCH_SIZE)
+        products = Product.objects.bulk_create([
+            Product(seller=seller, name=f'Benchmark {seller.pk}-{number}', description='Benchmark',
+                    price=Decimal(rng.randint(100, 10000)) / 100, category='benchmark', brand='Benchmark',
+                    quantity=100)
+            for seller in sellers for number in range(10)
+        ], batch_size=SEED_BATCH_SIZE)
+        statuses = [value for value, _ in Order.ORDER_STATUS]
+
+        lines_per_order = options['lines_per_order']
+        orders_per_batch = max(1, SEED_BATCH_SIZE // lines_per_order)
+        remaining = options['lines']
+        while remaining > 0:
+            order_lines = []
+            for _ in range(min(orders_per_batch, -(-remaining // lines_per_order))):
+                count = min(lines_per_order, remaining)
+                order_lines.append(rng.sample(products, count))
+                remaining -= count
+            orders = Order.objects.bulk_create([
+                Order(user=rng.choice(buyers), status=rng.choice(statuses),
+                      total_price=sum(product.price for product in lines))
+                for lines in order_lines
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, seller_id=product.seller_id, quantity=1, price=product.price)
+                for order, lines in zip(orders, order_lines) for product in lines
+            ])
+        self.stdout.write(f"Seeded {options['lines']} order lines in {time.perf_counter() - started:.1f}s")
+
+        # Benchmark the seller with the most lines.
+        seller_id = (
+            OrderItem.objects.values('seller_id').annotate(lines=Count('id')).order_by('-lines')
+            .values_list('seller_id', flat=True).first()
+        )
+        return CustomUser.objects.get(pk=seller_id)
+
+    def benchmark(self, seller, repeat):
+        query = 'bench-buyer-00'
+        via_product = Order.objects.filter(
+            id__in=OrderItem.objects.filter(product__seller=seller).values('order_id')
+        ).order_by('-created_at', '-id')
+        reads = {
+            'orders, first page': lambda: list(OrderService.get_seller_orders(seller)[:PAGE_SIZE]),
+            'orders, first page via product': lambda: list(via_product[:PAGE_SIZE]),
+            'order count': lambda: OrderService.get_seller_orders(seller).count(),
+            'order count via product': lambda: via_product.count(),
+            'search, first page': lambda: list(
+                OrderService.search_orders(seller, query).order_by('search_rank', '-id')[:PAGE_SIZE]
+            ),
+            'statistics': lambda: OrderService.get_order_statistics(seller, role='seller'),
+            'statistics via product': lambda: statistics_via_product(seller),
+        }
+
+        self.stdout.write(f'Seller {seller.username}: {OrderItem.objects.filter(seller=seller).count()} lines')
+        self.stdout.write(f"{'read':<32} {'queries':>8} {'median ms':>10} {'max ms':>8}")
+        for name, read in reads.items():
+            timings = []
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    read()
+                    timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'{name:<32} {len(queries):>8} {statistics.median(timings):>10.2f} {max(timings):>8.2f}')
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.images import GARBAGE_GRACE_SECONDS, collect_image_garbage
+
+
+class Command(BaseCommand):
+    help = 'Deletes stored product images and variants no longer referenced by any ProductImage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-minutes', type=int, default=GARBAGE_GRACE_SECONDS // 60,
+            help='Keep files modified more recently than this, as uploads in flight may still reference them.',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='List the files without deleting them.')
+
+    def handle(self, *args, **options):
+        if options['grace_minutes'] < 0:
+            raise CommandError('--grace-minutes cannot be negative')
+        deleted = collect_image_garbage(grace_seconds=options['grace_minutes'] * 60, dry_run=options['dry_run'])
+        for name in deleted:
+            self.stdout.write(name)
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(deleted)} files.'))
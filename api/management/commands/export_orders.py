@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, OrderExporter, stream_export
+from api.management.commands.export_products import write_chunks
+from api.models import CustomUser, Order
+from api.services import OrderService
+
+
+class Command(BaseCommand):
+    help = 'Streams orders with their line items as CSV (one row per line) or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--output', '-o', help='File to write to; standard output by default.')
+        parser.add_argument('--seller', help="Only export this username's order lines.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        orders, exporter = Order.objects.all(), OrderExporter()
+        if options['seller']:
+            try:
+                seller = CustomUser.objects.get(username=options['seller'])
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"Unknown seller {options['seller']}")
+            orders, exporter = OrderService.get_seller_orders(seller), OrderExporter(seller=seller)
+        chunks = stream_export(exporter, orders, file_format=options['file_format'],
+                               compress=options['gzip'], chunk_size=options['chunk_size'])
+        write_chunks(chunks, options['output'])
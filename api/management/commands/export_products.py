@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, ProductExporter, stream_export
+from api.models import CustomUser, Product
+
+
+class Command(BaseCommand):
+    help = 'Streams products with their inventory and images as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='file_format', choices=sorted(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output.')
+        parser.add_argument('--output', '-o', help='File to write to; standard output by default.')
+        parser.add_argument('--seller', help='Only export the products of this username.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        products = Product.objects.all()
+        if options['seller']:
+            try:
+                products = products.filter(seller=CustomUser.objects.get(username=options['seller']))
+            except CustomUser.DoesNotExist:
+                raise CommandError(f"Unknown seller {options['seller']}")
+        chunks = stream_export(ProductExporter(), products, file_format=options['file_format'],
+                               compress=options['gzip'], chunk_size=options['chunk_size'])
+        write_chunks(chunks, options['output'])
+
+
+def write_chunks(chunks, path=None):
+    stream = open(path, 'wb') if path else sys.stdout.buffer
+    try:
+        for chunk in chunks:
+            stream.write(chunk)
+    finally:
+        if path:
+            stream.close()
+        else:
+            stream.flush()
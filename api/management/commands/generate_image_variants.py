@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.images import generate_variants_in_thread
+from api.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Renders thumbnail and medium variants for product images that do not have them yet.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Re-render the variants of every image.')
+        parser.add_argument('--workers', type=int, default=getattr(settings, 'IMAGE_VARIANT_WORKERS', 2))
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+        images = ProductImage.objects.all() if options['all'] else ProductImage.objects.filter(variants={})
+        image_ids = list(images.order_by('pk').values_list('pk', flat=True))
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            rendered = sum(executor.map(partial(generate_variants_in_thread, force=options['all']), image_ids))
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} of {len(image_ids)} images in {elapsed:.2f}s '
+            f'({rendered / elapsed:.1f} images/s, {rendered / elapsed / options["workers"]:.1f} per worker).'
+        ))
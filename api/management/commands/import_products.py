@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORT_CHUNK_SIZE, READERS, detect_format, import_catalog
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Upserts a seller's products by barcode from a CSV or JSONL file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--seller', required=True, help='Username of the seller owning the products.')
+        parser.add_argument('--format', dest='file_format', choices=sorted(READERS),
+                            help='File format; detected from the extension by default.')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = CustomUser.objects.get(username=options['seller'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f"Unknown seller {options['seller']}")
+        file_format = options['file_format'] or detect_format(options['path'])
+        if file_format not in READERS:
+            raise CommandError('Cannot tell the file format from its extension; pass --format.')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        with open(options['path'], 'rb') as stream:
+            summary = import_catalog(seller, READERS[file_format](stream), chunk_size=options['chunk_size'])
+
+        for error in summary['errors']:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {summary['rows']} rows: {summary['created']} created, {summary['updated']} updated, "
+            f"{summary['failed']} failed."
+        ))
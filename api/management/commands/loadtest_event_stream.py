@@ -0,0 +1,121 @@
+import asyncio
+import resource
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.models import CustomUser
+from api.streams import StreamingASGIHandler
+from api.utils import notify_users
+
+
+def resident_memory():
+    """Current resident set size in bytes (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StreamClient:
+    """One SSE connection to the ASGI application, driven in-process without sockets."""
+
+    def __init__(self, application, token):
+        self.application = application
+        self.token = token
+        self.status = None
+        self.subscribed = asyncio.Event()
+        self.received = asyncio.Event()
+        self.disconnected = asyncio.Event()
+        self.request_sent = False
+
+    async def receive(self):
+        if not self.request_sent:
+            self.request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+            if self.status != 200:
+                self.subscribed.set()
+        elif message['type'] == 'http.response.body':
+            body = message.get('body', b'')
+            # The stream opens with a `retry:` line once it is subscribed.
+            if body.startswith(b'retry:'):
+                self.subscribed.set()
+            elif body.startswith(b'event: notification'):
+                self.received.set()
+
+    async def run(self):
+        path = reverse('notification-stream')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'root_path': '',
+            'query_string': f'token={self.token}'.encode(),
+            'headers': [(b'host', b'localhost'), (b'accept', b'text/event-stream')],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        await self.application(scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = ('Opens N idle Server-Sent Events streams against the ASGI application in this process, reports '
+            'the memory they hold and how long one notification takes to reach all of them.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=1000, help='Connections to open.')
+        parser.add_argument('--timeout', type=float, default=60, help='Seconds to wait for each phase.')
+
+    def handle(self, *args, **options):
+        if options['streams'] < 1:
+            raise CommandError('--streams must be positive')
+        user = CustomUser.objects.create_user(username='stream-load-test', email='stream-load-test@example.com')
+        try:
+            asyncio.run(self.run(user, options['streams'], options['timeout']))
+        finally:
+            user.delete()
+
+    async def run(self, user, count, timeout):
+        application = StreamingASGIHandler()
+        token = str(AccessToken.for_user(user))
+        baseline = resident_memory()
+
+        started = time.perf_counter()
+        clients = [StreamClient(application, token) for _ in range(count)]
+        tasks = [asyncio.create_task(client.run()) for client in clients]
+        await asyncio.wait_for(asyncio.gather(*(client.subscribed.wait() for client in clients)), timeout)
+        opened = time.perf_counter() - started
+        refused = sum(client.status != 200 for client in clients)
+        if refused:
+            raise CommandError(f'{refused} of {count} streams were refused')
+        held = resident_memory() - baseline
+
+        started = time.perf_counter()
+        await sync_to_async(notify_users)([user.pk], 'ORDER_STATUS', 'Stream load test')
+        await asyncio.wait_for(asyncio.gather(*(client.received.wait() for client in clients)), timeout)
+        delivered = time.perf_counter() - started
+
+        for client in clients:
+            client.disconnected.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self.stdout.write(f'Opened {count} streams in {opened:.2f}s')
+        self.stdout.write(f'Memory held: {held / 2 ** 20:.1f} MiB ({held / count / 1024:.1f} KiB per stream)')
+        self.stdout.write(self.style.SUCCESS(f'One notification reached all {count} streams in {delivered:.2f}s'))
@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily seller and product sales rollups from order history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days on or after this date (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a date in YYYY-MM-DD format')
+        written = SalesRollupService.rebuild(since=since)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} rollup rows.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.services import ReviewStatsService
+
+
+class Command(BaseCommand):
+    help = 'Recounts product ratings, review counts and rating histograms from the reviews, repairing drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=ReviewStatsService.RECOMPUTE_BATCH_SIZE,
+                            help='Products checked per batch.')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        checked, repaired = ReviewStatsService.recompute(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} products, repaired {repaired}.'))
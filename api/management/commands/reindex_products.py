@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index from the product table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        using = options['database']
+        backend = get_search_backend(using)
+        with connections[using].schema_editor() as schema_editor:
+            backend.install(schema_editor)
+        backend.rebuild(using)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt product search index ({type(backend).__name__}).'))
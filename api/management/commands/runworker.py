@@ -0,0 +1,41 @@
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.events import get_broker
+from api.jobs import Worker
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs (notifications, image variants) until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=getattr(settings, 'JOB_WORKER_CONCURRENCY', 2),
+                            help='Jobs run at the same time, one per thread.')
+        parser.add_argument('--visibility-timeout', type=int,
+                            default=getattr(settings, 'JOB_VISIBILITY_TIMEOUT', 300),
+                            help='Seconds before a job whose worker has not finished it is run again.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle thread waits before looking for due jobs again.')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive')
+        if options['visibility_timeout'] < 1:
+            raise CommandError('--visibility-timeout must be positive')
+        worker = Worker(
+            concurrency=options['concurrency'],
+            visibility_timeout=options['visibility_timeout'],
+            poll_interval=options['poll_interval'],
+        )
+        if not get_broker().cross_process:
+            self.stderr.write(self.style.WARNING(
+                'EVENT_BROKER only reaches streams served by this process: notifications sent by jobs '
+                'will not be pushed to clients. Use api.events.DatabaseBroker.'
+            ))
+        # Finish the running jobs on SIGTERM, as on Ctrl-C.
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        worker.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {worker.succeeded + worker.failed} jobs, {worker.failed} failed.'))
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.events import get_broker
+from api.services import GroupBuyService
+
+
+class Command(BaseCommand):
+    help = 'Completes or cancels active group buys whose end date has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping until interrupted.')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds between sweeps with --loop.')
+
+    def handle(self, *args, **options):
+        if not get_broker().cross_process:
+            self.stderr.write(self.style.WARNING(
+                'EVENT_BROKER only reaches streams served by this process: settled group buys '
+                'will not be pushed to clients. Use api.events.DatabaseBroker.'
+            ))
+        while True:
+            started = time.monotonic()
+            completed, cancelled = GroupBuyService.settle_expired(chunk_size=options['chunk_size'])
+            self.stdout.write(
+                f'Settled {completed + cancelled} group buys ({completed} completed, {cancelled} cancelled) '
+                f'in {time.monotonic() - started:.2f}s'
+            )
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,185 @@
+# api/media.py
+
+import mimetypes
+import os
+import posixpath
+import re
+from stat import S_ISREG
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .storage import CONTENT_ADDRESSED_NAME, SPOOL_DIRECTORY
+
+# Content-addressed files never change under their name.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+# What a 304 repeats from the full response.
+NOT_MODIFIED_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+
+def resolve_media(path):
+    """Returns the absolute path and os.stat() result of a file under MEDIA_ROOT, or raises Http404."""
+    if posixpath.basename(posixpath.dirname(path)) == SPOOL_DIRECTORY:
+        # Uploads still being stored.
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    if not S_ISREG(stat.st_mode):
+        raise Http404
+    return full_path, stat
+
+
+def media_etag(path, stat):
+    name = posixpath.basename(path)
+    if CONTENT_ADDRESSED_NAME.match(name):
+        return f'"{posixpath.splitext(name)[0]}"'
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def media_cache_control(path):
+    if CONTENT_ADDRESSED_NAME.match(posixpath.basename(path)):
+        return IMMUTABLE_CACHE_CONTROL
+    return f"public, max-age={getattr(settings, 'MEDIA_CACHE_MAX_AGE', 3600)}"
+
+
+def parse_range(header, size):
+    """
+    Returns the inclusive (first, last) byte positions of a single-range
+    `Range` header, None when the whole file should be sent (no header,
+    a multi-range or malformed one), or False when it cannot be satisfied.
+    """
+    match = RANGE_HEADER.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffix range: the last N bytes.
+        length = min(int(last), size)
+        return (size - length, size - 1) if length else False
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        return False if first >= size else None
+    return first, last
+
+
+def range_is_current(request, etag, last_modified):
+    """Whether an `If-Range` precondition (if any) still matches the file."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class FileRange:
+    """File-like view of bytes [first, last] of an open file, for FileResponse."""
+
+    def __init__(self, file, first, last):
+        file.seek(first)
+        self.file = file
+        self.remaining = last - first + 1
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def offload(response, path, full_path):
+    """
+    Hands the body to the front-end server when MEDIA_ACCEL is configured;
+    it then serves ranges and streams the file itself. Returns False when
+    Django has to send the file.
+    """
+    accel = getattr(settings, 'MEDIA_ACCEL', None)
+    if accel == 'x-sendfile':
+        response['X-Sendfile'] = full_path
+    elif accel == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_LOCATION.rstrip('/') + '/' + quote(path)
+    else:
+        return False
+    return True
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serves a file from MEDIA_ROOT with validators and byte-range support.
+
+    Responses carry a strong ETag (the digest, for content-addressed files)
+    and Last-Modified, so revalidations get a 304; content-addressed URLs
+    are marked immutable and are not revalidated at all. A single `Range`
+    is answered with 206, honouring `If-Range`. With MEDIA_ACCEL set the
+    body is left to nginx (X-Accel-Redirect) or Apache (X-Sendfile);
+    otherwise FileResponse streams it, through the server's wsgi.file_wrapper
+    (sendfile) for whole files.
+    """
+    full_path, stat = resolve_media(path)
+    etag, last_modified = media_etag(path, stat), int(stat.st_mtime)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Cache-Control': media_cache_control(path),
+        'Accept-Ranges': 'bytes',
+    }
+
+    # Checked before any response is built, as revalidations are most of the traffic.
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        if conditional.status_code == 304:
+            for header in NOT_MODIFIED_HEADERS:
+                conditional[header] = headers[header]
+        return conditional
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    response = HttpResponse(content_type=content_type, headers=headers)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if offload(response, path, full_path):
+        return response
+
+    size = stat.st_size
+    byte_range = None
+    if range_is_current(request, etag, last_modified):
+        byte_range = parse_range(request.headers.get('Range'), size)
+    if byte_range is False:
+        response.status_code = 416
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if request.method == 'HEAD':
+        response['Content-Length'] = size
+        return response
+
+    file = open(full_path, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type, headers=headers)
+    else:
+        first, last = byte_range
+        response = FileResponse(FileRange(file, first, last), status=206, content_type=content_type, headers=headers)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = last - first + 1
+    response.block_size = BLOCK_SIZE
+    if encoding:
+        response['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from api.search import get_search_backend
+
+
+def install_search_index(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection.alias)
+    backend.install(schema_editor)
+    backend.rebuild(schema_editor.connection.alias)
+
+
+def uninstall_search_index(apps, schema_editor):
+    get_search_backend(schema_editor.connection.alias).uninstall(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_orderitem_size'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='groupbuy',
+            index=models.Index(fields=['status', 'end_date'], name='api_groupbu_status_0ec8b4_idx'),
+        ),
+    ]
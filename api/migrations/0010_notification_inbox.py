@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_unread_counters(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    NotificationCounter = apps.get_model('api', 'NotificationCounter')
+    NotificationCounter.objects.bulk_create(
+        [
+            NotificationCounter(user_id=row['user'], unread=row['unread'])
+            for row in Notification.objects.filter(is_read=False).order_by().values('user').annotate(unread=Count('id'))
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_groupbuy_status_end_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationCounter',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_counter', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('unread', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', '-created_at', '-id'], name='api_notific_user_id_88fde6_idx'),
+        ),
+        migrations.RunPython(backfill_unread_counters, migrations.RunPython.noop),
+    ]
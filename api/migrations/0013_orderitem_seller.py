@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def backfill_order_item_sellers(apps, schema_editor):
+    # One UPDATE per id range keeps each statement and its locks short on large tables.
+    OrderItem = apps.get_model('api', 'OrderItem')
+    Product = apps.get_model('api', 'Product')
+    seller = Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('seller_id')[:1])
+    last_id = OrderItem.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    for start in range(0, last_id, BACKFILL_BATCH_SIZE):
+        OrderItem.objects.filter(id__gt=start, id__lte=start + BACKFILL_BATCH_SIZE).update(seller_id=seller)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_order_status_statistics_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orderitem',
+            name='seller',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sold_order_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_order_item_sellers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='seller',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='sold_order_items', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['seller', 'order'], name='api_orderit_seller__702b6d_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_orderitem_seller'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='tracking_number',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:50
+
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_rating_statistics(apps, schema_editor):
+    Product = apps.get_model('api', 'Product')
+    Review = apps.get_model('api', 'Review')
+    histograms = defaultdict(dict)
+    for row in Review.objects.order_by().values('product_id', 'rating').annotate(reviews=Count('id')):
+        histograms[row['product_id']][row['rating']] = row['reviews']
+
+    products = []
+    for product in Product.objects.filter(pk__in=list(histograms)).only('id'):
+        histogram = histograms[product.pk]
+        for rating in range(1, 6):
+            setattr(product, f'rating_{rating}_count', histogram.get(rating, 0))
+        product.review_count = sum(histogram.values())
+        stars = sum(rating * count for rating, count in histogram.items())
+        product.rating = (Decimal(stars) / product.review_count).quantize(Decimal('0.01'), ROUND_HALF_UP)
+        products.append(product)
+    Product.objects.bulk_update(
+        products, [f'rating_{rating}_count' for rating in range(1, 6)] + ['review_count', 'rating'], batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_order_tracking_number_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='1-Star Reviews'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='2-Star Reviews'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='3-Star Reviews'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='4-Star Reviews'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='5-Star Reviews'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='rating',
+            field=models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)]),
+        ),
+        migrations.RunPython(backfill_rating_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:06
+
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_productimage_variants'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(db_index=True, storage=api.storage.get_product_image_storage, upload_to='product_images/', verbose_name='Image'),
+        ),
+    ]
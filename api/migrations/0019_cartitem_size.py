@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='size',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='api.productsize'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('cart', 'product', 'size'), name='unique_cart_product_size'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('size__isnull', True)), fields=('cart', 'product'), name='unique_cart_product_without_size'),
+        ),
+    ]
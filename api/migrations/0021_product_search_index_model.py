@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+import api.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='api.product')),
+                ('document', api.search.FullTextField(db_column='api_product_fts')),
+            ],
+            options={
+                'db_table': 'api_product_fts',
+                'managed': False,
+            },
+        ),
+    ]
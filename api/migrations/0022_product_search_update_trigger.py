@@ -0,0 +1,21 @@
+from django.db import migrations
+
+from api.search import SQLiteSearchBackend, get_search_backend
+
+
+def reinstall_update_trigger(apps, schema_editor):
+    backend = get_search_backend(schema_editor.connection.alias)
+    if isinstance(backend, SQLiteSearchBackend):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {backend.table}_au')
+        backend.install(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_product_search_index_model'),
+    ]
+
+    operations = [
+        migrations.RunPython(reinstall_update_trigger, migrations.RunPython.noop),
+    ]
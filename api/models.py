@@ -1,8 +1,14 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
+
+from .search import FullTextField
+from .storage import get_product_image_storage
+
+
 class CustomUser(AbstractUser):
     USER_ROLES = (
         ('buyer', 'Buyer'),
@@ -76,6 +82,12 @@ class Product(models.Model):
         validators=[MinValueValidator(0), MaxValueValidator(5)]
     )
     review_count = models.PositiveIntegerField(_('Review Count'), default=0)
+    # Rating histogram, kept in step with rating and review_count by ReviewStatsService.
+    rating_1_count = models.PositiveIntegerField(_('1-Star Reviews'), default=0)
+    rating_2_count = models.PositiveIntegerField(_('2-Star Reviews'), default=0)
+    rating_3_count = models.PositiveIntegerField(_('3-Star Reviews'), default=0)
+    rating_4_count = models.PositiveIntegerField(_('4-Star Reviews'), default=0)
+    rating_5_count = models.PositiveIntegerField(_('5-Star Reviews'), default=0)
     sizes = models.JSONField(_('Sizes'), default=list, blank=True)
     colors = models.JSONField(_('Colors'), default=list, blank=True)
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
@@ -87,6 +99,7 @@ class Product(models.Model):
             models.Index(fields=['name']),
             models.Index(fields=['category']),
             models.Index(fields=['brand']),
+            models.Index(fields=['-created_at', '-id']),
         ]
         verbose_name = _('Product')
         verbose_name_plural = _('Products')
@@ -94,6 +107,21 @@ class Product(models.Model):
     def __str__(self):
         return f'{self.name} by {self.seller.username}'
 
+class ProductSearchIndex(models.Model):
+    """
+    The SQLite FTS5 index over products (see api.search.SQLiteSearchBackend),
+    mapped so ranked searches can join it. Its schema is managed by the
+    search backend, not by migrations.
+    """
+    product = models.OneToOneField(Product, primary_key=True, db_column='rowid', on_delete=models.DO_NOTHING,
+                                   db_constraint=False, related_name='search_index')
+    document = FullTextField(db_column='api_product_fts')
+
+    class Meta:
+        managed = False
+        db_table = 'api_product_fts'
+
+
 class ProductImage(models.Model):
     product = models.ForeignKey(
         Product,
@@ -101,8 +129,14 @@ class ProductImage(models.Model):
         related_name='images',
         verbose_name=_('Product')
     )
-    image = models.ImageField(_('Image'), upload_to='product_images/')
+    # Content-addressed and shared between identical uploads; indexed so
+    # api.images.release_image() can tell whether a file is still referenced.
+    image = models.ImageField(
+        _('Image'), upload_to='product_images/', storage=get_product_image_storage, db_index=True
+    )
     is_primary = models.BooleanField(_('Is Primary'), default=False)
+    # Storage names of the derivatives, {variant: {format: name}}; empty until api.images renders them.
+    variants = models.JSONField(_('Variants'), default=dict, blank=True, editable=False)
     created_at = models.DateTimeField(_('Created At'), auto_now_add=True)
 
     class Meta:
@@ -136,7 +170,14 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=ORDER_STATUS, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    tracking_number = models.CharField(max_length=100, blank=True, null=True)
+    tracking_number = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['user', 'status', 'created_at']),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
@@ -144,9 +185,17 @@ class Order(models.Model):
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    # Copy of product.seller, so seller views filter order lines without joining products.
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='sold_order_items', db_index=False)
+    size = models.ForeignKey(ProductSize, on_delete=models.PROTECT, blank=True, null=True)
     quantity = models.PositiveIntegerField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['seller', 'order']),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.id} in Order {self.order.id}"
 class Payment(models.Model):
@@ -171,6 +220,11 @@ class GroupBuy(models.Model):
     end_date = models.DateTimeField()
     status = models.CharField(max_length=20, choices=GROUP_BUY_STATUS, default='active')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'end_date']),
+        ]
+
     def __str__(self):
         return f"Group Buy for {self.product.id}"
 
@@ -197,8 +251,18 @@ class Cart(models.Model):
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    size = models.ForeignKey(ProductSize, on_delete=models.CASCADE, null=True, blank=True)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        # One line per product and size; NULL sizes are distinct in a plain
+        # unique index, hence the second, partial constraint.
+        constraints = [
+            models.UniqueConstraint(fields=['cart', 'product', 'size'], name='unique_cart_product_size'),
+            models.UniqueConstraint(fields=['cart', 'product'], condition=models.Q(size__isnull=True),
+                                    name='unique_cart_product_without_size'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.id} in {self.cart}"
 
@@ -214,10 +278,16 @@ class Wishlist(models.Model):
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reviews')
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
-    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MinValueValidator(5)])
+    rating = models.PositiveIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', '-created_at', '-id']),
+            models.Index(fields=['-created_at', '-id']),
+        ]
+
     def __str__(self):
         return f"Review by {self.user.username} for {self.product.id}"
 class Notification(models.Model):
@@ -234,5 +304,93 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    class Mets:
-        ordering = '-created_at'
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id']),
+            models.Index(fields=['user', 'is_read', '-created_at', '-id']),
+        ]
+
+
+class NotificationCounter(models.Model):
+    """Per-user unread notification count, maintained on write so badge polls never count rows."""
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread} unread for {self.user_id}"
+
+
+class SellerDailySales(models.Model):
+    """Per-seller daily sales totals, kept up to date as orders are placed and cancelled."""
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('seller', 'date')
+
+    def __str__(self):
+        return f"Sales of {self.seller_id} on {self.date}"
+
+
+class ProductDailySales(models.Model):
+    """Per-product daily sales totals, kept up to date as orders are placed and cancelled."""
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='product_daily_sales')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    date = models.DateField()
+    orders = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('product', 'date')
+        indexes = [
+            models.Index(fields=['seller', 'date']),
+        ]
+
+    def __str__(self):
+        return f"Sales of product {self.product_id} on {self.date}"
+
+
+class Job(models.Model):
+    """A unit of background work for the `runworker` command; see api.jobs."""
+    JOB_STATUS = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    )
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=JOB_STATUS, default='queued')
+    # Queued jobs become due at run_at. A running job whose worker has not
+    # finished it by locked_until is considered lost and may be claimed again.
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_at']),
+            models.Index(fields=['status', 'locked_until']),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class Event(models.Model):
+    """An event published through api.events.DatabaseBroker, kept for EVENT_RETENTION seconds."""
+    channel = models.CharField(max_length=100)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.channel} #{self.pk}"
@@ -0,0 +1,206 @@
+# api/search.py
+
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, F, FloatField, Func, Lookup, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+
+PRODUCT_TABLE = 'api_product'
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def parse_terms(query):
+    """Splits free text into lowercase word terms, dropping any query-syntax characters."""
+    return TERM_RE.findall((query or '').lower())
+
+
+class FullTextField(TextField):
+    """The hidden column of an FTS5 table named after the table, which `__match` queries."""
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', (*lhs_params, *rhs_params)
+
+
+class BaseSearchBackend:
+    """
+    Product full-text search.
+
+    `filter()` narrows a Product queryset to matches; `search()` also annotates
+    `search_rank`, where a lower value is a better match, so callers can
+    order by it the same way on every backend. Every term is a prefix match.
+    """
+
+    def install(self, schema_editor):
+        pass
+
+    def uninstall(self, schema_editor):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def filter(self, queryset, query):
+        raise NotImplementedError
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """
+    FTS5 index stored as an external-content table over `api_product`.
+
+    Triggers keep it in sync on every insert, update and delete, including
+    bulk_create() and queryset.update(), which bypass model signals. Ranked
+    searches join it as ProductSearchIndex.
+    """
+    table = 'api_product_fts'
+    # bm25 column weights: name, brand, description.
+    rank_weights = (10.0, 5.0, 1.0)
+
+    def install(self, schema_editor):
+        table = self.table
+        statements = [
+            f"""CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(
+                name, brand, description,
+                content='{PRODUCT_TABLE}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {PRODUCT_TABLE} BEGIN
+                INSERT INTO {table}(rowid, name, brand, description)
+                VALUES (new.id, new.name, new.brand, new.description);
+            END""",
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {PRODUCT_TABLE} BEGIN
+                INSERT INTO {table}({table}, rowid, name, brand, description)
+                VALUES ('delete', old.id, old.name, old.brand, old.description);
+            END""",
+            # Upserts assign every column; only reindex rows whose text changed.
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF name, brand, description ON {PRODUCT_TABLE}
+            WHEN old.name IS NOT new.name OR old.brand IS NOT new.brand OR old.description IS NOT new.description
+            BEGIN
+                INSERT INTO {table}({table}, rowid, name, brand, description)
+                VALUES ('delete', old.id, old.name, old.brand, old.description);
+                INSERT INTO {table}(rowid, name, brand, description)
+                VALUES (new.id, new.name, new.brand, new.description);
+            END""",
+        ]
+        for statement in statements:
+            schema_editor.execute(statement)
+
+    def uninstall(self, schema_editor):
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {self.table}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f"INSERT INTO {self.table}({self.table}) VALUES ('rebuild')")
+
+    def match_expression(self, query):
+        terms = parse_terms(query)
+        if not terms:
+            return None
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def filter(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {self.table} WHERE {self.table} MATCH %s', [expression]
+        ))
+
+    def search(self, queryset, query):
+        expression = self.match_expression(query)
+        if expression is None:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        # A join rather than a per-row subquery: the MATCH runs once, as the
+        # outer loop, and bm25() scores the rows it yields.
+        rank = Func(
+            F('search_index__document'), *(Value(weight) for weight in self.rank_weights),
+            function='bm25', output_field=FloatField(),
+        )
+        return queryset.filter(search_index__document__match=expression).annotate(search_rank=rank)
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """
+    Weighted tsvector over name, brand and description, served by a GIN
+    expression index. The index is maintained by PostgreSQL itself, so there
+    is nothing to sync or rebuild.
+    """
+    index_name = 'api_product_search_idx'
+    document_sql = (
+        "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(brand, '')), 'B') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'C')"
+    )
+
+    def install(self, schema_editor):
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {self.index_name} ON {PRODUCT_TABLE} '
+            f'USING GIN (({self.document_sql}))'
+        )
+
+    def uninstall(self, schema_editor):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {self.index_name}')
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {self.index_name}')
+
+    def ts_query(self, query):
+        terms = parse_terms(query)
+        if not terms:
+            return None
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def filter(self, queryset, query):
+        ts_query = self.ts_query(query)
+        if ts_query is None:
+            return queryset
+        return queryset.filter(RawSQL(
+            f"({self.document_sql}) @@ to_tsquery('simple', %s)", [ts_query], output_field=BooleanField()
+        ))
+
+    def search(self, queryset, query):
+        ts_query = self.ts_query(query)
+        if ts_query is None:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+        rank = RawSQL(
+            f"-ts_rank(({self.document_sql}), to_tsquery('simple', %s))", [ts_query], output_field=FloatField()
+        )
+        return self.filter(queryset, query).annotate(search_rank=rank)
+
+
+class FallbackSearchBackend(BaseSearchBackend):
+    """Unindexed `icontains` matching for databases without a native full-text engine."""
+
+    def filter(self, queryset, query):
+        for term in parse_terms(query):
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(brand__icontains=term) | Q(description__icontains=term)
+            )
+        return queryset
+
+    def search(self, queryset, query):
+        return self.filter(queryset, query).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(using=DEFAULT_DB_ALIAS):
+    vendor = connections[using].vendor
+    return SEARCH_BACKENDS.get(vendor, FallbackSearchBackend)()
@@ -1,7 +1,10 @@
+from django.core.files.storage import default_storage
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import authenticate
-from .models import CustomUser, Product, Order, GroupBuy, Review, Notification, OrderItem ,GroupBuyParticipation,ProductImage,ProductInventory,ProductSize
+from .images import PREFERRED_FORMAT
+from .models import CustomUser, Product, Order, GroupBuy, Review, Notification, OrderItem ,GroupBuyParticipation,ProductImage,ProductInventory,ProductSize, \
+    CartItem
 
 
 # User Serializer for Profile and General Use
@@ -83,31 +86,70 @@ class ProductInventorySerializer(serializers.ModelSerializer):
         fields = ['size', 'size_id', 'quantity']
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    # Derivative URLs fall back to the original until the variants are rendered.
+    thumbnail = serializers.SerializerMethodField()
+    medium = serializers.SerializerMethodField()
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'thumbnail', 'medium', 'variants']
+
+    def _url(self, name):
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+    def _variant_url(self, obj, variant):
+        name = obj.variants.get(variant, {}).get(PREFERRED_FORMAT)
+        if name:
+            return self._url(name)
+        return self.fields['image'].to_representation(obj.image) if obj.image else None
+
+    def get_thumbnail(self, obj):
+        return self._variant_url(obj, 'thumbnail')
+
+    def get_medium(self, obj):
+        return self._variant_url(obj, 'medium')
+
+    def get_variants(self, obj):
+        return {
+            variant: {format_name: self._url(name) for format_name, name in formats.items()}
+            for variant, formats in obj.variants.items()
+        }
 
 class ProductSerializer(serializers.ModelSerializer):
-    inventory = ProductInventorySerializer(many=True, source='productinventory_set')
+    inventory = ProductInventorySerializer(many=True, source='productinventory_set', required=False)
     images = ProductImageSerializer(many=True, read_only=True)
     uploaded_images = serializers.ListField(
         child=serializers.ImageField(max_length=1000000, allow_empty_file=False, use_url=False),
         write_only=True, required=False
     )
+    rating_histogram = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price','discountedprice', 'barcode', 'category', 'subcategory',
-                  'brand', 'quantity', 'in_stock', 'rating', 'review_count', 'sizes', 'colors',
-                  'images', 'uploaded_images', 'seller']
-        read_only_fields = ['seller']
+        fields = ['id', 'name', 'description', 'price', 'barcode', 'category', 'subcategory',
+                  'brand', 'quantity', 'in_stock', 'rating', 'review_count', 'rating_histogram', 'sizes', 'colors',
+                  'inventory', 'images', 'uploaded_images', 'seller']
+        # Review statistics are maintained from the reviews themselves.
+        read_only_fields = ['seller', 'rating', 'review_count']
+
+    def get_rating_histogram(self, obj):
+        return {str(star): getattr(obj, f'rating_{star}_count') for star in range(1, 6)}
 
     def create(self, validated_data):
-        uploaded_images = validated_data.pop('uploaded_images')
+        inventory_data = validated_data.pop('productinventory_set', [])
+        uploaded_images = validated_data.pop('uploaded_images', [])
         sizes = validated_data.pop('sizes', [])
         colors = validated_data.pop('colors', [])
         product = Product.objects.create(**validated_data)
 
+        ProductInventory.objects.bulk_create([
+            ProductInventory(product=product, size=inv_item['size'], quantity=inv_item['quantity'])
+            for inv_item in inventory_data
+        ])
+
         for image in uploaded_images:
             ProductImage.objects.create(product=product, image=image)
 
@@ -118,6 +160,8 @@ class ProductSerializer(serializers.ModelSerializer):
         return product
 
     def update(self, instance, validated_data):
+        from .services import InventoryService
+
         inventory_data = validated_data.pop('productinventory_set', [])
         uploaded_images = validated_data.pop('uploaded_images', [])
 
@@ -133,6 +177,9 @@ class ProductSerializer(serializers.ModelSerializer):
         for image in uploaded_images:
             ProductImage.objects.create(product=instance, image=image)
 
+        # A quantity edit must flip in_stock the same way reserve() and release() do.
+        InventoryService.sync_in_stock({instance.pk})
+        instance.refresh_from_db(fields=['in_stock'])
         return instance
 # class GroupBuySerializer(serializers.ModelSerializer):
 #     participants = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
@@ -180,22 +227,14 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'created_at', 'updated_at', 'items', 'total_price']
 
     def create(self, validated_data):
-        order_items_data = self.context['request'].data.get('items')  # Expecting items in the request data
-        order = Order.objects.create(**validated_data)  # Create the Order instance
-
-        total_price = 0  # Initialize total price
-
-        for item_data in order_items_data:
-            product = Product.objects.get(id=item_data['product'])
-            item_total = item_data['quantity'] * item_data['price']
-            total_price += item_total  # Add to total price
-            OrderItem.objects.create(order=order, product=product, quantity=item_data['quantity'],
-                                     price=item_data['price'])
+        from .services import OrderService
 
-        order.total_price = total_price  # Set total price after calculating
-        order.save()  # Save the order with the total price
-
-        return order
+        order_items_data = self.context['request'].data.get('items')  # Expecting items in the request data
+        try:
+            return OrderService.create_order(validated_data.pop('user', self.context['request'].user),
+                                             order_items_data, **validated_data)
+        except (Product.DoesNotExist, ValueError) as exc:
+            raise serializers.ValidationError({'items': str(exc)})
 # Review Serializer
 class ReviewSerializer(serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
@@ -207,7 +246,7 @@ class ReviewSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = self.context['request'].user
-        return Review.objects.create(user=user, product=validated_data['product'], **validated_data)
+        return Review.objects.create(user=user, **validated_data)
 
 # Notification Serializer
 class NotificationSerializer(serializers.ModelSerializer):
@@ -216,20 +255,56 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 # Analytics Serializer
+class TopProductSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    units = serializers.IntegerField()
+
 class AnalyticsSerializer(serializers.Serializer):
-    total_sales = serializers.DecimalField(max_digits=10, decimal_places=2)
+    total_sales = serializers.DecimalField(max_digits=14, decimal_places=2)
     total_orders = serializers.IntegerField()
-    top_products = ProductSerializer(many=True)
+    total_units = serializers.IntegerField()
+    average_order_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+    top_products = TopProductSerializer(many=True)
 
 class GroupBuySerializer(serializers.ModelSerializer):
     class Meta:
         model = GroupBuy
         fields = '__all__'
-        read_only_fields = ['current_particpants', 'status']
+        read_only_fields = ['current_participants', 'status']
 
 class GroupBuyParticipantSerializer(serializers.ModelSerializer):
     user = serializers.ReadOnlyField(source='user.username')
     class Meta:
         model = GroupBuyParticipation
         fields = '__all__'
-        read_only_fields = ['joined_at']
\ No newline at end of file
+        read_only_fields = ['joined_at']
+
+# Cart Serializers, for the output of CartService.get_cart()
+class CartItemSerializer(serializers.ModelSerializer):
+    product_name = serializers.CharField(source='product.name', read_only=True)
+    size_name = serializers.CharField(source='size.name', default=None, read_only=True)
+    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2, read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    available = serializers.IntegerField(read_only=True)
+    in_stock = serializers.SerializerMethodField()
+    group_buy = serializers.IntegerField(read_only=True)
+    group_buy_price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'product', 'product_name', 'size', 'size_name', 'quantity', 'price', 'line_total',
+                  'available', 'in_stock', 'group_buy', 'group_buy_price']
+
+    def get_in_stock(self, obj):
+        return obj.available >= obj.quantity
+
+class CartSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    items = CartItemSerializer(many=True)
+    item_count = serializers.IntegerField()
+    total_quantity = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+    in_stock = serializers.BooleanField()
+    updated_at = serializers.DateTimeField()
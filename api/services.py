@@ -1,63 +1,600 @@
 # api/services.py
 
-from django.db.models import Sum, Count, Q
+import datetime
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db import IntegrityError
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, \
+    Sum, Count, Q, Value, When
+from django.db.models.functions import Cast, Coalesce, Least, NullIf, Round, TruncDate
 from django.utils import timezone
 from rest_framework import permissions, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from .models import Order, Product
+from .cache import invalidate_products, invalidate_tags
+from .events import publish_group_buy_progress
+from .jobs import enqueue
+from .models import Cart, CartItem, CustomUser, GroupBuy, GroupBuyParticipation, Notification, Order, OrderItem, \
+    Product, ProductInventory, ProductDailySales, Review, SellerDailySales
+from .utils import bulk_create_notifications
 from .serializers import OrderSerializer
-class AnalyticsService:
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id, size_id=None):
+        self.product_id = product_id
+        self.size_id = size_id
+        detail = f" in size {size_id}" if size_id else ""
+        super().__init__(f"Insufficient stock for product {product_id}{detail}")
+
+
+class InventoryService:
+    """
+    Stock reservation through conditional UPDATEs.
+
+    Each decrement is `UPDATE ... SET quantity = quantity - n WHERE quantity >= n`,
+    so the check and the write are one atomic statement and concurrent buyers
+    can never take the same unit. Callers run these inside transaction.atomic()
+    so a failed line rolls back the lines reserved before it.
+    """
+
+    @staticmethod
+    def _aggregate(lines):
+        # Sum quantities per (product, size) and apply them in a fixed order so
+        # concurrent transactions lock rows in the same sequence.
+        totals = Counter()
+        for product_id, size_id, quantity in lines:
+            totals[(product_id, size_id)] += quantity
+        return sorted(totals.items(), key=lambda item: (item[0][0], item[0][1] or 0))
+
+    @staticmethod
+    def reserve(lines):
+        """Takes stock for (product_id, size_id, quantity) lines or raises InsufficientStock."""
+        for (product_id, size_id), quantity in InventoryService._aggregate(lines):
+            if size_id is not None:
+                reserved = ProductInventory.objects.filter(
+                    product_id=product_id, size_id=size_id, quantity__gte=quantity
+                ).update(quantity=F('quantity') - quantity)
+                if not reserved:
+                    raise InsufficientStock(product_id, size_id)
+            reserved = Product.objects.filter(
+                pk=product_id, quantity__gte=quantity
+            ).update(quantity=F('quantity') - quantity)
+            if not reserved:
+                raise InsufficientStock(product_id)
+        InventoryService.sync_in_stock({product_id for product_id, _, _ in lines})
+
+    @staticmethod
+    def release(lines):
+        """Puts stock for (product_id, size_id, quantity) lines back."""
+        for (product_id, size_id), quantity in InventoryService._aggregate(lines):
+            if size_id is not None:
+                ProductInventory.objects.filter(product_id=product_id, size_id=size_id).update(
+                    quantity=F('quantity') + quantity
+                )
+            Product.objects.filter(pk=product_id).update(quantity=F('quantity') + quantity)
+        InventoryService.sync_in_stock({product_id for product_id, _, _ in lines})
+
+    @staticmethod
+    def sync_in_stock(product_ids):
+        products = Product.objects.filter(pk__in=product_ids)
+        products.filter(quantity=0, in_stock=True).update(in_stock=False)
+        products.filter(quantity__gt=0, in_stock=False).update(in_stock=True)
+        transaction.on_commit(lambda: invalidate_products(product_ids))
+
+class ReviewStatsService:
+    """
+    Maintains Product.rating, review_count and the rating_<n>_count histogram.
+
+    Every review change is applied as one UPDATE of F() expressions, so
+    concurrent reviews of the same product never overwrite each other and
+    product lists read the statistics without touching the reviews table.
+    """
+    RATINGS = range(1, 6)
+    RECOMPUTE_BATCH_SIZE = 1000
+
     @staticmethod
-    def get_seller_analytics(seller):
-        end_date = timezone.now()
-        start_date = end_date - timezone.timedelta(days=30)
+    def apply(product_id, rating, sign=1):
+        """Adds (sign=1) or removes (sign=-1) one review with `rating` stars."""
+        if rating not in ReviewStatsService.RATINGS:
+            raise ValueError("Rating must be between 1 and 5")
+        column = f'rating_{rating}_count'
+        # SET expressions read the row as it was before the UPDATE.
+        stars = sum(star * F(f'rating_{star}_count') for star in ReviewStatsService.RATINGS) + sign * rating
+        review_count = F('review_count') + sign
+        average = Coalesce(
+            Round(Cast(stars, FloatField()) / NullIf(review_count, Value(0)), 2), Value(0.0)
+        )
+        Product.objects.filter(pk=product_id).update(**{
+            column: F(column) + sign,
+            'review_count': review_count,
+            'rating': Cast(average, DecimalField(max_digits=3, decimal_places=2)),
+        })
+        transaction.on_commit(lambda: invalidate_products([product_id]))
 
-        total_sales = Order.objects.filter(
-            seller=seller,
-            created_at__range=(start_date, end_date)
-        ).aggregate(total=Sum('total_price'))['total'] or 0
+    @staticmethod
+    def replace(previous, current):
+        """Moves a review from its previous (product_id, rating), if any, to the current one."""
+        if previous == current:
+            return
+        with transaction.atomic():
+            if previous is not None:
+                ReviewStatsService.apply(*previous, sign=-1)
+            if current is not None:
+                ReviewStatsService.apply(*current)
+
+    @staticmethod
+    def statistics(histogram):
+        """Returns the Product field values for a {rating: review count} histogram."""
+        review_count = sum(histogram.values())
+        stars = sum(rating * count for rating, count in histogram.items())
+        fields = {f'rating_{rating}_count': histogram.get(rating, 0) for rating in ReviewStatsService.RATINGS}
+        fields['review_count'] = review_count
+        fields['rating'] = (
+            (Decimal(stars) / review_count).quantize(Decimal('0.01'), ROUND_HALF_UP) if review_count else Decimal('0')
+        )
+        return fields
+
+    @staticmethod
+    def recompute(chunk_size=RECOMPUTE_BATCH_SIZE):
+        """
+        Recounts the statistics of every product from its reviews, one chunk
+        of products (and one grouped review query) at a time, and rewrites
+        only the products that drifted. Returns (checked, repaired).
+        """
+        fields = [f'rating_{rating}_count' for rating in ReviewStatsService.RATINGS] + ['review_count', 'rating']
+        checked = repaired = 0
+        last_id = 0
+        while True:
+            products = list(Product.objects.filter(pk__gt=last_id).order_by('pk').only(*fields)[:chunk_size])
+            if not products:
+                return checked, repaired
+            last_id = products[-1].pk
+
+            histograms = {product.pk: {} for product in products}
+            for row in Review.objects.filter(product_id__in=histograms).order_by().values(
+                    'product_id', 'rating').annotate(reviews=Count('id')):
+                histograms[row['product_id']][row['rating']] = row['reviews']
+
+            drifted = []
+            for product in products:
+                expected = ReviewStatsService.statistics(histograms[product.pk])
+                if any(getattr(product, field) != value for field, value in expected.items()):
+                    for field, value in expected.items():
+                        setattr(product, field, value)
+                    drifted.append(product)
+            if drifted:
+                with transaction.atomic():
+                    Product.objects.bulk_update(drifted, fields)
+                    transaction.on_commit(lambda ids=[product.pk for product in drifted]: invalidate_products(ids))
+            checked += len(products)
+            repaired += len(drifted)
+
+
+class SalesRollupService:
+    """
+    Maintains SellerDailySales and ProductDailySales.
 
-        total_orders = Order.objects.filter(
-            seller=seller,
-            created_at__range=(start_date, end_date)
-        ).count()
+    Orders are added to the rollups of the day they were placed when they are
+    created and subtracted again if they are cancelled, so analytics read a
+    handful of pre-aggregated rows instead of scanning order history.
+    """
+    ROLLUP_BATCH_SIZE = 1000
 
-        top_products = Product.objects.filter(
-            seller=seller,
-            order__created_at__range=(start_date, end_date)
-        ).annotate(total_sales=Sum('order__total_price')).order_by('-total_sales')[:5]
+    @staticmethod
+    def apply_order(order_id, sign=1):
+        """Adds (sign=1) or removes (sign=-1) one order's lines from the rollups."""
+        day = timezone.localdate(Order.objects.values_list('created_at', flat=True).get(pk=order_id))
+        per_product, per_seller = {}, {}
+        for product_id, seller_id, quantity, price in OrderItem.objects.filter(order_id=order_id).values_list(
+                'product_id', 'seller_id', 'quantity', 'price'):
+            product_totals = per_product.setdefault(product_id, [seller_id, 0, Decimal('0')])
+            seller_totals = per_seller.setdefault(seller_id, [0, Decimal('0')])
+            product_totals[1] += quantity
+            product_totals[2] += price * quantity
+            seller_totals[0] += quantity
+            seller_totals[1] += price * quantity
+
+        ProductDailySales.objects.bulk_create(
+            [ProductDailySales(product_id=product_id, seller_id=totals[0], date=day)
+             for product_id, totals in per_product.items()],
+            ignore_conflicts=True,
+        )
+        SellerDailySales.objects.bulk_create(
+            [SellerDailySales(seller_id=seller_id, date=day) for seller_id in per_seller],
+            ignore_conflicts=True,
+        )
+        for product_id, (_, units, revenue) in per_product.items():
+            ProductDailySales.objects.filter(product_id=product_id, date=day).update(
+                orders=F('orders') + sign, units=F('units') + sign * units, revenue=F('revenue') + sign * revenue
+            )
+        for seller_id, (units, revenue) in per_seller.items():
+            SellerDailySales.objects.filter(seller_id=seller_id, date=day).update(
+                orders=F('orders') + sign, units=F('units') + sign * units, revenue=F('revenue') + sign * revenue
+            )
+        if day != timezone.localdate():
+            transaction.on_commit(lambda: AnalyticsService.invalidate_sales_series(list(per_seller), day))
+
+    @staticmethod
+    def rebuild(since=None):
+        """
+        Recomputes the rollups from order history (all of it, or from `since`)
+        with two grouped queries and batched inserts. Returns the rows written.
+        """
+        items = OrderItem.objects.exclude(order__status='cancelled')
+        if since is not None:
+            items = items.filter(order__created_at__date__gte=since)
+        items = items.annotate(day=TruncDate('order__created_at')).order_by()
+        totals = dict(
+            orders=Count('order_id', distinct=True),
+            units=Sum('quantity'),
+            revenue=Sum(F('price') * F('quantity'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+        )
+
+        with transaction.atomic():
+            for model in (ProductDailySales, SellerDailySales):
+                rows = model.objects.all()
+                if since is not None:
+                    rows = rows.filter(date__gte=since)
+                rows.delete()
+
+            written = 0
+            groupings = (
+                (ProductDailySales, items.values('product_id', 'seller_id', 'day')),
+                (SellerDailySales, items.values('seller_id', 'day')),
+            )
+            for model, grouped in groupings:
+                batch = []
+                for row in grouped.annotate(**totals).iterator(chunk_size=SalesRollupService.ROLLUP_BATCH_SIZE):
+                    fields = dict(seller_id=row['seller_id'], date=row['day'], orders=row['orders'],
+                                  units=row['units'], revenue=row['revenue'])
+                    if 'product_id' in row:
+                        fields['product_id'] = row['product_id']
+                    batch.append(model(**fields))
+                    if len(batch) >= SalesRollupService.ROLLUP_BATCH_SIZE:
+                        written += len(model.objects.bulk_create(batch))
+                        batch = []
+                written += len(model.objects.bulk_create(batch))
+        transaction.on_commit(AnalyticsService.reset_sales_series)
+        return written
+
+
+class AnalyticsService:
+    @staticmethod
+    def get_seller_analytics(seller, days=30):
+        """Sales totals and top products for the last `days` days, read from the daily rollups only."""
+        start_date = timezone.localdate() - timezone.timedelta(days=days - 1)
+
+        totals = SellerDailySales.objects.filter(seller=seller, date__gte=start_date).aggregate(
+            total_sales=Sum('revenue'), total_orders=Sum('orders'), total_units=Sum('units')
+        )
+        total_sales = totals['total_sales'] or Decimal('0')
+        total_orders = totals['total_orders'] or 0
+
+        top_products = ProductDailySales.objects.filter(seller=seller, date__gte=start_date).values(
+            'product_id', 'product__name'
+        ).annotate(revenue=Sum('revenue'), units=Sum('units')).order_by('-revenue')[:5]
 
         return {
             'total_sales': total_sales,
             'total_orders': total_orders,
-            'top_products': top_products,
+            'total_units': totals['total_units'] or 0,
+            'average_order_value': (total_sales / total_orders).quantize(Decimal('0.01')) if total_orders else Decimal('0'),
+            'top_products': [
+                {'id': row['product_id'], 'name': row['product__name'], 'revenue': row['revenue'], 'units': row['units']}
+                for row in top_products
+            ],
         }
 
+    SERIES_INTERVALS = ('day', 'week', 'month')
+    SERIES_DEFAULT_BUCKETS = {'day': 30, 'week': 12, 'month': 12}
+    SERIES_MAX_BUCKETS = 366
+
+    @staticmethod
+    def bucket_start(day, interval):
+        if interval == 'day':
+            return day
+        if interval == 'week':
+            return day - timezone.timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    @staticmethod
+    def next_bucket(bucket, interval):
+        if interval == 'day':
+            return bucket + timezone.timedelta(days=1)
+        if interval == 'week':
+            return bucket + timezone.timedelta(days=7)
+        return (bucket.replace(day=28) + timezone.timedelta(days=4)).replace(day=1)
+
+    @staticmethod
+    def _series_version():
+        return cache.get_or_set('sales_series:version', 1, None)
+
+    @staticmethod
+    def _series_key(version, seller_id, interval, bucket):
+        return f'sales_series:{version}:{interval}:{seller_id}:{bucket.isoformat()}'
+
+    @staticmethod
+    def invalidate_sales_series(seller_ids, day):
+        """Drops the cached buckets containing `day` after a past order changes."""
+        version = AnalyticsService._series_version()
+        cache.delete_many([
+            AnalyticsService._series_key(version, seller_id, interval, AnalyticsService.bucket_start(day, interval))
+            for seller_id in seller_ids for interval in AnalyticsService.SERIES_INTERVALS
+        ])
+
+    @staticmethod
+    def reset_sales_series():
+        try:
+            cache.incr('sales_series:version')
+        except ValueError:
+            cache.set('sales_series:version', 1, None)
+
+    @staticmethod
+    def get_sales_over_time(seller_ids, interval='day', start_date=None, end_date=None):
+        """
+        Orders, units and revenue per day, week (ISO, starting Monday) or month
+        bucket for several sellers at once, with empty buckets filled with zeros.
+
+        Buckets are summed in Python from SellerDailySales, so no database date
+        functions are involved and it runs the same on SQLite and PostgreSQL.
+        Finished buckets never change unless an old order is cancelled (which
+        evicts them), so they are cached without expiry; only buckets missing
+        from the cache and the current, still-open bucket hit the database.
+        """
+        if interval not in AnalyticsService.SERIES_INTERVALS:
+            raise ValueError("Invalid interval. Use 'day', 'week' or 'month'.")
+        today = timezone.localdate()
+        end_date = min(end_date or today, today)
+        end_bucket = AnalyticsService.bucket_start(end_date, interval)
+        if start_date is None:
+            start_bucket = end_bucket
+            for _ in range(AnalyticsService.SERIES_DEFAULT_BUCKETS[interval] - 1):
+                start_bucket = AnalyticsService.bucket_start(start_bucket - timezone.timedelta(days=1), interval)
+        else:
+            start_bucket = AnalyticsService.bucket_start(start_date, interval)
+
+        buckets = []
+        bucket = start_bucket
+        while bucket <= end_bucket:
+            buckets.append(bucket)
+            if len(buckets) > AnalyticsService.SERIES_MAX_BUCKETS:
+                raise ValueError(f"At most {AnalyticsService.SERIES_MAX_BUCKETS} buckets can be requested.")
+            bucket = AnalyticsService.next_bucket(bucket, interval)
+        current_bucket = AnalyticsService.bucket_start(today, interval)
+
+        version = AnalyticsService._series_version()
+        keys = {
+            (seller_id, bucket): AnalyticsService._series_key(version, seller_id, interval, bucket)
+            for seller_id in seller_ids for bucket in buckets if bucket != current_bucket
+        }
+        cached = cache.get_many(keys.values())
+        values = {slot: cached[key] for slot, key in keys.items() if key in cached}
+
+        missing = [(seller_id, bucket) for seller_id in seller_ids for bucket in buckets
+                   if (seller_id, bucket) not in values]
+        if missing:
+            computed = {slot: [0, 0, Decimal('0')] for slot in missing}
+            rows = SellerDailySales.objects.filter(
+                seller_id__in={seller_id for seller_id, _ in missing},
+                date__gte=min(bucket for _, bucket in missing),
+                date__lt=AnalyticsService.next_bucket(max(bucket for _, bucket in missing), interval),
+            ).values_list('seller_id', 'date', 'orders', 'units', 'revenue')
+            for seller_id, day, orders, units, revenue in rows:
+                totals = computed.get((seller_id, AnalyticsService.bucket_start(day, interval)))
+                if totals is not None:
+                    totals[0] += orders
+                    totals[1] += units
+                    totals[2] += revenue
+            values.update({slot: tuple(totals) for slot, totals in computed.items()})
+            cache.set_many({keys[slot]: values[slot] for slot in computed if slot in keys}, None)
+
+        return {
+            seller_id: [
+                {'bucket': bucket, 'orders': values[(seller_id, bucket)][0],
+                 'units': values[(seller_id, bucket)][1], 'revenue': values[(seller_id, bucket)][2]}
+                for bucket in buckets
+            ]
+            for seller_id in seller_ids
+        }
+
+
+class GroupBuyService:
+    """
+    Join/leave as single conditional UPDATEs on `current_participants`.
+
+    The capacity check, the counter change and the status switch happen in
+    one statement, so a popular group buy cannot be overfilled however many
+    users join at once. The participation row is written in the same
+    transaction; if it fails the counter change is rolled back with it.
+    """
+
+    @staticmethod
+    def _changed(group_buy_id):
+        """Evicts cached responses and pushes the new participant count once the change commits."""
+        group_buy = GroupBuy.objects.filter(pk=group_buy_id).values(
+            'current_participants', 'min_participants', 'status', 'product__name'
+        ).get()
+        transaction.on_commit(lambda: invalidate_tags('group_buys', f'group_buy:{group_buy_id}'))
+        publish_group_buy_progress((group_buy_id, group_buy['current_participants'], group_buy['status']))
+        return group_buy
+
+    @staticmethod
+    def _refuse(group_buy_id):
+        group_buy = GroupBuy.objects.filter(pk=group_buy_id).values('status', 'end_date').first()
+        if group_buy is None:
+            raise ValueError("Group buy not found")
+        if group_buy['status'] != 'active' or group_buy['end_date'] <= timezone.now():
+            raise ValueError("This group buy is not active")
+        raise ValueError("This group buy is full")
+
     @staticmethod
-    def get_sales_over_time(seller, period='month'):
-        end_date = timezone.now()
-        if period == 'month':
-            start_date = end_date - timezone.timedelta(days=30)
-            date_trunc = 'day'
-        elif period == 'year':
-            start_date = end_date - timezone.timedelta(days=365)
-            date_trunc = 'month'
+    def join(group_buy_id, user, quantity=1):
+        with transaction.atomic():
+            joined = GroupBuy.objects.filter(
+                pk=group_buy_id, status='active', end_date__gt=timezone.now(),
+                current_participants__lt=F('max_participants'),
+            ).update(
+                current_participants=F('current_participants') + 1,
+                # Filling the last seat closes the group buy in the same statement.
+                status=Case(
+                    When(current_participants__gte=F('max_participants') - 1, then=Value('completed')),
+                    default=Value('active'),
+                ),
+            )
+            if not joined:
+                GroupBuyService._refuse(group_buy_id)
+            try:
+                with transaction.atomic():
+                    participation = GroupBuyParticipation.objects.create(
+                        group_buy_id=group_buy_id, user=user, quantity=quantity
+                    )
+            except IntegrityError:
+                raise ValueError("You have already joined this group buy")
+            GroupBuyService._notify_milestone(group_buy_id, GroupBuyService._changed(group_buy_id))
+        return participation
+
+    @staticmethod
+    def _notify_milestone(group_buy_id, group_buy):
+        if group_buy['status'] == 'completed':
+            milestone = 'completed'
+        elif group_buy['current_participants'] == group_buy['min_participants']:
+            milestone = 'goal_reached'
         else:
-            raise ValueError("Invalid period. Use 'month' or 'year'.")
+            return
+        enqueue('notify_group_buy_milestone', group_buy_id=group_buy_id, milestone=milestone)
+
+    @staticmethod
+    def leave(group_buy_id, user):
+        with transaction.atomic():
+            left = GroupBuy.objects.filter(
+                pk=group_buy_id, status='active', end_date__gt=timezone.now(), current_participants__gt=0
+            ).update(current_participants=F('current_participants') - 1)
+            if not left:
+                GroupBuyService._refuse(group_buy_id)
+            deleted, _ = GroupBuyParticipation.objects.filter(group_buy_id=group_buy_id, user=user).delete()
+            if not deleted:
+                raise ValueError("You are not part of this group buy")
+            GroupBuyService._changed(group_buy_id)
+
+    @staticmethod
+    def settle_expired(now=None, chunk_size=1000):
+        """
+        Closes every active group buy whose end_date has passed.
+
+        Works through the (status, end_date) index a chunk at a time: each
+        chunk is two set-based UPDATEs (completed when min_participants was
+        met, cancelled otherwise) plus one bulk insert of participant
+        notifications, all in one transaction. Returns (completed, cancelled).
+        """
+        now = now or timezone.now()
+        completed_total = cancelled_total = 0
+        while True:
+            ids = list(
+                GroupBuy.objects.filter(status='active', end_date__lte=now)
+                .order_by('end_date').values_list('id', flat=True)[:chunk_size]
+            )
+            if not ids:
+                return completed_total, cancelled_total
+
+            with transaction.atomic():
+                expired = GroupBuy.objects.filter(pk__in=ids, status='active')
+                expired.filter(current_participants__gte=F('min_participants')).update(status='completed')
+                expired.update(status='cancelled')
+                settled = list(GroupBuy.objects.filter(pk__in=ids).values_list('id', 'current_participants', 'status'))
+                statuses = {group_buy_id: status for group_buy_id, _, status in settled}
+
+                bulk_create_notifications(
+                    Notification(
+                        user_id=user_id,
+                        type='GROUP_BUY',
+                        message=(
+                            f"The group buy for {product_name} reached its goal and is complete."
+                            if statuses[group_buy_id] == 'completed' else
+                            f"The group buy for {product_name} ended without enough participants and was cancelled."
+                        ),
+                        related_object_id=group_buy_id,
+                    )
+                    for user_id, group_buy_id, product_name in GroupBuyParticipation.objects.filter(
+                        group_buy_id__in=ids
+                    ).values_list('user_id', 'group_buy_id', 'group_buy__product__name').iterator()
+                )
+
+                transaction.on_commit(
+                    lambda ids=ids: invalidate_tags('group_buys', *(f'group_buy:{pk}' for pk in ids))
+                )
+                publish_group_buy_progress(*settled)
+
+            completed = sum(1 for value in statuses.values() if value == 'completed')
+            completed_total += completed
+            cancelled_total += len(statuses) - completed
 
-        sales = Order.objects.filter(
-            seller=seller,
-            created_at__range=(start_date, end_date)
-        ).extra(select={'date': f"date_trunc('{date_trunc}', created_at)"}
-        ).values('date').annotate(total=Sum('total_price')).order_by('date')
 
-        return list(sales)
 class OrderService:
+    @staticmethod
+    def parse_order_items(items_data, min_quantity=1):
+        """
+        Normalizes request line items into (product_id, size_id, quantity) tuples.
+        Client-sent prices are ignored; orders are always priced server-side.
+        """
+        if not items_data:
+            raise ValueError("No items provided")
+        lines = []
+        for item_data in items_data:
+            try:
+                product_id = int(item_data['product'])
+                size_id = int(item_data['size']) if item_data.get('size') is not None else None
+                quantity = int(item_data.get('quantity', 1))
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Each item needs a product id and an integer quantity")
+            if quantity < min_quantity:
+                raise ValueError(f"Item quantity must be at least {min_quantity}")
+            lines.append((product_id, size_id, quantity))
+        return lines
+
+    @staticmethod
+    def create_order(user, items_data, **order_fields):
+        """
+        Creates an order and its line items in one transaction, reserving stock.
+
+        All products are fetched with a single query and the items are written
+        with one bulk insert. Stock reservation and the sales rollups still take
+        a conditional UPDATE per distinct product (see benchmark_create_order).
+        Raises ValueError for malformed items, Product.DoesNotExist if any
+        product is unknown and InsufficientStock if any line cannot be
+        reserved; nothing is written in any of these cases.
+        """
+        lines = OrderService.parse_order_items(items_data)
+        products = Product.objects.in_bulk({product_id for product_id, _, _ in lines})
+        missing = [product_id for product_id, _, _ in lines if product_id not in products]
+        if missing:
+            raise Product.DoesNotExist(f"Product not found: {', '.join(map(str, missing))}")
+
+        total_price = sum(
+            (products[product_id].price * quantity for product_id, _, quantity in lines), Decimal('0')
+        )
+        with transaction.atomic():
+            InventoryService.reserve(lines)
+            order = Order.objects.create(user=user, total_price=total_price, **order_fields)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=products[product_id], seller_id=products[product_id].seller_id,
+                          size_id=size_id, quantity=quantity, price=products[product_id].price)
+                for product_id, size_id, quantity in lines
+            ])
+            SalesRollupService.apply_order(order.pk)
+        return order
+
     @staticmethod
     def get_seller_orders(seller):
-        return Order.objects.filter(seller=seller).order_by('-created_at')
+        """Orders containing at least one of the seller's products, newest first."""
+        return Order.objects.filter(
+            id__in=OrderItem.objects.filter(seller=seller).values('order_id')
+        ).order_by('-created_at', '-id')
 
     @staticmethod
     def get_order_details(order_id):
@@ -68,13 +605,45 @@ class OrderService:
 
     @staticmethod
     def update_order_status(order_id, new_status):
-        try:
-            order = Order.objects.get(id=order_id)
-            order.status = new_status
-            order.save()
-            return order
-        except Order.DoesNotExist:
-            raise ValueError("Order not found")
+        """
+        Moves an order to `new_status`, returning its stock when it is cancelled.
+
+        The switch to 'cancelled' is a conditional UPDATE, so only one of
+        several concurrent cancellations releases the items.
+        """
+        if new_status not in dict(Order.ORDER_STATUS):
+            raise ValueError("Invalid status value")
+        with transaction.atomic():
+            updated = Order.objects.filter(id=order_id).exclude(status='cancelled').update(
+                status=new_status, updated_at=timezone.now()
+            )
+            if updated and new_status == 'cancelled':
+                OrderService._release(order_id)
+            if updated:
+                # Notifying the buyer (unread counter, live event) is left to a worker.
+                enqueue('notify_order_status', order_id=order_id, status=new_status)
+        order = OrderService.get_order_details(order_id)
+        if not updated and new_status != 'cancelled':
+            raise ValueError("Cancelled orders cannot be reopened")
+        return order
+
+    @staticmethod
+    def _release(order_id):
+        # Returns the stock of an order that has just been cancelled and takes it out of the sales rollups.
+        InventoryService.release(list(
+            OrderItem.objects.filter(order_id=order_id).values_list('product_id', 'size_id', 'quantity')
+        ))
+        SalesRollupService.apply_order(order_id, sign=-1)
+
+    @staticmethod
+    def release_deleted_order(order_id):
+        """
+        Undoes an order that is being deleted (from the admin, or along with
+        its buyer) the way cancelling it would, unless it already was.
+        """
+        with transaction.atomic():
+            if Order.objects.filter(id=order_id).exclude(status='cancelled').update(status='cancelled'):
+                OrderService._release(order_id)
 
     @staticmethod
     def add_tracking_number(order_id, tracking_number):
@@ -87,20 +656,295 @@ class OrderService:
             raise ValueError("Order not found")
 
     @staticmethod
-    def search_orders(seller, query):
-        return Order.objects.filter(
-            Q(seller=seller) &
-            (Q(id__icontains=query) | Q(user__username__icontains=query) | Q(status__icontains=query))
-        ).order_by('-created_at')
+    def _prefix_range(field, prefix):
+        # A >= / < range instead of LIKE, so the plain B-tree index on `field`
+        # serves the prefix match on every backend (case-sensitive).
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': prefix[:-1] + chr(ord(prefix[-1]) + 1)})
+
+    @staticmethod
+    def search_orders(seller, query, status=None):
+        """
+        Looks up the seller's orders by exact order id ("123" or "#123") or
+        tracking number, or by a prefix of the buyer's username or email.
+        Usernames match case-sensitively; an email prefix matches as typed or
+        lower-cased, so `Zed@` finds zed@example.com.
+
+        It is a single query whose every branch is an index seek: the primary
+        key, the tracking_number index, and subqueries over the unique
+        username/email indexes for matching buyers. Results carry a
+        `search_rank` (0 exact hit, 1 username prefix, 2 email prefix) for
+        SearchRankCursorPagination. An empty query lists the seller's orders,
+        optionally narrowed to `status`.
+        """
+        if status is not None and status not in dict(Order.ORDER_STATUS):
+            raise ValueError("Invalid status value")
+        query = (query or '').strip()
+        orders = OrderService.get_seller_orders(seller).order_by()
+        if status is not None:
+            orders = orders.filter(status=status)
+        if not query:
+            return orders.annotate(search_rank=Value(0, output_field=IntegerField()))
+
+        exact = Q(tracking_number=query)
+        order_id = query.removeprefix('#')
+        if order_id.isdigit() and len(order_id) <= 18:
+            exact |= Q(pk=int(order_id))
+        by_username = CustomUser.objects.filter(OrderService._prefix_range('username', query)).values('id')
+        by_email = OrderService._prefix_range('email', query)
+        if query.lower() != query:
+            by_email |= OrderService._prefix_range('email', query.lower())
+        buyers = CustomUser.objects.filter(OrderService._prefix_range('username', query) | by_email).values('id')
+
+        return orders.filter(exact | Q(user_id__in=buyers)).annotate(
+            search_rank=Case(
+                When(exact, then=Value(0)),
+                When(user_id__in=by_username, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            )
+        )
+
+    ORDER_STATISTICS_ROLES = ('buyer', 'seller')
 
     @staticmethod
-    def get_order_statistics(seller):
-        total_orders = Order.objects.filter(seller=seller).count()
-        pending_orders = Order.objects.filter(seller=seller, status='pending').count()
-        completed_orders = Order.objects.filter(seller=seller, status='completed').count()
+    def _local_day_start(day):
+        return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
 
+    @staticmethod
+    def get_order_statistics(user, role='buyer', start_date=None, end_date=None):
+        """
+        Order count and revenue for every Order.ORDER_STATUS value, from one
+        conditional aggregation.
+
+        As a buyer the user's own orders and their totals are counted. As a
+        seller every order containing one of the user's products is counted
+        once, and revenue only covers the user's own lines. Dates are
+        inclusive local days, turned into created_at bounds so the
+        (user, status, created_at) index can serve the range.
+        """
+        if role not in OrderService.ORDER_STATISTICS_ROLES:
+            raise ValueError("Invalid role. Use 'buyer' or 'seller'.")
+        if start_date and end_date and start_date > end_date:
+            raise ValueError("start_date must not be after end_date")
+
+        timeout = getattr(settings, 'ORDER_STATISTICS_CACHE_TIMEOUT', 0)
+        key = f'order_statistics:{role}:{user.pk}:{start_date}:{end_date}'
+        if timeout:
+            stats = cache.get(key)
+            if stats is not None:
+                return stats
+
+        if role == 'buyer':
+            rows, prefix = Order.objects.filter(user=user), ''
+            order_id, revenue = F('id'), F('total_price')
+        else:
+            rows, prefix = OrderItem.objects.filter(seller=user), 'order__'
+            order_id, revenue = F('order_id'), F('price') * F('quantity')
+        if start_date:
+            rows = rows.filter(**{f'{prefix}created_at__gte': OrderService._local_day_start(start_date)})
+        if end_date:
+            rows = rows.filter(**{
+                f'{prefix}created_at__lt': OrderService._local_day_start(end_date + timezone.timedelta(days=1))
+            })
+
+        money = DecimalField(max_digits=14, decimal_places=2)
+        aggregates = {}
+        for value, _ in Order.ORDER_STATUS:
+            in_status = Q(**{f'{prefix}status': value})
+            aggregates[f'{value}_count'] = Count(order_id, distinct=True, filter=in_status)
+            aggregates[f'{value}_revenue'] = Sum(revenue, filter=in_status, output_field=money)
+        totals = rows.aggregate(**aggregates)
+
+        statuses = {
+            value: {'count': totals[f'{value}_count'], 'revenue': totals[f'{value}_revenue'] or Decimal('0')}
+            for value, _ in Order.ORDER_STATUS
+        }
+        stats = {
+            'role': role,
+            'start_date': start_date,
+            'end_date': end_date,
+            'total_orders': sum(entry['count'] for entry in statuses.values()),
+            # Cancelled orders are counted but never earn revenue.
+            'total_revenue': sum(
+                (entry['revenue'] for value, entry in statuses.items() if value != 'cancelled'), Decimal('0')
+            ),
+            'statuses': statuses,
+        }
+        if timeout:
+            cache.set(key, stats, timeout)
+        return stats
+
+
+class CartService:
+    """
+    Carts are edited in batches of (product, size, quantity) lines.
+
+    Each change validates all of its lines with at most two queries and
+    writes them with one bulk insert, one bulk update and one delete, under
+    a lock on the cart row so concurrent edits of the same cart apply one
+    after the other. Reading a cart is a single annotated query.
+    """
+    MAX_CART_LINES = 100
+
+    @staticmethod
+    def _locked_cart(user):
+        cart, _ = Cart.objects.get_or_create(user=user)
+        # select_for_update() is a no-op on SQLite, whose transactions take the write lock up front.
+        return Cart.objects.select_for_update().get(pk=cart.pk)
+
+    @staticmethod
+    def _available_lines(lines, skip_missing=False):
+        """
+        Returns the lines whose product exists and, for sized lines, has
+        that size. Raises Product.DoesNotExist or ValueError for the others,
+        or drops them with `skip_missing`.
+        """
+        product_ids = set(Product.objects.filter(
+            pk__in={product_id for product_id, _, _ in lines}
+        ).values_list('pk', flat=True))
+        sized = {(product_id, size_id) for product_id, size_id, _ in lines if size_id is not None}
+        stocked = set()
+        if sized:
+            stocked = set(ProductInventory.objects.filter(
+                product_id__in={product_id for product_id, _ in sized}, size_id__in={size_id for _, size_id in sized}
+            ).values_list('product_id', 'size_id'))
+
+        available = []
+        for product_id, size_id, quantity in lines:
+            if product_id not in product_ids:
+                if skip_missing:
+                    continue
+                raise Product.DoesNotExist(f"Product not found: {product_id}")
+            if size_id is not None and (product_id, size_id) not in stocked:
+                if skip_missing:
+                    continue
+                raise ValueError(f"Product {product_id} is not available in size {size_id}")
+            available.append((product_id, size_id, quantity))
+        return available
+
+    @staticmethod
+    def _write(user, lines, add=False):
+        """
+        Sets (or with `add`, increases) the quantity of each line; a
+        resulting quantity of 0 removes the line.
+        """
+        quantities = Counter() if add else {}
+        for product_id, size_id, quantity in lines:
+            if add:
+                quantities[(product_id, size_id)] += quantity
+            else:
+                quantities[(product_id, size_id)] = quantity
+
+        with transaction.atomic():
+            cart = CartService._locked_cart(user)
+            existing = {(item.product_id, item.size_id): item for item in cart.items.all()}
+            created, changed, removed = [], [], []
+            for (product_id, size_id), quantity in quantities.items():
+                item = existing.get((product_id, size_id))
+                if add and item is not None:
+                    quantity += item.quantity
+                if item is None:
+                    if quantity:
+                        created.append(CartItem(cart=cart, product_id=product_id, size_id=size_id, quantity=quantity))
+                elif not quantity:
+                    removed.append(item.pk)
+                elif quantity != item.quantity:
+                    item.quantity = quantity
+                    changed.append(item)
+            if len(existing) + len(created) - len(removed) > CartService.MAX_CART_LINES:
+                raise ValueError(f"A cart can hold at most {CartService.MAX_CART_LINES} different items")
+
+            CartItem.objects.bulk_create(created)
+            CartItem.objects.bulk_update(changed, ['quantity'])
+            CartItem.objects.filter(pk__in=removed).delete()
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+
+    @staticmethod
+    def add_items(user, items_data):
+        """Adds the quantities of `items_data` to the user's cart."""
+        lines = OrderService.parse_order_items(items_data)
+        CartService._write(user, CartService._available_lines(lines), add=True)
+
+    @staticmethod
+    def update_items(user, items_data):
+        """Sets the quantity of each line of `items_data`; 0 removes the line."""
+        lines = OrderService.parse_order_items(items_data, min_quantity=0)
+        CartService._available_lines([line for line in lines if line[2]])
+        CartService._write(user, lines)
+
+    @staticmethod
+    def remove_items(user, items_data):
+        lines = OrderService.parse_order_items(items_data, min_quantity=0)
+        CartService._write(user, [(product_id, size_id, 0) for product_id, size_id, _ in lines])
+
+    @staticmethod
+    def merge(user, items_data):
+        """
+        Adds the lines of a cart kept while signed out. Lines whose product
+        or size no longer exists are skipped; returns how many were.
+        """
+        lines = OrderService.parse_order_items(items_data)
+        available = CartService._available_lines(lines, skip_missing=True)
+        CartService._write(user, available, add=True)
+        return len(lines) - len(available)
+
+    @staticmethod
+    def get_cart(user):
+        """
+        The user's cart lines and totals, from one query.
+
+        Each line is annotated with the stock it can draw on (the size's
+        inventory, capped by the product's quantity, as checkout reserves
+        both), its total at the current price, and the cheapest running
+        group buy for the product. Group-buy prices are informational:
+        checkout charges the product price, as OrderService.create_order does.
+        """
+        cart, _ = Cart.objects.get_or_create(user=user)
+        now = timezone.now()
+        group_buys = GroupBuy.objects.filter(
+            product=OuterRef('product_id'), status='active', start_date__lte=now, end_date__gt=now
+        ).order_by('discount_price', 'end_date')
+        size_stock = ProductInventory.objects.filter(
+            product=OuterRef('product_id'), size=OuterRef('size_id')
+        ).values('quantity')[:1]
+        money = DecimalField(max_digits=12, decimal_places=2)
+        items = list(
+            CartItem.objects.filter(cart=cart).select_related('product', 'size').annotate(
+                available=Case(
+                    When(size__isnull=True, then=F('product__quantity')),
+                    default=Least(Coalesce(Subquery(size_stock), 0), F('product__quantity')),
+                ),
+                group_buy=Subquery(group_buys.values('id')[:1]),
+                group_buy_price=Subquery(group_buys.values('discount_price')[:1]),
+                line_total=ExpressionWrapper(F('product__price') * F('quantity'), output_field=money),
+            ).order_by('id')
+        )
         return {
-            'total_orders': total_orders,
-            'pending_orders': pending_orders,
-            'completed_orders': completed_orders,
+            'id': cart.pk,
+            'items': items,
+            'item_count': len(items),
+            'total_quantity': sum(item.quantity for item in items),
+            'subtotal': sum((item.line_total for item in items), Decimal('0')),
+            'in_stock': all(item.available >= item.quantity for item in items),
+            'updated_at': cart.updated_at,
         }
+
+    @staticmethod
+    def checkout(user):
+        """
+        Turns the user's cart into an order and empties it, in one
+        transaction. Raises ValueError for an empty cart and InsufficientStock
+        if a line cannot be reserved, leaving the cart as it was.
+        """
+        with transaction.atomic():
+            cart = CartService._locked_cart(user)
+            items = [
+                {'product': product_id, 'size': size_id, 'quantity': quantity}
+                for product_id, size_id, quantity in cart.items.values_list('product_id', 'size_id', 'quantity')
+            ]
+            if not items:
+                raise ValueError("Your cart is empty")
+            order = OrderService.create_order(user, items)
+            cart.items.all().delete()
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        return order
@@ -0,0 +1,106 @@
+# api/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .cache import invalidate_tags, product_cache_tags
+from .facets import invalidate_facets
+from .images import release_image, schedule_variants
+from .jobs import enqueue
+from .models import GroupBuy, Order, Product, ProductImage, ProductInventory, Review
+from .services import OrderService, ReviewStatsService
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_values(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Product.objects.filter(pk=instance.pk).values_list('category', 'price').first()
+    instance._previous_category, instance._previous_price = previous or (None, None)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_caches(sender, instance, **kwargs):
+    # Evict on commit: evicting earlier lets a concurrent read cache the old
+    # row again under the new tag versions, and it would be served until the
+    # next write.
+    previous_category = getattr(instance, '_previous_category', None)
+    categories = (instance.category, previous_category)
+    tags = product_cache_tags(instance.pk, instance.seller_id, *categories)
+    transaction.on_commit(lambda: (invalidate_facets(*categories), invalidate_tags(*tags)))
+
+
+@receiver(post_save, sender=Product)
+def notify_price_drop(sender, instance, created, **kwargs):
+    previous_price = getattr(instance, '_previous_price', None)
+    if created or previous_price is None or instance.price >= previous_price:
+        return
+    # A product can be on thousands of wishlists; notify them from a worker.
+    enqueue('notify_price_drop', product_id=instance.pk, product_name=instance.name,
+            old_price=str(previous_price), new_price=str(instance.price))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductInventory)
+@receiver(post_delete, sender=ProductInventory)
+def invalidate_product_children_caches(sender, instance, **kwargs):
+    # Images and inventory are nested in product responses. The product itself
+    # may already be gone when these fire as part of a cascading delete.
+    product = Product.objects.filter(pk=instance.product_id).values('seller_id', 'category').first() or {}
+    tags = product_cache_tags(instance.product_id, product.get('seller_id'), product.get('category'))
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver(post_save, sender=ProductImage)
+def render_image_variants(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        schedule_variants(instance.pk)
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_file(sender, instance, **kwargs):
+    # Files are shared between identical uploads; only the last reference deletes them.
+    name, variants = instance.image.name, instance.variants
+    transaction.on_commit(lambda: release_image(name, variants))
+
+
+@receiver(pre_save, sender=Review)
+def remember_previous_rating(sender, instance, **kwargs):
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=Review)
+def count_review(sender, instance, raw=False, **kwargs):
+    if not raw:
+        ReviewStatsService.replace(getattr(instance, '_previous_rating', None), (instance.product_id, instance.rating))
+
+
+@receiver(post_delete, sender=Review)
+def uncount_review(sender, instance, **kwargs):
+    # Also runs for reviews cascaded from a deleted product, where the UPDATE simply matches nothing.
+    ReviewStatsService.apply(instance.product_id, instance.rating, sign=-1)
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_review_caches(sender, instance, **kwargs):
+    tags = ('reviews', f'review:{instance.pk}', f'product:{instance.product_id}')
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver(post_save, sender=GroupBuy)
+@receiver(post_delete, sender=GroupBuy)
+def invalidate_group_buy_caches(sender, instance, **kwargs):
+    tags = ('group_buys', f'group_buy:{instance.pk}')
+    transaction.on_commit(lambda: invalidate_tags(*tags))
+
+
+@receiver(pre_delete, sender=Order)
+def release_deleted_order(sender, instance, **kwargs):
+    # Runs before the cascade removes the order's lines.
+    OrderService.release_deleted_order(instance.pk)
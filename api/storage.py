@@ -0,0 +1,112 @@
+# api/storage.py
+
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.core.files.utils import validate_file_name
+
+HASH_CHUNK_SIZE = 64 * 1024
+SPOOL_DIRECTORY = 'tmp'
+# Basename of a stored file: its SHA-256 plus the upload's extension.
+CONTENT_ADDRESSED_NAME = re.compile(r'^[0-9a-f]{64}(\.\w+)?$')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every distinct file once, as <upload_to>/<aa>/<bb>/<sha256><ext>.
+
+    Saving bytes that are already stored only refreshes the file's mtime, so
+    a catalog re-using one photo across many listings keeps a single copy.
+    Uploads hashed by the handlers below are moved into place without being
+    read again; other content is spooled to disk in chunks while hashing.
+    Files are shared, so deleting one ProductImage must not delete its file;
+    see api.images.release_image() and the collect_image_garbage command.
+    """
+
+    def save(self, name, content, max_length=None):
+        validate_file_name(name, allow_relative_path=True)
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        directory, extension = posixpath.dirname(name), posixpath.splitext(name)[1].lower()
+
+        digest, source, spooled = getattr(content, 'sha256', None), None, False
+        if digest is not None and hasattr(content, 'temporary_file_path'):
+            source = content.temporary_file_path()
+        else:
+            digest, source = self._spool(content, directory)
+            spooled = True
+
+        final_name = posixpath.join(directory, digest[:2], digest[2:4], digest + extension)
+        path = self.path(final_name)
+        try:
+            if os.path.exists(path):
+                # Already stored: mark it as recently referenced for the garbage collector.
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                file_move_safe(source, path, allow_overwrite=True)
+                os.chmod(path, self.file_permissions_mode or 0o644)
+                spooled = False
+        finally:
+            if spooled:
+                os.remove(source)
+        return final_name
+
+    def _spool(self, content, directory):
+        """Copies `content` to a temporary file under `directory` while hashing it."""
+        spool_directory = self.path(posixpath.join(directory, SPOOL_DIRECTORY))
+        os.makedirs(spool_directory, exist_ok=True)
+        sha256 = hashlib.sha256()
+        descriptor, path = tempfile.mkstemp(dir=spool_directory, suffix='.upload')
+        try:
+            with os.fdopen(descriptor, 'wb') as spool:
+                for chunk in content.chunks(HASH_CHUNK_SIZE):
+                    sha256.update(chunk)
+                    spool.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return sha256.hexdigest(), path
+
+
+_product_image_storage = ContentAddressedStorage()
+
+
+def get_product_image_storage():
+    return _product_image_storage
+
+
+class HashingUploadMixin:
+    """Hashes uploaded files while they are received, exposing the digest as `file.sha256`."""
+
+    def new_file(self, *args, **kwargs):
+        self.sha256 = hashlib.sha256()
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        passed_on = super().receive_data_chunk(raw_data, start)
+        if passed_on is None:
+            # This handler kept the chunk rather than handing it to the next one.
+            self.sha256.update(raw_data)
+        return passed_on
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
@@ -0,0 +1,102 @@
+# api/streams.py
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .events import get_broker, group_buy_channel, user_channel
+
+HEARTBEAT_SECONDS = 15
+MAX_GROUP_BUY_CHANNELS = 50
+
+
+def authenticate_stream(request):
+    """
+    Resolves the JWT user from the Authorization header, or from `?token=`
+    since browser EventSource clients cannot set headers.
+    """
+    authenticator = JWTAuthentication()
+    try:
+        raw_token = request.GET.get('token')
+        if raw_token:
+            return authenticator.get_user(authenticator.get_validated_token(raw_token))
+        result = authenticator.authenticate(request)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+    finally:
+        # The stream makes no further queries; don't hold a database
+        # connection open for as long as the client stays connected.
+        connection.close()
+    return result[0] if result else None
+
+
+def format_event(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event['data'], cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(request):
+    """
+    Server-Sent Events stream of the user's new notifications, plus progress
+    of the group buys listed in `?group_buys=1,2,3`.
+
+    Meant to be served by the ASGI application: each open stream is a
+    coroutine parked on its queue, not a worker thread (see
+    StreamingASGIHandler), so idle connections are cheap. A comment line is sent every HEARTBEAT_SECONDS to keep proxies
+    from closing quiet connections.
+    """
+    user = await sync_to_async(authenticate_stream)(request)
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    group_buy_ids = [value for value in request.GET.get('group_buys', '').split(',') if value.isdigit()]
+    channels = [user_channel(user.pk)] + [
+        group_buy_channel(int(value)) for value in group_buy_ids[:MAX_GROUP_BUY_CHANNELS]
+    ]
+    broker = get_broker()
+
+    async def stream():
+        subscription = broker.subscribe(channels)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = await subscription.get(timeout=HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """
+    Django's ASGI handler, except that event streams do not get a thread of
+    their own.
+
+    ASGIHandler runs each request in a ThreadSensitiveContext, which gives it
+    a dedicated thread for its synchronous parts (middleware, authentication)
+    and keeps it until the response ends: one idle thread per open stream.
+    Streams instead share the default thread for those few short calls, so
+    an open stream costs a coroutine and a queue.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == reverse('notification-stream'):
+            await self.handle(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
@@ -0,0 +1,51 @@
+# api/tasks.py
+# Handlers of the background jobs queued with api.jobs.enqueue().
+
+from decimal import Decimal
+
+from .images import generate_variants
+from .jobs import job
+from .models import CustomUser, GroupBuy, GroupBuyParticipation, Order
+from .utils import notify_users
+
+GROUP_BUY_MILESTONES = {
+    'completed': "The group buy for {product} is full and now complete.",
+    'goal_reached': "The group buy for {product} reached its goal of {count} participants.",
+}
+
+
+@job()
+def notify_order_status(order_id, status):
+    # Skipped if the order is gone. Notifications are created exactly once:
+    # they commit with the job's deletion, or not at all.
+    user_id = Order.objects.filter(pk=order_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        notify_users([user_id], 'ORDER_STATUS', "Your order #{order_id} is now {status}.",
+                     related_object_id=order_id,
+                     context={'order_id': order_id, 'status': dict(Order.ORDER_STATUS)[status].lower()})
+
+
+@job()
+def notify_group_buy_milestone(group_buy_id, milestone):
+    group_buy = GroupBuy.objects.filter(pk=group_buy_id).values('min_participants', 'product__name').first()
+    if group_buy is not None:
+        notify_users(
+            GroupBuyParticipation.objects.filter(group_buy_id=group_buy_id).values_list('user_id', flat=True),
+            'GROUP_BUY', GROUP_BUY_MILESTONES[milestone], related_object_id=group_buy_id,
+            context={'product': group_buy['product__name'], 'count': group_buy['min_participants']},
+        )
+
+
+@job()
+def notify_price_drop(product_id, product_name, old_price, new_price):
+    notify_users(
+        CustomUser.objects.filter(wishlist__products=product_id),
+        'PRICE_DROP', "{product} on your wishlist dropped from {old_price} to {new_price}.",
+        related_object_id=product_id,
+        context={'product': product_name, 'old_price': Decimal(old_price), 'new_price': Decimal(new_price)},
+    )
+
+
+@job(atomic=False)
+def render_image_variants(image_id):
+    generate_variants(image_id)
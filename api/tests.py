@@ -0,0 +1,1028 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .events import DatabaseBroker, get_broker, group_buy_channel, user_channel
+from .exports import ProductExporter, stream_export
+from .facets import compute_facets
+from .images import collect_image_garbage
+from .imports import OTHER_SELLER, import_catalog, read_csv, read_jsonl
+from .jobs import Worker, claim, enqueue, execute
+from .models import (
+    CustomUser, Event, GroupBuy, GroupBuyParticipation, Job, Notification, NotificationCounter, Order, OrderItem,
+    Product, ProductImage, ProductInventory, ProductSize, SellerDailySales,
+)
+from .search import get_search_backend
+from .services import (
+    AnalyticsService, CartService, GroupBuyService, InsufficientStock, OrderService, ReviewStatsService,
+)
+from .utils import notify_users, query_budget
+
+
+def create_products(seller, count, sizes=()):
+    products = Product.objects.bulk_create([
+        Product(seller=seller, name=f'Product {number}', description='Test product', price=Decimal('10.00'),
+                category='shoes', brand='Acme', quantity=10)
+        for number in range(count)
+    ])
+    ProductImage.objects.bulk_create([
+        ProductImage(product=product, image=f'product_images/{product.pk}.jpg') for product in products
+    ])
+    ProductInventory.objects.bulk_create([
+        ProductInventory(product=product, size=size, quantity=5) for product in products for size in sizes
+    ])
+    return products
+
+
+def create_users(prefix, count):
+    return CustomUser.objects.bulk_create([
+        CustomUser(username=f'{prefix}{number:03}', email=f'{prefix}{number:03}@example.com')
+        for number in range(count)
+    ])
+
+
+def run_concurrently(func, arguments):
+    """
+    Calls func(argument) for every argument, each on its own thread and
+    database connection, all released at once. Returns what each call
+    returned or raised, in order.
+    """
+    results = [None] * len(arguments)
+    barrier = threading.Barrier(len(arguments))
+
+    def call(index, argument):
+        try:
+            barrier.wait()
+            results[index] = func(argument)
+        except Exception as exc:
+            results[index] = exc
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=call, args=item) for item in enumerate(arguments)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class ProductQueryBudgetTests(TestCase):
+    """Product reads cost a fixed number of queries, whatever the page size."""
+    QUERY_BUDGET = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com', password='secret')
+        sizes = ProductSize.objects.bulk_create([ProductSize(name='S'), ProductSize(name='M')])
+        cls.products = create_products(seller, 60, sizes)
+
+    def setUp(self):
+        # Cached responses would cost no queries at all.
+        cache.clear()
+        self.client = APIClient()
+
+    def test_list_budget_does_not_grow_with_page_size(self):
+        counts = {}
+        for page_size in (1, 50):
+            with query_budget(self.QUERY_BUDGET) as queries:
+                response = self.client.get('/api/products/', {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['results']), page_size)
+            counts[page_size] = len(queries.captured_queries)
+        self.assertEqual(counts[1], counts[50])
+
+    def test_detail_budget(self):
+        with query_budget(self.QUERY_BUDGET):
+            response = self.client.get(f'/api/products/{self.products[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['images']), 1)
+        self.assertEqual(len(response.data['inventory']), 2)
+
+
+class CursorPaginationTests(TestCase):
+    """Walking the product list page by page sees every product exactly once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        cls.products = create_products(cls.seller, 25)
+        # Identical timestamps leave the order to the id tie-breaker.
+        Product.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_pages_are_stable_while_products_are_added(self):
+        seen = []
+        url = '/api/products/?page_size=10'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(product['id'] for product in response.data['results'])
+            if len(seen) == 10:
+                # A newer product sorts before the cursor and must not shift later pages.
+                create_products(self.seller, 1)
+            url = response.data['next']
+        self.assertEqual(seen, sorted((product.pk for product in self.products), reverse=True))
+
+    def test_client_ordering_gets_the_id_tie_breaker(self):
+        seen, url = [], '/api/products/?page_size=7&ordering=price'
+        while url:
+            response = self.client.get(url)
+            seen.extend(product['id'] for product in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(seen, sorted(product.pk for product in self.products))
+
+    def test_previous_link_returns_the_same_page(self):
+        first = self.client.get('/api/products/', {'page_size': 10}).data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([product['id'] for product in back['results']],
+                         [product['id'] for product in first['results']])
+
+
+class ResponseCacheTests(TestCase):
+    """Cached anonymous responses are evicted when a write through the API commits, and not before."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        cls.product = create_products(cls.seller, 1)[0]
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+
+    def test_next_anonymous_read_sees_the_write(self):
+        path = f'/api/products/{self.product.pk}/'
+        self.assertEqual(self.anonymous.get(path).data['price'], '10.00')
+        self.assertEqual(self.anonymous.get('/api/products/').data['results'][0]['price'], '10.00')
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(path, {'price': '7.50'}, format='json')
+            self.assertEqual(response.status_code, 200)
+        # Until the write commits, other readers may still see (and cache) the old row.
+        self.assertEqual(self.anonymous.get(path).data['price'], '10.00')
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.anonymous.get(path).data['price'], '7.50')
+        self.assertEqual(self.anonymous.get('/api/products/').data['results'][0]['price'], '7.50')
+
+    def test_quantity_edit_syncs_in_stock(self):
+        path = f'/api/products/{self.product.pk}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(path, {'quantity': 0}, format='json')
+        self.assertFalse(response.data['in_stock'])
+        self.assertFalse(self.anonymous.get(path).data['in_stock'])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(path, {'quantity': 3}, format='json')
+        self.assertTrue(response.data['in_stock'])
+        self.assertTrue(Product.objects.get(pk=self.product.pk).in_stock)
+
+    def test_review_write_evicts_product_and_review_lists(self):
+        reviewer = CustomUser.objects.create_user(username='reviewer', email='reviewer@example.com')
+        self.client.force_authenticate(reviewer)
+        self.assertEqual(self.anonymous.get('/api/reviews/').data['results'], [])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/reviews/', {'product': self.product.pk, 'rating': 4,
+                                                          'comment': 'Good'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(len(self.anonymous.get('/api/reviews/').data['results']), 1)
+        self.assertEqual(self.anonymous.get(f'/api/products/{self.product.pk}/').data['review_count'], 1)
+
+
+class ProductSearchTests(TestCase):
+    """Ranked search runs the full-text match once, however many products match."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        Product.objects.bulk_create([
+            Product(seller=seller, name=f'Item {number}', description='Trail shoe', price=Decimal('10.00'),
+                    category='shoes', brand='Acme', quantity=10)
+            for number in range(3000)
+        ])
+        cls.best = Product.objects.create(seller=seller, name='Trail shoe', description='Shoe', price=Decimal('10.00'),
+                                          category='shoes', brand='Acme', quantity=10)
+
+    def test_match_is_not_correlated(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('The plan checked is the SQLite FTS5 one.')
+        backend = get_search_backend()
+        products = backend.search(Product.objects.all(), 'shoe').order_by('search_rank', '-id')[:20]
+        sql, params = products.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertEqual(len([step for step in plan if backend.table in step]), 1, plan)
+        self.assertFalse([step for step in plan if 'CORRELATED' in step], plan)
+
+    def test_ranked_pages(self):
+        client = APIClient()
+        started = time.perf_counter()
+        response = client.get('/api/products/search/', {'q': 'shoe', 'page_size': 50})
+        self.assertLess(time.perf_counter() - started, 5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['id'], self.best.pk)
+        second = client.get(response.data['next']).data['results']
+        ids = [product['id'] for product in response.data['results'] + second]
+        self.assertEqual(len(set(ids)), 100)
+
+
+class ProductFacetTests(TestCase):
+    """?facets=true counts the whole filtered result set in one query, and product writes refresh the counts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, name=f'Product {number}', description='Test product',
+                    price=Decimal(price), category=category, brand=brand, in_stock=in_stock, quantity=1)
+            for number, (price, category, brand, in_stock) in enumerate([
+                ('10.00', 'shoes', 'Acme', True),
+                ('30.00', 'shoes', 'Acme', False),
+                ('300.00', 'shoes', 'Zeta', True),
+                ('10.00', 'hats', 'Acme', True),
+            ])
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def facets(self, **params):
+        response = self.client.get('/api/products/', {'facets': 'true', 'page_size': 1, **params})
+        self.assertEqual(response.status_code, 200)
+        return {field: {item['value']: item['count'] for item in counts}
+                for field, counts in response.data['facets'].items()}
+
+    def test_counts_cover_every_page(self):
+        with query_budget(1):
+            facets = compute_facets(Product.objects.filter(category='shoes'))
+        self.assertEqual({item['value']: item['count'] for item in facets['brand']}, {'Acme': 2, 'Zeta': 1})
+
+        facets = self.facets(category='shoes')
+        self.assertEqual(facets['category'], {'shoes': 3})
+        self.assertEqual(facets['brand'], {'Acme': 2, 'Zeta': 1})
+        self.assertEqual(facets['in_stock'], {True: 2, False: 1})
+        self.assertEqual(facets['price_band'], {'0-25': 1, '25-50': 1, '250+': 1})
+
+    def test_product_writes_refresh_cached_counts(self):
+        self.assertEqual(self.facets(category='hats')['brand'], {'Acme': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(seller=self.seller, name='Cap', description='Cap', price=Decimal('5.00'),
+                                   category='hats', brand='Zeta', quantity=1)
+        self.assertEqual(self.facets(category='hats')['brand'], {'Acme': 1, 'Zeta': 1})
+        self.assertEqual(self.facets()['category'], {'shoes': 3, 'hats': 2})
+
+
+class CatalogImportTests(TestCase):
+    """Imports upsert on barcode, keep the columns a row leaves out and report bad rows by line."""
+
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+
+    def import_csv(self, text, seller=None):
+        return import_catalog(seller or self.seller, read_csv(io.BytesIO(text.encode())))
+
+    def test_update_keeps_omitted_columns(self):
+        summary = self.import_csv(
+            'barcode,name,description,price,category,brand,quantity,sizes,inventory\n'
+            'A-1,Boot,Leather boot,49.90,shoes,Acme,3,S|M,S=1|M=2\n'
+            'A-2,Sandal,Summer sandal,19.00,shoes,Acme,0,,\n'
+        )
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (2, 0, 0))
+        boot = Product.objects.get(barcode='A-1')
+        self.assertEqual((boot.sizes, boot.in_stock, boot.seller), (['S', 'M'], True, self.seller))
+        self.assertFalse(Product.objects.get(barcode='A-2').in_stock)
+
+        summary = self.import_csv('barcode,price,name,inventory\nA-1,39.90,,M=0\n')
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (0, 1, 0))
+        boot.refresh_from_db()
+        self.assertEqual((boot.name, boot.price, boot.sizes, boot.quantity), ('Boot', Decimal('39.90'), ['S', 'M'], 3))
+        inventory = ProductInventory.objects.filter(product=boot).values_list('size__name', 'quantity')
+        self.assertEqual(dict(inventory), {'S': 1, 'M': 0})
+        self.assertEqual(get_search_backend().filter(Product.objects.all(), 'boot').get(), boot)
+
+    def test_other_sellers_barcodes_are_refused(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com')
+        self.import_csv('barcode,name,description,price,category,brand,quantity\nB-1,Hat,Hat,5,hats,Acme,1\n', other)
+
+        summary = self.import_csv(
+            'barcode,name,description,price,category,brand,quantity\n'
+            'B-1,Stolen,Hat,1,hats,Acme,1\n'
+            'B-2,Cap,Cap,5,hats,Acme,1\n'
+        )
+        self.assertEqual((summary['created'], summary['updated'], summary['failed']), (1, 0, 1))
+        self.assertEqual(summary['errors'], [{'line': 2, 'errors': {'barcode': [OTHER_SELLER]}}])
+        self.assertEqual(Product.objects.get(barcode='B-1').name, 'Hat')
+
+    def test_invalid_rows_report_field_errors(self):
+        summary = self.import_csv(
+            'barcode,name,description,price,category,brand,quantity,inventory\n'
+            'C-1,Boot,Boot,cheap,shoes,Acme,1,\n'
+            'C-2,Boot,,10,shoes,Acme,1,\n'
+            'C-3,Boot,Boot,10,shoes,Acme,-1,S=-2\n'
+            'C-4,Boot,Boot,10,shoes,Acme,1,\n'
+            'C-4,Boot,Boot,12,shoes,Acme,1,\n'
+        )
+        self.assertEqual((summary['created'], summary['failed']), (1, 4))
+        errors = {error['line']: error['errors'] for error in summary['errors']}
+        self.assertEqual(errors[2]['price'], ['“cheap” value must be a decimal number.'])
+        self.assertEqual(errors[3], {'description': ['This field is required.']})
+        self.assertEqual(set(errors[4]), {'quantity', 'inventory'})
+        self.assertEqual(errors[5], {'barcode': ['Superseded by a later row with the same barcode.']})
+        self.assertEqual(Product.objects.get(barcode='C-4').price, Decimal('12.00'))
+
+
+class ProductExportTests(TestCase):
+    """Exports stream every product in keyset chunks, and the importer reads them back as they are."""
+
+    def setUp(self):
+        self.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        import_catalog(self.seller, read_csv(io.BytesIO(
+            b'barcode,name,description,price,category,brand,quantity,sizes,colors,inventory\n'
+            b'A-1,Boot,"Leather, brown",49.90,shoes,Acme,3,S|M,brown,S=1|M=2\n'
+            b'A-2,Sandal,Summer sandal,19.00,shoes,Acme,0,,,\n'
+        )))
+
+    def download(self, **params):
+        response = self.client.get('/api/products/export/', params)
+        self.assertEqual(response.status_code, 200)
+        data = b''.join(response.streaming_content)
+        return gzip.decompress(data) if params.get('gzip') else data
+
+    def test_gzipped_csv_round_trips_through_the_importer(self):
+        data = self.download(file_format='csv', gzip='true')
+        Product.objects.update(name='Renamed', sizes=[], price=Decimal('1.00'))
+        ProductInventory.objects.update(quantity=9)
+
+        summary = import_catalog(self.seller, read_csv(io.BytesIO(data)))
+        self.assertEqual((summary['updated'], summary['failed']), (2, 0))
+        boot = Product.objects.get(barcode='A-1')
+        self.assertEqual((boot.name, boot.description, boot.price, boot.sizes, boot.colors),
+                         ('Boot', 'Leather, brown', Decimal('49.90'), ['S', 'M'], ['brown']))
+        inventory = ProductInventory.objects.filter(product=boot).values_list('size__name', 'quantity')
+        self.assertEqual(dict(inventory), {'S': 1, 'M': 2})
+
+    def test_ndjson_covers_own_products_in_chunks(self):
+        create_products(CustomUser.objects.create_user(username='other', email='other@example.com'), 3)
+        chunks = list(stream_export(ProductExporter(), Product.objects.all(), 'ndjson', chunk_size=2))
+        self.assertEqual(len(chunks), 3)
+        records = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([record['id'] for record in records],
+                         list(Product.objects.order_by('pk').values_list('pk', flat=True)))
+
+        data = self.download(file_format='ndjson')
+        records = [json.loads(line) for line in data.splitlines()]
+        self.assertEqual([record['barcode'] for record in records], ['A-1', 'A-2'])
+        self.assertEqual(records[0]['inventory'], {'S': 1, 'M': 2})
+        summary = import_catalog(self.seller, read_jsonl(io.BytesIO(data)))
+        self.assertEqual((summary['updated'], summary['failed']), (2, 0))
+        self.assertEqual(self.client.get('/api/products/export/', {'file_format': 'xml'}).status_code, 400)
+
+
+class ImageStorageTests(TestCase):
+    """Identical uploads share one content-addressed file, deleted with its last reference."""
+
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=self.enterContext(tempfile.TemporaryDirectory())))
+        self.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.seller)
+        self.products = create_products(self.seller, 2)
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), 'red').save(buffer, 'PNG')
+        self.png = buffer.getvalue()
+
+    def upload(self, product):
+        response = self.client.post(f'/api/products/{product.pk}/add_image/',
+                                    {'image': SimpleUploadedFile('Photo.PNG', self.png)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return ProductImage.objects.get(pk=response.data['id'])
+
+    def test_identical_uploads_are_stored_once(self):
+        digest = hashlib.sha256(self.png).hexdigest()
+        first = self.upload(self.products[0])
+        # Larger uploads are spooled to a temporary file by the hashing handler and moved into place.
+        with override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0):
+            second = self.upload(self.products[1])
+        self.assertEqual(first.image.name, f'product_images/{digest[:2]}/{digest[2:4]}/{digest}.png')
+        self.assertEqual(second.image.name, first.image.name)
+        stored = [name for _, _, names in os.walk(first.image.storage.location) for name in names]
+        self.assertEqual(stored, [f'{digest}.png'])
+
+        with mock.patch('api.images.GARBAGE_GRACE_SECONDS', 0):
+            with self.captureOnCommitCallbacks(execute=True):
+                first.delete()
+            self.assertTrue(first.image.storage.exists(first.image.name))
+            with self.captureOnCommitCallbacks(execute=True):
+                second.delete()
+            self.assertFalse(first.image.storage.exists(first.image.name))
+
+    def test_garbage_collection_removes_orphans(self):
+        kept = self.upload(self.products[0])
+        storage = kept.image.storage
+        orphan = storage.save('product_images/orphan.png', ContentFile(b'orphan'))
+        spool = storage.save('product_images/tmp/abandoned.upload', ContentFile(b'partial'))
+        self.assertNotEqual(orphan, kept.image.name)
+
+        self.assertEqual(collect_image_garbage(), [])
+        self.assertEqual(sorted(collect_image_garbage(grace_seconds=0, dry_run=True)), sorted([orphan, spool]))
+        self.assertTrue(storage.exists(orphan))
+        self.assertEqual(sorted(collect_image_garbage(grace_seconds=0)), sorted([orphan, spool]))
+        self.assertFalse(storage.exists(orphan) or storage.exists(spool))
+        self.assertTrue(storage.exists(kept.image.name))
+
+
+class MediaServingTests(TestCase):
+    """Media responses carry validators, answer revalidations with 304 and single ranges with 206."""
+
+    def setUp(self):
+        self.media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(override_settings(MEDIA_ROOT=self.media_root, MEDIA_ACCEL=None))
+        self.data = bytes(range(100))
+        self.digest = hashlib.sha256(self.data).hexdigest()
+        self.path = f'product_images/{self.digest[:2]}/{self.digest[2:4]}/{self.digest}.jpg'
+        for path in (self.path, 'product_images/variants/plain.jpg', 'product_images/tmp/spool.upload'):
+            os.makedirs(os.path.join(self.media_root, os.path.dirname(path)), exist_ok=True)
+            with open(os.path.join(self.media_root, path), 'wb') as file:
+                file.write(self.data)
+
+    def get(self, path, **headers):
+        return self.client.get(f'/media/{path}', headers=headers)
+
+    def test_full_response_and_revalidation(self):
+        response = self.get(self.path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['ETag'], f'"{self.digest}"')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        not_modified = self.get(self.path, if_none_match=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual((not_modified['ETag'], not_modified['Cache-Control']),
+                         (response['ETag'], response['Cache-Control']))
+
+        plain = self.get('product_images/variants/plain.jpg')
+        self.assertEqual(plain['Cache-Control'], 'public, max-age=3600')
+        plain.close()
+        self.assertEqual(self.get('product_images/variants/plain.jpg',
+                                  if_modified_since=plain['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(self.path, if_match='"stale"').status_code, 412)
+
+    def test_ranges(self):
+        response = self.get(self.path, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+
+        suffix = self.get(self.path, range='bytes=-5')
+        self.assertEqual(b''.join(suffix.streaming_content), self.data[-5:])
+
+        unsatisfiable = self.get(self.path, range='bytes=100-')
+        self.assertEqual((unsatisfiable.status_code, unsatisfiable['Content-Range']), (416, 'bytes */100'))
+
+        # A range is only applied while If-Range still matches the file.
+        current = self.get(self.path, range='bytes=0-9', if_range=f'"{self.digest}"')
+        self.assertEqual(current.status_code, 206)
+        current.close()
+        stale = self.get(self.path, range='bytes=0-9', if_range='"stale"')
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(b''.join(stale.streaming_content), self.data)
+
+    def test_spools_and_paths_outside_media_are_not_served(self):
+        self.assertEqual(self.get('product_images/tmp/spool.upload').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+        self.assertEqual(self.get('product_images').status_code, 404)
+
+
+class ReviewStatsTests(TestCase):
+    """Product rating, review_count and histogram follow reviews as they are written, edited and deleted."""
+
+    def setUp(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.product, self.other = create_products(seller, 2)
+        self.reviewers = create_users('reviewer', 3)
+        self.client = APIClient()
+
+    def review(self, user, rating, product=None):
+        self.client.force_authenticate(user)
+        response = self.client.post('/api/reviews/', {'product': (product or self.product).pk, 'rating': rating,
+                                                      'comment': 'Review'}, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def statistics(self, product=None):
+        product = Product.objects.get(pk=(product or self.product).pk)
+        return product.rating, product.review_count, [getattr(product, f'rating_{star}_count') for star in range(1, 6)]
+
+    def test_edit_and_delete_update_the_statistics(self):
+        first = self.review(self.reviewers[0], 5)
+        self.review(self.reviewers[1], 4)
+        self.review(self.reviewers[2], 4)
+        self.assertEqual(self.statistics(), (Decimal('4.33'), 3, [0, 0, 0, 2, 1]))
+
+        self.client.force_authenticate(self.reviewers[0])
+        response = self.client.patch(f'/api/reviews/{first}/', {'rating': 1}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.statistics(), (Decimal('3.00'), 3, [1, 0, 0, 2, 0]))
+
+        # Moving a review to another product moves its rating with it.
+        response = self.client.patch(f'/api/reviews/{first}/', {'product': self.other.pk}, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.statistics(), (Decimal('4.00'), 2, [0, 0, 0, 2, 0]))
+        self.assertEqual(self.statistics(self.other), (Decimal('1.00'), 1, [1, 0, 0, 0, 0]))
+
+        self.assertEqual(self.client.delete(f'/api/reviews/{first}/').status_code, 204)
+        self.assertEqual(self.statistics(self.other), (Decimal('0.00'), 0, [0, 0, 0, 0, 0]))
+
+    def test_recompute_repairs_drift(self):
+        self.review(self.reviewers[0], 2)
+        self.review(self.reviewers[1], 3)
+        Product.objects.filter(pk=self.product.pk).update(rating=5, review_count=9, rating_5_count=9)
+        self.assertEqual(ReviewStatsService.recompute(chunk_size=1), (2, 1))
+        self.assertEqual(self.statistics(), (Decimal('2.50'), 2, [0, 1, 1, 0, 0]))
+
+
+@override_settings(ORDER_STATISTICS_CACHE_TIMEOUT=0)
+class OrderStatisticsTests(TestCase):
+    """Per-status counts and revenue come from one aggregate query, for buyers and for sellers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, cls.other_seller = create_users('seller', 2)
+        cls.buyer = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        product, other_product = create_products(cls.seller, 1)[0], create_products(cls.other_seller, 1)[0]
+        for status, lines in [('pending', [product, other_product]), ('cancelled', [product]),
+                              ('delivered', [other_product])]:
+            order = Order.objects.create(user=cls.buyer, status=status, total_price=Decimal('10.00') * len(lines))
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=line, seller_id=line.seller_id, quantity=1, price=Decimal('10.00'))
+                for line in lines
+            ])
+        # An order from a month ago, outside the dated range below.
+        old = Order.objects.create(user=cls.buyer, status='delivered', total_price=Decimal('10.00'))
+        OrderItem.objects.create(order=old, product=product, seller=cls.seller, quantity=1, price=Decimal('10.00'))
+        Order.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=30))
+
+    def summary(self, stats):
+        return {status: (entry['count'], entry['revenue']) for status, entry in stats['statuses'].items()
+                if entry['count']}
+
+    def test_buyer_statistics(self):
+        with self.assertNumQueries(1):
+            stats = OrderService.get_order_statistics(self.buyer)
+        self.assertEqual(self.summary(stats), {
+            'pending': (1, Decimal('20.00')), 'cancelled': (1, Decimal('10.00')), 'delivered': (2, Decimal('20.00')),
+        })
+        self.assertEqual((stats['total_orders'], stats['total_revenue']), (4, Decimal('40.00')))
+
+    def test_seller_statistics_cover_only_their_lines(self):
+        client = APIClient()
+        client.force_authenticate(self.seller)
+        response = client.get('/api/orders/statistics/', {'as': 'seller'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.summary(response.data), {
+            'pending': (1, Decimal('10.00')), 'cancelled': (1, Decimal('10.00')), 'delivered': (1, Decimal('10.00')),
+        })
+        self.assertEqual(response.data['total_revenue'], Decimal('20.00'))
+
+        today = timezone.localdate().isoformat()
+        response = client.get('/api/orders/statistics/', {'as': 'seller', 'start': today, 'end': today})
+        self.assertEqual(response.data['total_orders'], 2)
+        response = client.get('/api/orders/statistics/', {'as': 'seller', 'start': today, 'end': '2000-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderSearchTests(TestCase):
+    """Seller order search finds every matching buyer through index seeks."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        product = create_products(cls.seller, 1)[0]
+        # Many users share the prefix; only the last one bought from the seller.
+        create_users('al', 120)
+        buyer = CustomUser.objects.create_user(username='alz', email='zed@example.com')
+        cls.order = Order.objects.create(user=buyer, total_price=Decimal('10.00'), tracking_number='TRK-1')
+        OrderItem.objects.create(order=cls.order, product=product, seller=cls.seller, quantity=1,
+                                 price=Decimal('10.00'))
+
+    def search(self, query):
+        return list(OrderService.search_orders(self.seller, query).values_list('pk', 'search_rank'))
+
+    def test_buyer_prefix_matches_beyond_other_users_with_the_prefix(self):
+        self.assertEqual(self.search('al'), [(self.order.pk, 1)])
+        self.assertEqual(self.search('zed@'), [(self.order.pk, 2)])
+        self.assertEqual(self.search('Zed@'), [(self.order.pk, 2)])
+        self.assertEqual(self.search('Al'), [])
+        self.assertEqual(self.search(f'#{self.order.pk}'), [(self.order.pk, 0)])
+        self.assertEqual(self.search('TRK-1'), [(self.order.pk, 0)])
+        self.assertEqual(self.search('al000'), [])
+
+    def test_query_plan_uses_indexes_only(self):
+        sql, params = OrderService.search_orders(self.seller, 'Al').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertFalse([step for step in plan if step.startswith('SCAN')], plan)
+        self.assertTrue(any('api_order USING INTEGER PRIMARY KEY' in step for step in plan), plan)
+        self.assertTrue(any('api_customuser' in step and '(username>? AND username<?)' in step for step in plan), plan)
+        self.assertTrue(any('api_customuser' in step and '(email>? AND email<?)' in step for step in plan), plan)
+
+
+class NotificationInboxTests(TestCase):
+    """The unread counter follows notifications as they arrive and are read."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='reader', email='reader@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        notify_users([self.user.pk], 'ORDER_STATUS', 'Update')
+        notify_users([self.user.pk], 'ORDER_STATUS', 'Update')
+        notify_users([self.user.pk], 'ORDER_STATUS', 'Update')
+
+    def unread_count(self):
+        return self.client.get('/api/notifications/unread_count/').data['unread_count']
+
+    def test_counter_follows_mark_as_read(self):
+        self.assertEqual(self.unread_count(), 3)
+        notification = Notification.objects.filter(user=self.user).first()
+        for _ in range(2):
+            response = self.client.post(f'/api/notifications/{notification.pk}/mark_as_read/')
+            self.assertEqual(response.status_code, 200)
+            # Marking an already read notification again does not count twice.
+            self.assertEqual(self.unread_count(), 2)
+        unread = self.client.get('/api/notifications/', {'is_read': 'false'}).data['results']
+        self.assertEqual(len(unread), 2)
+
+        self.client.post('/api/notifications/mark_all_as_read/')
+        self.assertEqual(self.unread_count(), 0)
+        notify_users([self.user.pk], 'ORDER_STATUS', 'Update')
+        self.assertEqual(self.unread_count(), 1)
+
+    def test_counter_is_rebuilt_when_missing(self):
+        NotificationCounter.objects.filter(user=self.user).delete()
+        self.assertEqual(self.unread_count(), 3)
+        self.client.post('/api/notifications/mark_all_as_read/')
+        self.assertEqual(self.unread_count(), 0)
+
+
+class JobExecutionTests(TestCase):
+    """An atomic job's database changes commit exactly once, with the job's deletion."""
+
+    def setUp(self):
+        buyer = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        self.order = Order.objects.create(user=buyer, total_price=Decimal('10.00'))
+        enqueue('notify_order_status', order_id=self.order.pk, status='shipped')
+
+    def test_completed_job_is_deleted_with_its_changes_committed(self):
+        self.assertTrue(execute(claim('worker-1', visibility_timeout=300)))
+        self.assertEqual(Notification.objects.filter(related_object_id=self.order.pk).count(), 1)
+        self.assertFalse(Job.objects.exists())
+
+    def test_job_taken_over_by_another_worker_is_rolled_back(self):
+        job = claim('worker-1', visibility_timeout=300)
+        # worker-1 overran its visibility timeout and worker-2 claimed the job.
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now())
+        self.assertEqual(claim('worker-2', visibility_timeout=300).pk, job.pk)
+
+        self.assertFalse(execute(job))
+        self.assertFalse(Notification.objects.exists())
+        taken_over = Job.objects.get(pk=job.pk)
+        self.assertEqual((taken_over.status, taken_over.locked_by), ('running', 'worker-2'))
+
+# Events stay in memory, so the threads contend only for the rows under test.
+
+
+class OrderDeletionTests(TestCase):
+    """Deleting an order gives its stock and sales back, once; the API only allows cancelling."""
+
+    def setUp(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.buyer = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        self.product = create_products(seller, 1)[0]
+        self.order = OrderService.create_order(self.buyer, [{'product': self.product.pk, 'quantity': 3}])
+        self.sales = SellerDailySales.objects.get(seller=seller)
+
+    def assertReleased(self):
+        self.product.refresh_from_db()
+        self.sales.refresh_from_db()
+        self.assertEqual(self.product.quantity, 10)
+        self.assertEqual((self.sales.orders, self.sales.units, self.sales.revenue), (0, 0, Decimal('0')))
+
+    def test_api_refuses_delete(self):
+        client = APIClient()
+        client.force_authenticate(self.buyer)
+        response = client.delete(f'/api/orders/{self.order.pk}/')
+        self.assertEqual(response.status_code, 405)
+        self.assertTrue(Order.objects.filter(pk=self.order.pk).exists())
+
+    def test_delete_releases_stock_and_sales(self):
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 7)
+        self.order.delete()
+        self.assertReleased()
+
+    def test_delete_after_cancel_releases_once(self):
+        OrderService.update_order_status(self.order.pk, 'cancelled')
+        Order.objects.filter(pk=self.order.pk).delete()
+        self.assertReleased()
+
+
+class SalesSeriesTests(TestCase):
+    """Sales over time are summed from the daily rollups and served from the cache once computed."""
+
+    def setUp(self):
+        cache.clear()
+        self.sellers = create_users('seller', 20)
+        today = timezone.localdate()
+        SellerDailySales.objects.bulk_create([
+            SellerDailySales(seller=seller, date=today - timedelta(days=days), orders=1, units=2,
+                             revenue=Decimal('5.00'))
+            for seller in self.sellers for days in range(1, 15)
+        ])
+
+    def test_cached_series_reads_the_version_once(self):
+        seller_ids = [seller.pk for seller in self.sellers]
+        series = AnalyticsService.get_sales_over_time(seller_ids, interval='day')
+        self.assertEqual(series[seller_ids[0]][-2]['revenue'], Decimal('5.00'))
+        with mock.patch.object(cache, 'get_or_set', wraps=cache.get_or_set) as get_or_set, \
+                self.assertNumQueries(1):
+            self.assertEqual(AnalyticsService.get_sales_over_time(seller_ids, interval='day'), series)
+        # Only the open bucket (today) is read from the database.
+        self.assertEqual(get_or_set.call_count, 1)
+
+
+class GroupBuyLeaveTests(TestCase):
+    """Participants can leave an active group buy until its end date, and not after."""
+
+    def setUp(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.user = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        self.group_buy = GroupBuy.objects.create(
+            product=create_products(seller, 1)[0], discount_price=Decimal('8.00'), min_participants=2,
+            max_participants=5, end_date=timezone.now() + timedelta(days=1),
+        )
+        GroupBuyService.join(self.group_buy.pk, self.user)
+
+    def test_leave_before_end_date(self):
+        GroupBuyService.leave(self.group_buy.pk, self.user)
+        self.group_buy.refresh_from_db()
+        self.assertEqual(self.group_buy.current_participants, 0)
+        self.assertFalse(GroupBuyParticipation.objects.filter(group_buy=self.group_buy).exists())
+
+    def test_leave_after_end_date_is_refused(self):
+        GroupBuy.objects.filter(pk=self.group_buy.pk).update(end_date=timezone.now() - timedelta(minutes=1))
+        with self.assertRaisesMessage(ValueError, 'This group buy is not active'):
+            GroupBuyService.leave(self.group_buy.pk, self.user)
+        self.group_buy.refresh_from_db()
+        self.assertEqual(self.group_buy.current_participants, 1)
+        self.assertTrue(GroupBuyParticipation.objects.filter(group_buy=self.group_buy).exists())
+
+
+class CartTests(TestCase):
+    """Cart edits and merges apply in batches; checkout turns the cart into one order or leaves it untouched."""
+
+    def setUp(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        self.buyer = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        self.small, self.medium = ProductSize.objects.bulk_create([ProductSize(name='S'), ProductSize(name='M')])
+        self.shoe, self.hat = create_products(seller, 2, sizes=[self.small])
+        self.group_buy = GroupBuy.objects.create(
+            product=self.hat, discount_price=Decimal('8.00'), min_participants=2, max_participants=5,
+            end_date=timezone.now() + timedelta(days=1),
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.buyer)
+
+    def lines(self, cart):
+        return {(item['product'], item['size']): item['quantity'] for item in cart['items']}
+
+    def test_merge_adds_to_existing_lines_and_skips_missing(self):
+        response = self.client.post('/api/cart/items/', {'items': [
+            {'product': self.shoe.pk, 'size': self.small.pk, 'quantity': 1},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post('/api/cart/merge/', [
+            {'product': self.shoe.pk, 'size': self.small.pk, 'quantity': 2},
+            {'product': self.hat.pk, 'quantity': 1},
+            {'product': self.hat.pk, 'size': self.medium.pk, 'quantity': 1},
+            {'product': 999999, 'quantity': 1},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['skipped'], 2)
+        self.assertEqual(self.lines(response.data), {(self.shoe.pk, self.small.pk): 3, (self.hat.pk, None): 1})
+
+        with query_budget(2):
+            cart = CartService.get_cart(self.buyer)
+        self.assertEqual((cart['total_quantity'], cart['subtotal'], cart['in_stock']), (4, Decimal('40.00'), True))
+        hat = next(item for item in cart['items'] if item.product_id == self.hat.pk)
+        self.assertEqual((hat.group_buy, hat.group_buy_price), (self.group_buy.pk, Decimal('8.00')))
+
+        response = self.client.patch('/api/cart/items/', [
+            {'product': self.shoe.pk, 'size': self.small.pk, 'quantity': 6},
+            {'product': self.hat.pk, 'quantity': 0},
+        ], format='json')
+        self.assertEqual(self.lines(response.data), {(self.shoe.pk, self.small.pk): 6})
+        # Only 5 of size S are stocked.
+        self.assertFalse(response.data['in_stock'])
+
+    def test_checkout_creates_order_and_empties_cart(self):
+        CartService.add_items(self.buyer, [
+            {'product': self.shoe.pk, 'size': self.small.pk, 'quantity': 2},
+            {'product': self.hat.pk, 'quantity': 1},
+        ])
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual((order.user, order.total_price, order.items.count()), (self.buyer, Decimal('30.00'), 2))
+        self.assertEqual(ProductInventory.objects.get(product=self.shoe, size=self.small).quantity, 3)
+        self.assertEqual(CartService.get_cart(self.buyer)['item_count'], 0)
+        self.assertEqual(self.client.post('/api/cart/checkout/').status_code, 400)
+
+    def test_checkout_leaves_cart_when_stock_is_short(self):
+        CartService.add_items(self.buyer, [
+            {'product': self.shoe.pk, 'size': self.small.pk, 'quantity': 6},
+            {'product': self.hat.pk, 'quantity': 1},
+        ])
+        response = self.client.post('/api/cart/checkout/')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.data['product'], response.data['size']), (self.shoe.pk, self.small.pk))
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartService.get_cart(self.buyer)['item_count'], 2)
+        self.assertEqual(Product.objects.get(pk=self.hat.pk).quantity, 10)
+
+
+@override_settings(EVENT_BROKER='api.events.InProcessBroker')
+class ConcurrencyTestCase(TransactionTestCase):
+    """Runs hundreds of writers at once against the file-backed test database."""
+    LOCK_TIMEOUT = 120
+
+    def setUp(self):
+        # Every thread opens its connection from these settings. Hundreds of
+        # queued writers wait longer for SQLite's write lock than a request should.
+        options = connection.settings_dict['OPTIONS']
+        self.addCleanup(options.__setitem__, 'timeout', options.get('timeout', 5))
+        options['timeout'] = self.LOCK_TIMEOUT
+
+
+class ConcurrentOrderTests(ConcurrencyTestCase):
+    """Stock is never oversold, however many buyers race for it."""
+    STOCK = 100
+    BUYERS = 300
+
+    def test_concurrent_buyers_take_exactly_the_stock(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        sizes = ProductSize.objects.bulk_create([ProductSize(name='S')])
+        product = create_products(seller, 1)[0]
+        Product.objects.filter(pk=product.pk).update(quantity=self.STOCK)
+        ProductInventory.objects.create(product=product, size=sizes[0], quantity=self.STOCK)
+        buyers = create_users('buyer', self.BUYERS)
+
+        results = run_concurrently(
+            lambda buyer: OrderService.create_order(
+                buyer, [{'product': product.pk, 'size': sizes[0].pk, 'quantity': 1}]
+            ),
+            buyers,
+        )
+
+        orders = [result for result in results if isinstance(result, Order)]
+        refused = [result for result in results if isinstance(result, InsufficientStock)]
+        self.assertEqual(len(orders), self.STOCK)
+        self.assertEqual(len(refused), self.BUYERS - self.STOCK)
+        self.assertEqual(Order.objects.count(), self.STOCK)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity, 0)
+        self.assertFalse(product.in_stock)
+        self.assertEqual(ProductInventory.objects.get(product=product).quantity, 0)
+
+
+class ConcurrentGroupBuyJoinTests(ConcurrencyTestCase):
+    """A group buy fills up exactly once, however many users join at the same moment."""
+    SEATS = 250
+    JOINERS = 1000
+
+    def test_simultaneous_joins_fill_exactly_the_seats(self):
+        seller = CustomUser.objects.create_user(username='seller', email='seller@example.com')
+        group_buy = GroupBuy.objects.create(
+            product=create_products(seller, 1)[0], discount_price=Decimal('8.00'), min_participants=100,
+            max_participants=self.SEATS, end_date=timezone.now() + timedelta(days=1),
+        )
+        joiners = create_users('joiner', self.JOINERS)
+
+        results = run_concurrently(lambda user: GroupBuyService.join(group_buy.pk, user), joiners)
+
+        joined = [result for result in results if isinstance(result, GroupBuyParticipation)]
+        refused = [result for result in results if isinstance(result, ValueError)]
+        self.assertEqual(len(joined), self.SEATS)
+        self.assertEqual(len(refused), self.JOINERS - self.SEATS)
+        group_buy.refresh_from_db()
+        self.assertEqual(group_buy.current_participants, group_buy.max_participants)
+        self.assertEqual(group_buy.status, 'completed')
+        self.assertEqual(GroupBuyParticipation.objects.filter(group_buy=group_buy).count(), self.SEATS)
+        # Each milestone is announced once.
+        self.assertEqual(
+            sorted(job.payload['milestone'] for job in Job.objects.filter(name='notify_group_buy_milestone')),
+            ['completed', 'goal_reached'],
+        )
+
+
+@override_settings(EVENT_POLL_INTERVAL=0.05)
+class DatabaseBrokerTests(TransactionTestCase):
+    """Events published by one process reach the streams of another."""
+
+    def test_events_published_elsewhere_reach_subscribers(self):
+        serving, publishing = DatabaseBroker(), DatabaseBroker()
+
+        async def listen():
+            subscription = serving.subscribe([user_channel(1), group_buy_channel(2)])
+            try:
+                # Let the poller note where the table ends before publishing.
+                await asyncio.sleep(0.2)
+                await asyncio.to_thread(run_concurrently, publishing.publish_many, [[
+                    (user_channel(1), {'event': 'notification', 'data': {'id': 10}}),
+                    (user_channel(3), {'event': 'notification', 'data': {'id': 11}}),
+                    (group_buy_channel(2), {'event': 'group_buy', 'data': {'id': 2, 'status': 'completed'}}),
+                ]])
+                return [await subscription.get(timeout=5), await subscription.get(timeout=5)]
+            finally:
+                serving.unsubscribe(subscription)
+
+        events = asyncio.run(listen())
+        self.assertEqual(events, [
+            {'event': 'notification', 'data': {'id': 10}},
+            {'event': 'group_buy', 'data': {'id': 2, 'status': 'completed'}},
+        ])
+
+    def test_events_committed_out_of_id_order_are_delivered_once(self):
+        serving = DatabaseBroker()
+        last_id = Event.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        async def listen():
+            subscription = serving.subscribe([user_channel(1)])
+            try:
+                await asyncio.sleep(0.2)
+                # The row with the higher id commits first, as with two concurrent publishers.
+                await asyncio.to_thread(Event.objects.create, id=last_id + 2, channel=user_channel(1), payload=2)
+                first = await subscription.get(timeout=5)
+                await asyncio.to_thread(Event.objects.create, id=last_id + 1, channel=user_channel(1), payload=1)
+                second = await subscription.get(timeout=5)
+                # Neither is delivered again by later polls.
+                await asyncio.sleep(0.3)
+                return [first, second], subscription.queue.qsize()
+            finally:
+                serving.unsubscribe(subscription)
+
+        self.assertEqual(asyncio.run(listen()), ([2, 1], 0))
+
+    def test_notifications_sent_by_jobs_reach_the_web_process(self):
+        buyer = CustomUser.objects.create_user(username='buyer', email='buyer@example.com')
+        order = Order.objects.create(user=buyer, total_price=Decimal('10.00'))
+        enqueue('notify_order_status', order_id=order.pk, status='shipped')
+        # The worker publishes through its own broker, as runworker would in its process.
+        serving = DatabaseBroker()
+        self.assertIsNot(serving, get_broker())
+
+        async def listen():
+            subscription = serving.subscribe([user_channel(buyer.pk)])
+            try:
+                await asyncio.sleep(0.2)
+                await asyncio.to_thread(Worker(concurrency=1).run, burst=True)
+                return await subscription.get(timeout=5)
+            finally:
+                serving.unsubscribe(subscription)
+
+        event = asyncio.run(listen())
+        self.assertEqual(event['event'], 'notification')
+        self.assertEqual(event['data']['message'], f'Your order #{order.pk} is now shipped.')
+        self.assertFalse(Job.objects.exists())
@@ -1,4 +1,15 @@
-from .models import Notification , CustomUser
+from collections import Counter
+from contextlib import contextmanager
+from itertools import islice
+from string import Formatter
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, QuerySet
+from django.db.models.functions import Greatest
+from django.test.utils import CaptureQueriesContext
+
+from .events import publish_notifications
+from .models import Notification , CustomUser, NotificationCounter
 from django.contrib.auth import get_user_model
 
 # Get the CustomUser model (or default User model)
@@ -24,15 +35,142 @@ def create_notification(user, notification_type, message, related_object_id=None
             raise ValueError(f"User with id {user} does not exist")
 
     # Create the notification with the valid user instance
-    return Notification.objects.create(
+    notification = Notification.objects.create(
         user=user,  # Pass the user instance here
         type=notification_type,
         message=message,
         related_object_id=related_object_id
     )
+    increment_unread_counts({notification.user_id: 1})
+    publish_notifications([notification])
+    return notification
     # create_notification(
     #     user=user_instance,
     #     notification_type='GROUP COMPLETED',
     #     message=f'Group Completed {group_buy_instance.max_participants}',
     #     related_object_id=group_buy_instance.GROUP_BUY_STATUS
-    # )
\ No newline at end of file
+    # )
+
+
+NOTIFICATION_BATCH_SIZE = 1000
+
+
+def increment_unread_counts(counts):
+    """
+    Adds to the unread counters of several users at once.
+
+    `counts` maps user id to the number of new unread notifications. Costs one
+    insert for missing counters plus one UPDATE per distinct increment.
+    """
+    if not counts:
+        return
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id) for user_id in counts], ignore_conflicts=True
+    )
+    by_increment = {}
+    for user_id, count in counts.items():
+        by_increment.setdefault(count, []).append(user_id)
+    for count, user_ids in by_increment.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(unread=F('unread') + count)
+
+
+def decrement_unread_count(user_id, count):
+    if count:
+        NotificationCounter.objects.filter(user_id=user_id).update(unread=Greatest(F('unread') - count, 0))
+
+
+def get_unread_count(user_id):
+    """Reads the maintained counter, initialising it from the (user, is_read) index the first time."""
+    unread = NotificationCounter.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+    if unread is None:
+        unread = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        NotificationCounter.objects.get_or_create(user_id=user_id, defaults={'unread': unread})
+    return unread
+
+
+def bulk_create_notifications(notifications, batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Writes unsaved Notification instances with chunked bulk inserts and
+    bumps the recipients' unread counters. Returns the number written.
+    """
+    notifications = list(notifications)
+    Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    increment_unread_counts(Counter(notification.user_id for notification in notifications if not notification.is_read))
+    publish_notifications(notifications)
+    return len(notifications)
+
+
+def _recipient_id_chunks(recipients, batch_size):
+    if isinstance(recipients, QuerySet):
+        if recipients.model is CustomUser:
+            recipients = recipients.values_list('id', flat=True)
+        recipients = recipients.order_by().iterator(chunk_size=batch_size)
+    iterator = iter(recipients)
+    while True:
+        chunk = [getattr(recipient, 'pk', recipient) for recipient in islice(iterator, batch_size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def notify_users(recipients, notification_type, message_template, related_object_id=None, context=None,
+                 batch_size=NOTIFICATION_BATCH_SIZE):
+    """
+    Sends the same notification to many users with chunked bulk inserts.
+
+    Parameters:
+    - recipients: CustomUser queryset, queryset of user ids (values_list), or any iterable of ids / users.
+    - notification_type: One of Notification.TYPE_CHOICES.
+    - message_template: str.format template rendered with `context`; it may also use {username}.
+    - related_object_id: Optional, related object for the notification (default: None).
+
+    Costs one SELECT and one INSERT per `batch_size` recipients, against two
+    queries per recipient with create_notification(). Unknown user ids are
+    skipped. Returns the number of notifications created.
+    """
+    context = context or {}
+    per_user = 'username' in {field for _, field, _, _ in Formatter().parse(message_template) if field}
+    message = None if per_user else message_template.format(**context)
+
+    created = 0
+    for chunk in _recipient_id_chunks(recipients, batch_size):
+        users = CustomUser.objects.filter(id__in=chunk).values_list('id', 'username')
+        created += bulk_create_notifications(
+            (
+                Notification(
+                    user_id=user_id,
+                    type=notification_type,
+                    message=message if message is not None else message_template.format(username=username, **context),
+                    related_object_id=related_object_id,
+                )
+                for user_id, username in users
+            ),
+            batch_size=batch_size,
+        )
+    return created
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def query_budget(max_queries, using=DEFAULT_DB_ALIAS):
+    """
+    Fails if the wrapped block runs more than `max_queries` database queries.
+
+    Usage:
+        with query_budget(4):
+            client.get('/api/products/')
+
+    Raises QueryBudgetExceeded (an AssertionError) listing the captured SQL,
+    so it can be used directly in tests or around hot code paths.
+    """
+    with CaptureQueriesContext(connections[using]) as context:
+        yield context
+    executed = len(context.captured_queries)
+    if executed > max_queries:
+        statements = '\n'.join(query['sql'] for query in context.captured_queries)
+        raise QueryBudgetExceeded(
+            f"{executed} queries executed, budget was {max_queries}:\n{statements}"
+        )
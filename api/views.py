@@ -1,16 +1,38 @@
+import datetime
+
 from django.contrib.auth import authenticate
+from django.db import transaction
+from django.db.models import Prefetch
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
 
-from .models import CustomUser, Product, Order, GroupBuy, Notification, Review, OrderItem, GroupBuyParticipation
+from .models import CustomUser, Product, Order, GroupBuy, Notification, Review, ProductInventory
+from .cache import TaggedResponseCacheMixin
+from .exports import OrderExporter, ProductExporter, export_response
+from .facets import get_facets
+from .filters import FullTextSearchFilter
+from .imports import READERS, detect_format, import_catalog
+from .pagination import CreatedAtCursorPagination, SearchRankCursorPagination
+from .search import get_search_backend, parse_terms
 from .serializers import UserSerializer, RegistrationSerializer, UserLoginSerializer, ProductSerializer, \
     OrderSerializer, \
-    GroupBuySerializer, NotificationSerializer, ReviewSerializer, UserLoginSerializer, ProductImageSerializer
-from .services import OrderService
+    GroupBuySerializer, NotificationSerializer, ReviewSerializer, UserLoginSerializer, ProductImageSerializer, \
+    AnalyticsSerializer, CartSerializer
+from .services import AnalyticsService, CartService, GroupBuyService, InsufficientStock, OrderService
+from .utils import decrement_unread_count, get_unread_count, notify_users
+
+
+def export_options(request):
+    # `format` is taken by DRF's content negotiation, hence `file_format`.
+    return {
+        'file_format': request.query_params.get('file_format', 'csv'),
+        'compress': request.query_params.get('gzip') in ('1', 'true', 'True'),
+    }
 
 
 class AuthViewSet(viewsets.GenericViewSet):
@@ -92,36 +114,106 @@ def update_user_profile(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(TaggedResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'seller', 'in_stock', 'brand']
     search_fields = ['name', 'description', 'brand']
     ordering_fields = ['price', 'created_at']
 
+    def get_queryset(self):
+        # Load images and inventory (with sizes) up front so serializing a page
+        # costs a fixed number of queries regardless of how many products it holds.
+        return super().get_queryset().prefetch_related(
+            'images',
+            Prefetch('productinventory_set', queryset=ProductInventory.objects.select_related('size')),
+        )
+
+    def get_cache_tags(self):
+        if self.action == 'retrieve':
+            return [f"product:{self.kwargs['pk']}"]
+        params = self.request.query_params
+        tags = [f'{field}:{params[field]}' for field in ('category', 'seller') if params.get(field)]
+        return tags or ['products']
+
     def perform_create(self, serializer):
         serializer.save(seller=self.request.user)
 
+    def add_facets(self, response, queryset):
+        # ?facets=true adds per-facet counts for the whole filtered result set.
+        if self.request.query_params.get('facets') in ('1', 'true', 'True'):
+            facets = get_facets(queryset, category=self.request.query_params.get('category'))
+            if isinstance(response.data, dict):
+                response.data['facets'] = facets
+            else:
+                response.data = {'results': response.data, 'facets': facets}
+        return response
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        return self.add_facets(response, self.filter_queryset(self.get_queryset()))
+
     @action(detail=False, methods=['get'])
     def search(self, request):
         query = request.query_params.get('q', '')
-        products = self.get_queryset().filter(name__icontains=query)
+        if not parse_terms(query):
+            return self.list(request)
+        return self.cached_response(self.ranked_search, request, query)
+
+    def ranked_search(self, request, query):
+        # Ranked results page on the relevance score rather than on created_at.
+        self.pagination_class = SearchRankCursorPagination
+        queryset = self.filter_queryset(self.get_queryset())
+        backend = get_search_backend(queryset.db)
+        products = backend.search(queryset, query)
         page = self.paginate_queryset(products)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-        serializer = self.get_serializer(products, many=True)
-        return Response(serializer.data)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(products, many=True)
+            response = Response(serializer.data)
+        return self.add_facets(response, backend.filter(queryset, query))
 
     @action(detail=False, methods=['post'], permission_classes=[permissions.IsAdminUser])
     def bulk_upload(self, request):
-        serializer = self.get_serializer(data=request.data, many=True)
-        if serializer.is_valid():
-            self.perform_create(serializer)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        """
+        Upserts the user's products by barcode from an uploaded CSV or JSONL
+        `file` (streamed in chunks), or from a JSON list of product objects.
+        Invalid rows are reported per line; the rest are still imported.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            file_format = request.data.get('file_format') or detect_format(upload.name)
+            if file_format not in READERS:
+                return Response({'error': 'Upload a .csv, .jsonl or .ndjson file, or set file_format.'},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rows = READERS[file_format](upload)
+        elif isinstance(request.data, list):
+            rows = ((index, row if isinstance(row, dict) else ValueError('Expected a JSON object'))
+                    for index, row in enumerate(request.data, 1))
+        else:
+            return Response({'error': 'Expected a file upload or a list of products.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(import_catalog(request.user, rows), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[permissions.IsAuthenticated])
+    def export(self, request):
+        """
+        Streams the user's products (every product for staff, optionally
+        ?seller=) with inventory and images as ?file_format=csv|ndjson,
+        gzipped with ?gzip=true. The list filters apply.
+        """
+        products = self.filter_queryset(Product.objects.all())
+        if not request.user.is_staff:
+            products = products.filter(seller=request.user)
+        try:
+            return export_response(ProductExporter(), products, 'products', **export_options(request))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['post'])
     def add_image(self, request, pk=None):
@@ -135,33 +227,27 @@ class ProductViewSet(viewsets.ModelViewSet):
 class OrderViewSet(viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
+    # Orders are cancelled through their status, never deleted.
+    http_method_names = ['get', 'post', 'put', 'patch', 'head', 'options']
 
     def create(self, request, *args, **kwargs):
         """
         Override create method to handle custom order creation logic
         """
-        order_items_data = request.data.get('items')  # Expecting items in the request data
-        if not order_items_data:
-            return Response({'error': 'No items provided'}, status=status.HTTP_400_BAD_REQUEST)
-
-        order = Order.objects.create(user=request.user)  # Create the Order instance
-
-        total_price = 0
-        for item_data in order_items_data:
-            try:
-                product = Product.objects.get(id=item_data['product'])
-            except Product.DoesNotExist:
-                return Response({'error': 'Product not found'}, status=status.HTTP_404_NOT_FOUND)
-
-            item_total = item_data['quantity'] * item_data['price']
-            total_price += item_total
-            OrderItem.objects.create(order=order, product=product, quantity=item_data['quantity'], price=item_data['price'])
-
-        order.total_price = total_price
-        order.save()
+        try:
+            order = OrderService.create_order(request.user, request.data.get('items'))
+        except Product.DoesNotExist as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientStock as exc:
+            return Response({'error': str(exc), 'product': exc.product_id, 'size': exc.size_id},
+                            status=status.HTTP_409_CONFLICT)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        order = self.get_queryset().prefetch_related('items__product__seller').get(pk=order.pk)
         serializer = self.get_serializer(order)
-
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'])
@@ -169,89 +255,254 @@ class OrderViewSet(viewsets.ModelViewSet):
         order = self.get_object()
         new_status = request.data.get('status')
         if new_status:
-            order.status = new_status
-            order.save()
+            try:
+                OrderService.update_order_status(order.pk, new_status)
+            except ValueError as exc:
+                return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             return Response({'status': 'order status updated'}, status=status.HTTP_200_OK)
         return Response({'detail': 'Invalid status value'}, status=status.HTTP_400_BAD_REQUEST)
 
+    def perform_update(self, serializer):
+        # Status changes go through OrderService so cancellations release stock.
+        new_status = serializer.validated_data.pop('status', None)
+        with transaction.atomic():
+            order = serializer.save()
+            if new_status and new_status != order.status:
+                try:
+                    OrderService.update_order_status(order.pk, new_status)
+                except ValueError as exc:
+                    raise ValidationError({'status': str(exc)})
+                order.refresh_from_db(fields=['status', 'updated_at'])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams orders with their lines as ?file_format=csv|ndjson, gzipped
+        with ?gzip=true: the user's own orders, or with ?as=seller the orders
+        (and only the lines) of their products. Staff get every order unless
+        ?as is given.
+        """
+        role = request.query_params.get('as')
+        exporter = OrderExporter()
+        if role == 'seller':
+            orders = OrderService.get_seller_orders(request.user)
+            exporter = OrderExporter(seller=request.user)
+        elif role is None and request.user.is_staff:
+            orders = Order.objects.all()
+        else:
+            orders = Order.objects.filter(user=request.user)
+        try:
+            return export_response(exporter, orders, 'orders', **export_options(request))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['get'])
+    def sold(self, request):
+        """Orders containing the current user's products, newest first."""
+        orders = OrderService.get_seller_orders(request.user).prefetch_related('items__product')
+        page = self.paginate_queryset(orders)
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
+
     @action(detail=False, methods=['get'])
     def search(self, request):
-        query = request.query_params.get('q', '')
-        orders = OrderService.search_orders(request.user, query)
-        return Response(OrderSerializer(orders, many=True).data)
+        """Seller order lookup by order id, tracking number or buyer username/email prefix, best match first."""
+        try:
+            orders = OrderService.search_orders(
+                request.user, request.query_params.get('q', ''), status=request.query_params.get('status') or None
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        self.pagination_class = SearchRankCursorPagination
+        page = self.paginate_queryset(orders.prefetch_related('items__product'))
+        return self.get_paginated_response(self.get_serializer(page, many=True).data)
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        stats = OrderService.get_order_statistics(request.user)
+        """Per-status order counts and revenue; ?as=seller counts orders of the user's products."""
+        params = request.query_params
+        try:
+            stats = OrderService.get_order_statistics(
+                request.user,
+                role=params.get('as', 'buyer'),
+                start_date=datetime.date.fromisoformat(params['start']) if params.get('start') else None,
+                end_date=datetime.date.fromisoformat(params['end']) if params.get('end') else None,
+            )
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(stats)
-class GroupBuyViewSet(viewsets.ModelViewSet):
+
+class GroupBuyViewSet(TaggedResponseCacheMixin, viewsets.ModelViewSet):
     queryset = GroupBuy.objects.all()
     serializer_class = GroupBuySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+
+    def get_cache_tags(self):
+        if self.action == 'retrieve':
+            return [f"group_buy:{self.kwargs['pk']}"]
+        return ['group_buys']
+
     # Fetch a user instance
 
     # Action to allow a user to join a group buy
     @action(detail=True, methods=['post'])
     def join(self, request, pk=None):
         group_buy = self.get_object()
-        user = request.user
-        if group_buy.status != 'ACTIVE':
-            return Response({'error': 'This group buy is not active'}, status=status.HTTP_400_BAD_REQUEST)
-        if group_buy.participants.count() >= group_buy.max_participants:
-            return Response({'error': 'This group buy is full'}, status=status.HTTP_400_BAD_REQUEST)
-        if GroupBuyParticipation.objects.filter(group_buy=group_buy, user=user).exists():
-            return Response({'error': 'You have already joined this group buy'}, status=status.HTTP_400_BAD_REQUEST)
-
-        GroupBuyParticipation.objects.create(group_buy=group_buy, user=user)
+        try:
+            GroupBuyService.join(group_buy.pk, request.user)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'success': 'You have successfully joined the group buy'})
 
     @action(detail=True, methods=['post'])
     def leave(self, request, pk=None):
         group_buy = self.get_object()
-        user = request.user
-        participant = GroupBuyParticipation.objects.filter(group_buy=group_buy, user=user).first()
-        if not participant:
-            return Response({'error': 'You are not part of this group buy'}, status=status.HTTP_400_BAD_REQUEST)
-
-        participant.delete()
+        try:
+            GroupBuyService.leave(group_buy.pk, request.user)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({'success': 'You have successfully left the group buy'})
 
-class ReviewViewSet(viewsets.ModelViewSet):
+class ReviewViewSet(TaggedResponseCacheMixin, viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
+    def get_cache_tags(self):
+        if self.action == 'retrieve':
+            return [f"review:{self.kwargs['pk']}"]
+        return ['reviews']
+
+    def perform_create(self, serializer):
+        review = serializer.save()
+        notify_users([review.product.seller_id], 'REVIEW',
+                     "{username}, {product} received a new {rating}-star review.",
+                     related_object_id=review.product_id,
+                     context={'product': review.product.name, 'rating': review.rating})
+
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = NotificationSerializer
+    pagination_class = CreatedAtCursorPagination
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user)
+        queryset = Notification.objects.filter(user=self.request.user)
+        # ?is_read=false gives the unread inbox, served by the (user, is_read, created_at) index.
+        is_read = self.request.query_params.get('is_read')
+        if is_read in ('true', 'false'):
+            queryset = queryset.filter(is_read=is_read == 'true')
+        return queryset
 
     # Action to mark a specific notification as read
     @action(detail=True, methods=['post'])
     def mark_as_read(self, request, pk=None):
         notification = self.get_object()
-        notification.is_read = True
-        notification.save()
+        with transaction.atomic():
+            if Notification.objects.filter(pk=notification.pk, is_read=False).update(is_read=True):
+                decrement_unread_count(request.user.pk, 1)
         return Response({'status': 'notification marked as read'}, status=status.HTTP_200_OK)
 
     # Action to mark all notifications as read
     @action(detail=False, methods=['post'])
     def mark_all_as_read(self, request):
-        notifications = self.get_queryset().update(is_read=True)
+        with transaction.atomic():
+            notifications = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+            decrement_unread_count(request.user.pk, notifications)
         return Response({'status': f'{notifications} notifications marked as read'}, status=status.HTTP_200_OK)
 
+    # Badge count, read from the maintained per-user counter
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        return Response({'unread_count': get_unread_count(request.user.pk)}, status=status.HTTP_200_OK)
+
 class AnalyticsViewSet(viewsets.ViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
-    # Placeholder for seller analytics data
+    # Seller sales summary, read from the daily sales rollups
     @action(detail=False, methods=['get'])
     def seller_analytics(self, request):
-        # Example logic for analytics (replace with real logic)
-        data = {
-            'total_sales': 10000,
-            'total_orders': 250,
-            'average_order_value': 40.0
-        }
-        return Response(data, status=status.HTTP_200_OK)
\ No newline at end of file
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'detail': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= days <= 366:
+            return Response({'detail': 'days must be between 1 and 366'}, status=status.HTTP_400_BAD_REQUEST)
+        data = AnalyticsService.get_seller_analytics(request.user, days=days)
+        return Response(AnalyticsSerializer(data).data, status=status.HTTP_200_OK)
+
+    # Sales per day/week/month bucket for one or more sellers, read from the daily sales rollups
+    @action(detail=False, methods=['get'])
+    def sales_over_time(self, request):
+        params = request.query_params
+        seller_ids = [request.user.pk]
+        if params.get('sellers'):
+            if not request.user.is_staff:
+                return Response({'detail': 'Only staff can request other sellers.'}, status=status.HTTP_403_FORBIDDEN)
+            seller_ids = [int(value) for value in params['sellers'].split(',') if value.isdigit()][:100]
+        try:
+            start_date = datetime.date.fromisoformat(params['start']) if params.get('start') else None
+            end_date = datetime.date.fromisoformat(params['end']) if params.get('end') else None
+            series = AnalyticsService.get_sales_over_time(
+                seller_ids, interval=params.get('interval', 'day'), start_date=start_date, end_date=end_date
+            )
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            'interval': params.get('interval', 'day'),
+            'series': [{'seller': seller_id, 'buckets': buckets} for seller_id, buckets in series.items()],
+        }, status=status.HTTP_200_OK)
+
+
+class CartViewSet(viewsets.ViewSet):
+    """
+    The current user's cart. Item changes take {"items": [{"product", "size",
+    "quantity"}, ...]} (or the bare list) and answer with the updated cart.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    @staticmethod
+    def _items(request):
+        return request.data if isinstance(request.data, list) else request.data.get('items')
+
+    def _cart(self, request, **extra):
+        return Response({**CartSerializer(CartService.get_cart(request.user)).data, **extra}, status=status.HTTP_200_OK)
+
+    def list(self, request):
+        return self._cart(request)
+
+    # POST adds to the quantities, PATCH sets them (0 removes), DELETE removes the lines
+    @action(detail=False, methods=['post', 'patch', 'delete'])
+    def items(self, request):
+        change = {
+            'POST': CartService.add_items,
+            'PATCH': CartService.update_items,
+            'DELETE': CartService.remove_items,
+        }[request.method]
+        try:
+            change(request.user, self._items(request))
+        except Product.DoesNotExist as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._cart(request)
+
+    # Adds the lines of a cart kept on the client while signed out
+    @action(detail=False, methods=['post'])
+    def merge(self, request):
+        try:
+            skipped = CartService.merge(request.user, self._items(request))
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._cart(request, skipped=skipped)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        try:
+            order = CartService.checkout(request.user)
+        except InsufficientStock as exc:
+            return Response({'error': str(exc), 'product': exc.product_id, 'size': exc.size_id},
+                            status=status.HTTP_409_CONFLICT)
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        order = Order.objects.prefetch_related('items__product').get(pk=order.pk)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
@@ -3,14 +3,21 @@ ASGI config for bee2gther_backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. `uvicorn bee2gther_backend.asgi:application`)
+so /api/notifications/stream/ can hold long-lived connections without tying up
+a worker thread per client.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bee2gther_backend.settings')
+django.setup(set_prefix=False)
+
+from api.streams import StreamingASGIHandler  # noqa: E402
 
-application = get_asgi_application()
+application = StreamingASGIHandler()
@@ -20,11 +20,27 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Media is served by api.media.serve_media. Behind nginx set MEDIA_ACCEL to
+# 'x-accel-redirect' and map MEDIA_ACCEL_REDIRECT_LOCATION to MEDIA_ROOT in an
+# `internal` location; behind Apache with mod_xsendfile use 'x-sendfile'.
+# Django then only checks the request and the front-end server sends the file.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_REDIRECT_LOCATION = '/protected-media/'
+# Browser cache lifetime of media that is not content-addressed (those are cached for a year)
+MEDIA_CACHE_MAX_AGE = 3600
+
 # Maximum size of the entire request body (adjust as needed)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10485760  # 10 MB
 
-# Maximum size of individual file uploads (adjust as needed)
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10485760
+# Uploads larger than this are streamed to a temporary file instead of memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = 262144  # 256 KB
+
+# Uploads are hashed while they are received, so api.storage.ContentAddressedStorage
+# can move them into place without reading them again
+FILE_UPLOAD_HANDLERS = [
+    'api.storage.HashingMemoryFileUploadHandler',
+    'api.storage.HashingTemporaryFileUploadHandler',
+]
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
@@ -123,9 +139,57 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Transactions take the write lock up front and wait for it, instead
+            # of failing with "database is locked" when the web process and the
+            # job worker (runworker) write at the same time.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # A file rather than the in-memory default, so the concurrency tests'
+        # threads each get their own connection to the same database.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Cache
+# Local memory by default; 'django.core.cache.backends.filebased.FileBasedCache'
+# with a LOCATION directory shares the response cache between worker processes.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bee2gther',
+    }
+}
+
+# Pub/sub used by the /api/notifications/stream/ endpoint. The database broker
+# carries events published by any process (web workers, runworker,
+# sweep_group_buys) to the streams of every process, which poll for them every
+# EVENT_POLL_INTERVAL seconds, re-checking the last EVENT_POLL_GRACE seconds for
+# rows that committed late; published events are kept EVENT_RETENTION seconds.
+# 'api.events.InProcessBroker' skips the table but only reaches clients of the
+# publishing process. See api.events.Broker.
+EVENT_BROKER = 'api.events.DatabaseBroker'
+EVENT_POLL_INTERVAL = 1.0
+EVENT_POLL_GRACE = 5
+EVENT_RETENTION = 300
+
+# Threads the generate_image_variants command renders product image thumbnails on.
+IMAGE_VARIANT_WORKERS = 2
+
+# Background jobs (api.jobs), run by `manage.py runworker`: worker threads per
+# process, seconds a claimed job may run before another worker takes it over,
+# and retries, spaced JOB_RETRY_BACKOFF * 2^n seconds apart up to the maximum.
+JOB_WORKER_CONCURRENCY = 2
+JOB_VISIBILITY_TIMEOUT = 300
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 10
+JOB_RETRY_BACKOFF_MAX = 3600
+
+# Seconds /api/orders/statistics/ results may be served from the cache; 0 disables caching.
+ORDER_STATISTICS_CACHE_TIMEOUT = 30
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
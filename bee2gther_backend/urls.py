@@ -1,10 +1,13 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, include, re_path
 from rest_framework.routers import DefaultRouter
 
 
+from api.media import serve_media
+from api.streams import event_stream
 from api.views import UserViewSet, ProductViewSet, ReviewViewSet, GroupBuyViewSet, NotificationViewSet, AuthViewSet, \
-    OrderViewSet
+    OrderViewSet, AnalyticsViewSet, CartViewSet
 
 # Initialize the router and register the viewsets
 router = DefaultRouter()
@@ -15,10 +18,15 @@ router.register(r'group-buys', GroupBuyViewSet)
 router.register(r'reviews', ReviewViewSet)
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'auth', AuthViewSet, basename='auth')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'cart', CartViewSet, basename='cart')
 # Define the URL patterns
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # Must come before the router so 'stream' is not taken as a notification id
+    path('api/notifications/stream/', event_stream, name='notification-stream'),
     path('api/', include(router.urls)),
+    re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.+)$", serve_media, name='media'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),  # Only need to include this once
 
     # Custom user actions